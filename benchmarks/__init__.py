@@ -0,0 +1 @@
+# Offline load/latency benchmarks (see benchmarks/run.py)
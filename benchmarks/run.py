@@ -0,0 +1,361 @@
+"""
+Offline load/latency benchmark for the API.
+
+    python -m benchmarks.run --concurrency 16 --requests 500 --output bench.json
+    python -m benchmarks.run --reseed --users 20 --emails 2000000 --scenarios emails.list,emails.search
+
+Seeds a SQLite database (benchmarks/seed.py) unless one already exists, starts the
+local Scorecard/Perplexity stand-ins (benchmarks/stubs.py) and the app under
+uvicorn, then runs each scenario in turn: --requests requests at --concurrency,
+after a short warm-up. Results are written as JSON, one entry per scenario:
+
+    requests, errors, statuses, throughput_rps, latency_ms {mean, p50, p95, p99, max},
+    db_queries_per_request, db_ms_per_request, upstream_calls
+
+Latency is measured by the client; database and upstream counts are the change
+in the app's /metrics over the measured requests. Compare two commits by
+running both against the same seeded database and diffing the JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+
+from .seed import USER_EMAIL, USER_PASSWORD
+from .stubs import PERPLEXITY_PATH, SCORECARD_PATH
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+OPS_TOKEN = "benchmark-ops-token" # Given to the app so the runner can scrape /metrics
+
+# --- Processes ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _spawn(args: List[str], env: dict, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen([sys.executable, *args], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+async def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}; see its log in the work directory")
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+# --- /metrics parsing ---
+
+_SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+async def _scrape(client: httpx.AsyncClient) -> Dict[Tuple[str, Tuple], float]:
+    """Returns {(metric, sorted label pairs): value} for the samples the report uses."""
+    wanted = ("http_request_db_queries_sum", "http_request_db_seconds_sum", "http_request_db_queries_count", "upstream_requests_total")
+    samples = {}
+    response = await client.get("/metrics", headers={"Authorization": f"Bearer {OPS_TOKEN}"})
+    for line in response.text.splitlines():
+        match = _SAMPLE.match(line)
+        if match and match.group(1) in wanted:
+            labels = tuple(sorted(_LABEL.findall(match.group(2))))
+            samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+async def _settled_scrape(client: httpx.AsyncClient, attempts: int = 20) -> Dict[Tuple[str, Tuple], float]:
+    """
+    Scrapes until two consecutive scrapes agree: the middleware records a request just
+    after its response is sent, so the last few may not be counted on the first try.
+    """
+    samples = await _scrape(client)
+    for _ in range(attempts):
+        await asyncio.sleep(0.05)
+        previous, samples = samples, await _scrape(client)
+        counts = lambda s: {k: v for k, v in s.items() if k[0] == "http_request_db_queries_count" and dict(k[1]).get("route") != "/metrics"}
+        if counts(previous) == counts(samples):
+            break
+    return samples
+
+def _delta(before: dict, after: dict, metric: str, routes: List[Tuple[str, str]]) -> float:
+    total = 0.0
+    for key, value in after.items():
+        name, labels = key
+        if name != metric:
+            continue
+        labels = dict(labels)
+        if routes is not None and (labels.get("method"), labels.get("route")) not in routes:
+            continue
+        total += value - before.get(key, 0.0)
+    return total
+
+# --- Scenarios ---
+# (name, routes whose server-side metrics belong to it, request function)
+# A request function gets the shared client, a prepared user and the request
+# number, and returns the final response of the operation.
+
+def _pick(items: list, n: int):
+    return items[n % len(items)]
+
+async def _job_roundtrip(client, user, n):
+    submitted = await client.post("/ai/jobs", headers=user["headers"], json={
+        "document_id": _pick(user["document_ids"], n), "analysis_type": "qa", "query": f"What is deadline {n}?"
+    })
+    if submitted.status_code != 202:
+        return submitted
+    while True:
+        response = await client.get(submitted.headers["Location"], params={"wait": 30}, headers=user["headers"])
+        if response.status_code != 200 or response.json()["status"] not in ("pending", "processing"):
+            return response
+
+async def _stream_search(client, user, n):
+    async with client.stream("POST", "/search/stream", headers=user["headers"], json={"query": f"data science masters {n}"}) as response:
+        async for _ in response.aiter_lines():
+            pass
+    return response
+
+SCENARIOS: List[Tuple[str, List[Tuple[str, str]], Callable[..., Awaitable[httpx.Response]]]] = [
+    ("auth.token", [("POST", "/auth/token")],
+     lambda c, u, n: c.post("/auth/token", data={"username": u["email"], "password": USER_PASSWORD})),
+    ("auth.users_me", [("GET", "/auth/users/me")],
+     lambda c, u, n: c.get("/auth/users/me", headers=u["headers"])),
+    ("programs.list", [("GET", "/programs/")],
+     lambda c, u, n: c.get("/programs/", params={"limit": 50}, headers=u["headers"])),
+    ("programs.get", [("GET", "/programs/{program_id}")],
+     lambda c, u, n: c.get(f"/programs/{_pick(u['program_ids'], n)}", headers=u["headers"])),
+    ("programs.create", [("POST", "/programs/")],
+     lambda c, u, n: c.post("/programs/", headers=u["headers"], json={"name": f"MSc Benchmark {n}", "university": "Bench University", "country": "UK"})),
+    ("documents.list", [("GET", "/documents/")],
+     lambda c, u, n: c.get("/documents/", params={"limit": 50}, headers=u["headers"])),
+    ("documents.get", [("GET", "/documents/{document_id}")],
+     lambda c, u, n: c.get(f"/documents/{_pick(u['document_ids'], n)}", headers=u["headers"])),
+    ("documents.download", [("GET", "/documents/{document_id}/download")],
+     lambda c, u, n: c.get(f"/documents/{_pick(u['document_ids'], n)}/download", headers=u["headers"])),
+    ("documents.search", [("GET", "/documents/search")],
+     lambda c, u, n: c.get("/documents/search", params={"q": "scholarship deadline"}, headers=u["headers"])),
+    ("documents.upload", [("POST", "/documents/")],
+     lambda c, u, n: c.post("/documents/", headers=u["headers"], data={"description": f"benchmark upload {n}"},
+                            files={"file": (f"upload-{n}.txt", f"Application deadline notes {n}\n".encode() * 200, "text/plain")})),
+    ("emails.list", [("GET", "/emails/")],
+     lambda c, u, n: c.get("/emails/", params={"limit": 50}, headers=u["headers"])),
+    ("emails.list_folder", [("GET", "/emails/")],
+     lambda c, u, n: c.get("/emails/", params={"limit": 50, "folder": "inbox", "is_read": False}, headers=u["headers"])),
+    ("emails.get", [("GET", "/emails/{email_id}")],
+     lambda c, u, n: c.get(f"/emails/{_pick(u['email_ids'], n)}", headers=u["headers"])),
+    ("emails.threads", [("GET", "/emails/threads")],
+     lambda c, u, n: c.get("/emails/threads", params={"limit": 50}, headers=u["headers"])),
+    ("emails.counts", [("GET", "/emails/counts")],
+     lambda c, u, n: c.get("/emails/counts", headers=u["headers"])),
+    ("emails.search", [("GET", "/emails/search")],
+     lambda c, u, n: c.get("/emails/search", params={"q": "visa interview"}, headers=u["headers"])),
+    ("emails.create", [("POST", "/emails/")],
+     lambda c, u, n: c.post("/emails/", headers=u["headers"], json={
+         "sender": "admissions@example.edu", "recipient": u["email"], "subject": f"Benchmark {n}", "body_text": "Offer letter attached"})),
+    ("search.cold", [("POST", "/search/")], # Unique queries: every request reaches both upstreams
+     lambda c, u, n: c.post("/search/", headers=u["headers"], json={"query": f"computer science masters {n}"})),
+    ("search.cached", [("POST", "/search/")],
+     lambda c, u, n: c.post("/search/", headers=u["headers"], json={"query": "computer science masters"})),
+    ("search.stream", [("POST", "/search/stream")], _stream_search),
+    ("ai.analyze_summary", [("POST", "/ai/analyze_document")], # Served from the analysis cache after the first per document
+     lambda c, u, n: c.post("/ai/analyze_document", headers=u["headers"], json={"document_id": _pick(u["document_ids"], n), "analysis_type": "summary"})),
+    ("ai.analyze_qa", [("POST", "/ai/analyze_document")], # Unique questions: retrieval + model call each time
+     lambda c, u, n: c.post("/ai/analyze_document", headers=u["headers"], json={"document_id": _pick(u["document_ids"], n), "analysis_type": "qa", "query": f"When is deadline {n}?"})),
+    ("ai.job_roundtrip", [("POST", "/ai/jobs"), ("GET", "/ai/jobs/{job_id}")], _job_roundtrip),
+]
+
+# --- Load driver ---
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)] # Nearest rank
+
+async def _drive(client, users, request_fn, total: int, concurrency: int, offset: int = 0):
+    latencies, statuses = [], Counter()
+    next_request = offset
+
+    async def worker():
+        nonlocal next_request
+        while next_request < offset + total:
+            n = next_request
+            next_request += 1
+            started = time.perf_counter()
+            try:
+                response = await request_fn(client, _pick(users, n), n)
+                statuses[str(response.status_code)] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+async def run_scenario(client, users, routes, request_fn, args) -> dict:
+    warmup = min(args.warmup, args.requests)
+    if warmup:
+        await _drive(client, users, request_fn, warmup, args.concurrency, offset=10**6)
+    before = await _settled_scrape(client)
+    latencies, statuses, elapsed = await _drive(client, users, request_fn, args.requests, args.concurrency)
+    after = await _settled_scrape(client)
+    latencies.sort()
+    count = len(latencies)
+    errors = sum(n for status, n in statuses.items() if not (status.isdigit() and int(status) < 400))
+    return {
+        "requests": count,
+        "errors": errors,
+        "statuses": dict(statuses),
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+            "p50": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if count else 0.0,
+        },
+        "db_queries_per_request": round(_delta(before, after, "http_request_db_queries_sum", routes) / count, 2) if count else 0.0,
+        "db_ms_per_request": round(_delta(before, after, "http_request_db_seconds_sum", routes) / count * 1000, 3) if count else 0.0,
+        "upstream_calls": int(_delta(before, after, "upstream_requests_total", None)),
+    }
+
+async def _prepare_users(client, count: int) -> List[dict]:
+    """Logs in the seeded users and collects ids for the get/download scenarios."""
+    users = []
+    for n in range(1, count + 1):
+        email = USER_EMAIL.format(n)
+        token = await client.post("/auth/token", data={"username": email, "password": USER_PASSWORD})
+        if token.status_code == 401 and users:
+            break # Database was seeded with fewer users
+        token.raise_for_status()
+        headers = {"Authorization": f"Bearer {token.json()['access_token']}"}
+        ids = {}
+        for key, path in (("program_ids", "/programs/"), ("document_ids", "/documents/"), ("email_ids", "/emails/")):
+            response = await client.get(path, params={"limit": 100}, headers=headers)
+            response.raise_for_status()
+            ids[key] = [item["id"] for item in response.json()]
+            if not ids[key]:
+                raise RuntimeError(f"{email} has no {path} rows; reseed with larger counts")
+        users.append({"email": email, "headers": headers, **ids})
+    return users
+
+def _git_revision() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+async def run(args) -> dict:
+    work_dir = Path(args.work_dir).resolve()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    db_path = work_dir / "bench.db"
+    upload_dir = work_dir / "uploads"
+
+    if args.reseed or not db_path.exists():
+        subprocess.run([
+            sys.executable, "-m", "benchmarks.seed", "--db", str(db_path), "--upload-dir", str(upload_dir),
+            "--users", str(args.users), "--emails", str(args.emails),
+            "--programs-per-user", str(args.programs_per_user), "--documents-per-user", str(args.documents_per_user),
+            "--scorecard-schools", str(args.scorecard_schools),
+        ], cwd=REPO_ROOT, check=True)
+
+    stub_port, app_port = _free_port(), _free_port()
+    stub_url, app_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{app_port}"
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "UPLOAD_DIRECTORY": str(upload_dir),
+        "SCOREBOARD_API_BASE_URL": stub_url + SCORECARD_PATH,
+        "PERPLEXITY_API_URL": stub_url + PERPLEXITY_PATH,
+        "OPS_TOKEN": OPS_TOKEN,
+    }
+    stubs = _spawn(["-m", "benchmarks.stubs", "--port", str(stub_port),
+                    "--scorecard-latency", str(args.scorecard_latency), "--perplexity-latency", str(args.perplexity_latency)],
+                   env, work_dir / "stubs.log")
+    app = _spawn(["-m", "uvicorn", "src.main:app", "--port", str(app_port), "--log-level", "warning", "--no-access-log"],
+                 env, work_dir / "app.log")
+    try:
+        await _wait_ready(stub_url + "/docs", stubs)
+        await _wait_ready(app_url + "/", app)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=args.timeout) as client:
+            users = await _prepare_users(client, min(args.users, args.concurrency))
+            selected = set(args.scenarios.split(",")) if args.scenarios else None
+            results = {}
+            for name, routes, request_fn in SCENARIOS:
+                if selected and name not in selected:
+                    continue
+                results[name] = await run_scenario(client, users, routes, request_fn, args)
+                summary = results[name]
+                print(f"{name:22} {summary['throughput_rps']:9.1f} rps  p50 {summary['latency_ms']['p50']:9.2f} ms  "
+                      f"p99 {summary['latency_ms']['p99']:9.2f} ms  db/req {summary['db_queries_per_request']:6.2f}  errors {summary['errors']}",
+                      file=sys.stderr)
+    finally:
+        for process in (app, stubs):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "scenarios": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--work-dir", default="benchmarks/.work", help="Seeded database, uploads and process logs")
+    parser.add_argument("--reseed", action="store_true", help="Rebuild the database even if it exists")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--emails", type=int, default=100000)
+    parser.add_argument("--programs-per-user", type=int, default=200)
+    parser.add_argument("--documents-per-user", type=int, default=5)
+    parser.add_argument("--scorecard-schools", type=int, default=0, help="Seed a local Scorecard mirror of this size")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each scenario")
+    parser.add_argument("--scenarios", default="", help="Comma-separated scenario names (default: all)")
+    parser.add_argument("--scorecard-latency", type=float, default=0.15)
+    parser.add_argument("--perplexity-latency", type=float, default=1.5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", default="", help="JSON file to write (default: stdout)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
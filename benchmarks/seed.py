@@ -0,0 +1,224 @@
+"""
+Seeds a SQLite database with synthetic users, programs, documents and email,
+and optionally a College Scorecard mirror (--scorecard-schools).
+
+    python -m benchmarks.seed --db benchmarks/.work/bench.db --users 20 --emails 1000000
+
+Everything is generated from --seed, so two runs with the same arguments produce
+the same data. Rows are bulk inserted; derived tables (email threads, folder
+counts, document chunk index) are built with the app's own crud/services code.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+USER_EMAIL = "bench-user-{}@example.com" # 1-based user number
+USER_PASSWORD = "benchmark-password"
+
+WORDS = (
+    "admission application deadline scholarship tuition visa interview transcript reference "
+    "statement purpose research thesis semester intake campus faculty department masters "
+    "bachelor doctorate engineering computer science data machine learning economics finance "
+    "biology chemistry physics mathematics design architecture medicine law business marketing "
+    "offer conditional unconditional deposit accommodation orientation enrollment requirement "
+    "english proficiency ielts toefl gre gmat portfolio recommendation funding stipend assistantship"
+).split()
+FIELDS = ["Computer Science", "Data Science", "Economics", "Mechanical Engineering", "Public Health",
+          "Architecture", "Finance", "Biotechnology", "Law", "Artificial Intelligence"]
+DEGREES = ["MSc", "MA", "MEng", "PhD", "BSc", "MBA"]
+UNIVERSITIES = ["University of Example", "Northfield Institute of Technology", "Lakeside University",
+                "Royal College of Sample Studies", "Techville Polytechnic", "Harbor State University"]
+COUNTRIES = ["USA", "UK", "Canada", "Germany", "Netherlands", "Australia"]
+STATES = ["CA", "NY", "TX", "MA", "IL", "WA", "MI", "PA", "FL", "GA"]
+CIP_FIELDS = {"1107": "Computer Science", "3070": "Data Science", "4506": "Economics", "1419": "Mechanical Engineering",
+              "5122": "Public Health", "0402": "Architecture", "5208": "Finance", "2611": "Biotechnology"}
+FOLDERS = [("inbox", 0.7), ("sent", 0.15), ("archive", 0.1), ("trash", 0.05)]
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+def _paragraphs(rng: random.Random, size_bytes: int) -> str:
+    parts, size = [], 0
+    while size < size_bytes:
+        paragraph = _sentence(rng, rng.randint(40, 120)).capitalize() + "."
+        parts.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(parts)
+
+def seed_users(db, count: int):
+    from src import models, security
+    hashed = security.get_password_hash(USER_PASSWORD) # One bcrypt hash shared by every user
+    db.bulk_insert_mappings(models.User, [
+        {"email": USER_EMAIL.format(n), "hashed_password": hashed} for n in range(1, count + 1)
+    ])
+    db.commit()
+    return [user.id for user in db.query(models.User).order_by(models.User.id)]
+
+def seed_programs(db, rng: random.Random, user_ids, per_user: int):
+    from src import models
+    now = datetime.utcnow()
+    rows = []
+    for owner_id in user_ids:
+        for n in range(per_user):
+            rows.append({
+                "name": f"{rng.choice(DEGREES)} {rng.choice(FIELDS)}",
+                "university": rng.choice(UNIVERSITIES),
+                "country": rng.choice(COUNTRIES),
+                "details": _sentence(rng, 30),
+                "owner_id": owner_id,
+                "created_at": now - timedelta(minutes=n),
+            })
+    db.bulk_insert_mappings(models.Program, rows)
+    db.commit()
+
+def seed_documents(db, rng: random.Random, user_ids, per_user: int, size_kib: int, upload_dir: Path):
+    """Writes text uploads plus their extracted sidecars, and indexes them as extraction would."""
+    from src import models
+    from src.services import extraction_service, retrieval_service
+    for owner_id in user_ids:
+        user_dir = upload_dir / str(owner_id)
+        user_dir.mkdir(parents=True, exist_ok=True)
+        for n in range(per_user):
+            content = _paragraphs(rng, size_kib * 1024).encode("utf-8")
+            file_path = user_dir / f"bench-{n}.txt"
+            file_path.write_bytes(content)
+            text_path = extraction_service.text_path_for(str(file_path))
+            Path(text_path).write_bytes(content)
+            db_document = models.Document(
+                filename=file_path.name,
+                file_path=str(file_path),
+                description=_sentence(rng, 12),
+                owner_id=owner_id,
+                content_type="text/plain",
+                size_bytes=len(content),
+                content_sha256=hashlib.sha256(content).hexdigest(),
+            )
+            db.add(db_document)
+            db.flush()
+            db.add(models.DocumentText(
+                document_id=db_document.id,
+                status="completed",
+                text_path=text_path,
+                char_count=len(content),
+                byte_count=len(content),
+                page_offsets="[0]",
+            ))
+            db.commit()
+            retrieval_service.index_document(db, db_document.id, owner_id, text_path)
+            retrieval_service.index_description(db, db_document.id, owner_id, db_document.description)
+
+def seed_emails(db, rng: random.Random, user_ids, total: int, batch_size: int = 20000):
+    from src import crud, models
+    folders, weights = zip(*FOLDERS)
+    now = datetime.utcnow()
+    table = models.EmailMessage.__table__
+    inserted = 0
+    while inserted < total:
+        rows = []
+        for n in range(inserted, min(total, inserted + batch_size)):
+            owner_id = user_ids[n % len(user_ids)]
+            folder = rng.choices(folders, weights)[0]
+            sent = folder == "sent"
+            at = now - timedelta(seconds=rng.randint(0, 2 * 365 * 24 * 3600))
+            rows.append({
+                "owner_id": owner_id,
+                "message_id": f"<bench-{n}@example.com>",
+                "thread_id": f"bench-thread-{owner_id}-{rng.randint(0, max(1, total // len(user_ids) // 4))}",
+                "sender": USER_EMAIL.format(owner_id) if sent else f"admissions{rng.randint(1, 50)}@example.edu",
+                "recipient": f"admissions{rng.randint(1, 50)}@example.edu" if sent else USER_EMAIL.format(owner_id),
+                "subject": _sentence(rng, rng.randint(3, 8)).capitalize(),
+                "body_text": _sentence(rng, rng.randint(30, 150)),
+                "body_html": None,
+                "received_at": at,
+                "sent_at": at if sent else None,
+                "is_read": rng.random() < 0.6,
+                "is_draft": False,
+                "is_sent_by_user": sent,
+                "folder": folder,
+            })
+        db.execute(table.insert(), rows)
+        db.commit()
+        inserted += len(rows)
+        print(f"  emails: {inserted}/{total}")
+    # Summary tables the email routes read from
+    crud.rebuild_email_threads(db)
+    crud.reconcile_email_folder_counts(db)
+
+def seed_scorecard(db, rng: random.Random, schools: int):
+    """Loads a synthetic Scorecard generation through the importer's own crud functions."""
+    from src import crud, models
+    from src.services import scorecard_service
+    generation = crud.begin_scorecard_import(db, "benchmarks.seed", stale_after_seconds=0)
+    institutions, programs = [], []
+    for n in range(schools):
+        unit_id = 100000 + n
+        institutions.append({
+            "generation": generation, "unit_id": unit_id,
+            "name": f"{rng.choice(UNIVERSITIES).replace('Example', str(n))} {n}",
+            "city": f"City {rng.randint(1, 200)}", "state": rng.choice(STATES), "url": f"www.school{n}.edu",
+            "student_size": rng.randint(200, 50000),
+            "tuition_in_state": rng.randint(5000, 40000), "tuition_out_of_state": rng.randint(10000, 65000),
+        })
+        for cip_code in rng.sample(sorted(CIP_FIELDS), rng.randint(1, 5)):
+            for level in rng.sample([3, 5, 6], rng.randint(1, 3)):
+                programs.append({
+                    "generation": generation, "unit_id": unit_id, "cip_code": cip_code, "cip_title": CIP_FIELDS[cip_code],
+                    "credential_level": level, "credential_title": scorecard_service.CREDENTIAL_LEVELS[level],
+                })
+    crud.insert_scorecard_rows(db, models.ScorecardInstitution, institutions)
+    crud.insert_scorecard_rows(db, models.ScorecardProgram, programs)
+    crud.activate_scorecard_import(db, generation, len(institutions), len(programs))
+    return len(programs)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="benchmarks/.work/bench.db", help="SQLite file to create")
+    parser.add_argument("--upload-dir", default="benchmarks/.work/uploads")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--programs-per-user", type=int, default=200)
+    parser.add_argument("--documents-per-user", type=int, default=5)
+    parser.add_argument("--document-kib", type=int, default=32, help="Approximate size of each document")
+    parser.add_argument("--emails", type=int, default=100000, help="Total email messages across all users")
+    parser.add_argument("--scorecard-schools", type=int, default=0, help="Schools in the local Scorecard mirror (0: empty, the API stub answers)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    db_path = Path(args.db).resolve()
+    upload_dir = Path(args.upload_dir).resolve()
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    for stale in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+        stale.unlink(missing_ok=True)
+    shutil.rmtree(upload_dir, ignore_errors=True)
+
+    # src.database reads the URL at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from src import database, migrations
+
+    started = time.perf_counter()
+    migrations.run_migrations(database.engine)
+    rng = random.Random(args.seed)
+    db = database.SessionLocal()
+    try:
+        user_ids = seed_users(db, args.users)
+        print(f"Seeded {len(user_ids)} users")
+        seed_programs(db, rng, user_ids, args.programs_per_user)
+        print(f"Seeded {len(user_ids) * args.programs_per_user} programs")
+        seed_documents(db, rng, user_ids, args.documents_per_user, args.document_kib, upload_dir)
+        print(f"Seeded {len(user_ids) * args.documents_per_user} documents")
+        seed_emails(db, rng, user_ids, args.emails)
+        print(f"Seeded {args.emails} emails")
+        if args.scorecard_schools:
+            program_count = seed_scorecard(db, rng, args.scorecard_schools)
+            print(f"Seeded {args.scorecard_schools} Scorecard schools with {program_count} programs")
+    finally:
+        db.close()
+    print(f"Seeded {db_path} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
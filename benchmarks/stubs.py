@@ -0,0 +1,97 @@
+"""
+Local stand-ins for the College Scorecard and Perplexity APIs.
+
+    python -m benchmarks.stubs --port 8901 --scorecard-latency 0.15 --perplexity-latency 1.5
+
+Point the app at them with
+    SCOREBOARD_API_BASE_URL=http://127.0.0.1:8901/scorecard/schools.json
+    PERPLEXITY_API_URL=http://127.0.0.1:8901/perplexity/chat/completions
+
+Latencies are seconds per response, with +/- --jitter (a fraction) applied uniformly.
+Response bodies follow the shape search_service parses. Perplexity requests with
+"stream": true get server-sent events: the first delta after a third of the
+latency, the rest of the content spread over the remainder.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+SCORECARD_PATH = "/scorecard/schools.json"
+PERPLEXITY_PATH = "/perplexity/chat/completions"
+STREAM_CHUNK_CHARS = 40 # Roughly a few tokens per server-sent delta
+
+def create_app(scorecard_latency: float, perplexity_latency: float, jitter: float, results: int) -> FastAPI:
+    app = FastAPI()
+
+    async def delay(latency: float):
+        if latency > 0:
+            await asyncio.sleep(latency * random.uniform(1 - jitter, 1 + jitter))
+
+    @app.get(SCORECARD_PATH)
+    async def scorecard(request: Request):
+        await delay(scorecard_latency)
+        name = request.query_params.get("school.name", "Example")
+        return {
+            "metadata": {"total": results, "page": 0, "per_page": results},
+            "results": [{
+                "school.name": f"{name} University {n}",
+                "school.city": "Springfield",
+                "school.state": "IL",
+                "school.school_url": f"www.example{n}.edu",
+                "latest.student.size": 1000 * (n + 1),
+                "latest.cost.tuition.in_state": 10000 + n,
+                "latest.cost.tuition.out_of_state": 30000 + n,
+            } for n in range(results)],
+        }
+
+    @app.post(PERPLEXITY_PATH)
+    async def perplexity(request: Request):
+        payload = await request.json()
+        await delay(perplexity_latency / 3 if payload.get("stream") else perplexity_latency)
+        prompt = payload["messages"][-1]["content"]
+        items = [{
+            "program_name": f"MSc Program {n}",
+            "university_name": f"Stub University {n}",
+            "country": "UK",
+            "url": f"https://stub{n}.example.ac.uk/msc",
+            "description": f"Generated for a prompt of {len(prompt)} characters.",
+            "tuition_fees": "£20,000/year",
+            "intake_dates": ["September 2025"],
+            "visa_support": True,
+        } for n in range(results)]
+        content = "```json\n" + json.dumps(items) + "\n```"
+        if not payload.get("stream"):
+            return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+        async def events():
+            pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+            for index, piece in enumerate(pieces):
+                if index:
+                    await delay(perplexity_latency * 2 / 3 / len(pieces))
+                yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': piece}}]})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--scorecard-latency", type=float, default=0.15)
+    parser.add_argument("--perplexity-latency", type=float, default=1.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--results", type=int, default=5, help="Items returned per upstream response")
+    args = parser.parse_args()
+    app = create_app(args.scorecard_latency, args.perplexity_latency, args.jitter, args.results)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
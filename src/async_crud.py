@@ -0,0 +1,507 @@
+# AsyncSession counterparts of crud.py for async routes and services.
+# Same behaviour and names as the sync functions; the analysis cache, the analysis
+# job queue, the Scorecard mirror searches and the program catalog live only here
+# because only async code uses them.
+
+from sqlalchemy import Float, Integer, String, Text, and_, case, column, delete, exists, false, func, insert, literal, or_, select, text, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+
+from . import models, schemas, security
+from .crud import _fts_match_expression
+
+def _dialect_insert(db: AsyncSession, table):
+    return (sqlite if db.bind.dialect.name == "sqlite" else postgresql).insert(table)
+
+# --- User CRUD ---
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
+    return await db.scalar(select(models.User).where(models.User.id == user_id))
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.User]:
+    return await db.scalar(select(models.User).where(models.User.email == email))
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: str) -> models.User:
+    # Hash with security.get_password_hash_async first; bcrypt must not run on the loop
+    db_user = models.User(email=user.email, hashed_password=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+async def update_user_password(db: AsyncSession, user_id: int, hashed_password: str) -> Optional[models.User]:
+    # Hash with security.get_password_hash_async first, as for create_user
+    db_user = await get_user(db, user_id=user_id)
+    if db_user is None:
+        return None
+    db_user.hashed_password = hashed_password
+    db_user.password_changed_at = datetime.utcnow() # Revokes tokens issued before now
+    await db.commit()
+    await db.refresh(db_user)
+    security.invalidate_principals(email=db_user.email, user_id=db_user.id) # Next request (on this worker) re-reads the user
+    return db_user
+
+# --- Document CRUD ---
+
+async def create_user_document(
+    db: AsyncSession,
+    document: schemas.DocumentCreate,
+    file_path: str,
+    owner_id: int,
+    content_type: Optional[str] = None,
+    size_bytes: Optional[int] = None,
+    content_sha256: Optional[str] = None
+) -> models.Document:
+    db_document = models.Document(
+        filename=document.filename,
+        description=document.description,
+        file_path=file_path,
+        owner_id=owner_id,
+        content_type=content_type,
+        size_bytes=size_bytes,
+        content_sha256=content_sha256
+    )
+    db.add(db_document)
+    await db.commit()
+    await db.refresh(db_document)
+    return db_document
+
+async def get_document(db: AsyncSession, document_id: int, owner_id: int) -> Optional[models.Document]:
+    return await db.scalar(select(models.Document).where(
+        models.Document.id == document_id, models.Document.owner_id == owner_id
+    ))
+
+async def get_document_text(db: AsyncSession, document_id: int) -> Optional[models.DocumentText]:
+    # populate_existing: extraction updates this row from another session while callers poll it
+    return await db.scalar(
+        select(models.DocumentText).where(models.DocumentText.document_id == document_id)
+        .execution_options(populate_existing=True)
+    )
+
+async def set_document_content_hash(db: AsyncSession, document_id: int, content_sha256: str):
+    """Backfills the hash of a document uploaded before hashes were stored."""
+    await db.execute(
+        update(models.Document).where(models.Document.id == document_id).values(content_sha256=content_sha256)
+    )
+    await db.commit()
+
+# --- Analysis result cache ---
+# Results are shared by every document with the same content hash. Entries are
+# never updated in place: a new file or model version simply produces a new key.
+# (crud.delete_document drops a hash's entries when its last document goes.)
+
+async def get_cached_analysis(
+    db: AsyncSession, content_sha256: str, analysis_type: str, query_key: str, model_version: str,
+    touch_after: int = 60
+) -> Optional[models.AnalysisResult]:
+    """Returns the unexpired entry for the key, refreshing last_used_at at most once per touch_after seconds."""
+    now = datetime.utcnow()
+    entry = await db.scalar(select(models.AnalysisResult).where(
+        models.AnalysisResult.content_sha256 == content_sha256,
+        models.AnalysisResult.analysis_type == analysis_type,
+        models.AnalysisResult.query_key == query_key,
+        models.AnalysisResult.model_version == model_version,
+        models.AnalysisResult.expires_at > now
+    ))
+    if entry is not None and (now - entry.last_used_at).total_seconds() > touch_after:
+        entry.last_used_at = now # Coarse LRU clock keeps hot hits read-only
+        await db.commit()
+    return entry
+
+async def store_cached_analysis(
+    db: AsyncSession, content_sha256: str, analysis_type: str, query_key: str, model_version: str,
+    result_json: str, expires_at: datetime
+):
+    now = datetime.utcnow()
+    results = models.AnalysisResult.__table__
+    stmt = _dialect_insert(db, results).values(
+        content_sha256=content_sha256,
+        analysis_type=analysis_type,
+        query_key=query_key,
+        model_version=model_version,
+        result=result_json,
+        size_bytes=len(result_json.encode("utf-8")),
+        created_at=now,
+        last_used_at=now,
+        expires_at=expires_at,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["content_sha256", "analysis_type", "query_key", "model_version"],
+        set_={col: stmt.excluded[col] for col in ("result", "size_bytes", "created_at", "last_used_at", "expires_at")},
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+async def evict_cached_analyses(db: AsyncSession, max_entries: int, max_bytes: int) -> int:
+    """Drops expired entries, then least recently used ones beyond the entry/byte budget. Returns rows removed."""
+    removed = (await db.execute(
+        delete(models.AnalysisResult).where(models.AnalysisResult.expires_at <= datetime.utcnow())
+    )).rowcount
+    removed += (await db.execute(text("""
+        DELETE FROM analysis_results WHERE id IN (
+            SELECT id FROM (
+                SELECT id,
+                       ROW_NUMBER() OVER (ORDER BY last_used_at DESC, id DESC) AS position,
+                       SUM(size_bytes) OVER (ORDER BY last_used_at DESC, id DESC) AS running_bytes
+                FROM analysis_results
+            ) ranked
+            WHERE position > :max_entries OR running_bytes > :max_bytes
+        )
+    """), {"max_entries": max_entries, "max_bytes": max_bytes})).rowcount
+    await db.commit()
+    return removed
+
+# --- Analysis jobs ---
+# analysis_jobs is the durable queue behind POST /ai/jobs (see services/job_service).
+# Claiming is a single UPDATE ... RETURNING, so concurrent workers (tasks or
+# processes) never receive the same job. Limits are checked in the same statement
+# as the write; on PostgreSQL, whose READ COMMITTED statements can both see the
+# old counts, a transaction-scoped advisory lock also serializes the writers
+# (SQLite already runs one writer at a time).
+
+ACTIVE_JOB_STATUSES = ("pending", "processing")
+JOB_SUBMIT_LOCK_KEY = 0x70616C5F6A6F62 # Arbitrary, fixed advisory lock ids ("pal_job", "pal_clm")
+JOB_CLAIM_LOCK_KEY = 0x70616C5F636C6D
+
+async def _job_lock(db: AsyncSession, key: int):
+    """Held until the transaction ends. No-op outside PostgreSQL."""
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": key})
+
+async def count_active_analysis_jobs(db: AsyncSession, owner_id: Optional[int] = None) -> int:
+    query = select(func.count(models.AnalysisJob.id)).where(models.AnalysisJob.status.in_(ACTIVE_JOB_STATUSES))
+    if owner_id is not None:
+        query = query.where(models.AnalysisJob.owner_id == owner_id)
+    return await db.scalar(query)
+
+async def create_analysis_job(
+    db: AsyncSession, owner_id: int, document_id: int, analysis_type: str, query: Optional[str],
+    queue_limit: int, owner_limit: int
+) -> Optional[models.AnalysisJob]:
+    """
+    Queues a job unless there are already queue_limit active jobs, or owner_limit for
+    the owner. The counts and the insert are one statement. None if a limit was hit.
+    """
+    jobs = models.AnalysisJob.__table__
+    await _job_lock(db, JOB_SUBMIT_LOCK_KEY)
+    active = select(func.count()).select_from(jobs).where(jobs.c.status.in_(ACTIVE_JOB_STATUSES))
+    job_id = (await db.execute(
+        insert(jobs).from_select(
+            ["owner_id", "document_id", "analysis_type", "query"],
+            select(
+                literal(owner_id, Integer), literal(document_id, Integer),
+                literal(analysis_type, String), literal(query, Text),
+            ).where(
+                active.scalar_subquery() < queue_limit,
+                active.where(jobs.c.owner_id == owner_id).scalar_subquery() < owner_limit,
+            ),
+        ).returning(jobs.c.id)
+    )).scalar()
+    await db.commit()
+    return await get_analysis_job(db, job_id) if job_id is not None else None
+
+async def get_analysis_job(db: AsyncSession, job_id: int, owner_id: Optional[int] = None) -> Optional[models.AnalysisJob]:
+    query = select(models.AnalysisJob).where(models.AnalysisJob.id == job_id).execution_options(populate_existing=True)
+    if owner_id is not None:
+        query = query.where(models.AnalysisJob.owner_id == owner_id)
+    return await db.scalar(query)
+
+async def claim_analysis_job(db: AsyncSession, lease_seconds: float, per_owner_limit: int) -> Optional[int]:
+    """
+    Marks the oldest due pending job as processing and returns its id, skipping
+    owners that already have per_owner_limit jobs running. None if nothing is claimable.
+    """
+    await _job_lock(db, JOB_CLAIM_LOCK_KEY)
+    now = datetime.utcnow()
+    jobs = models.AnalysisJob.__table__
+    candidate = jobs.alias("candidate")
+    running = jobs.alias("running")
+    owner_running = select(func.count()).where(
+        running.c.owner_id == candidate.c.owner_id,
+        running.c.status == "processing"
+    ).scalar_subquery()
+    next_job = select(candidate.c.id).where(
+        candidate.c.status == "pending",
+        candidate.c.available_at <= now,
+        owner_running < per_owner_limit
+    ).order_by(candidate.c.available_at, candidate.c.id).limit(1).scalar_subquery()
+    job_id = (await db.execute(
+        update(jobs)
+        .where(jobs.c.id == next_job, jobs.c.status == "pending")
+        .values(
+            status="processing",
+            attempts=jobs.c.attempts + 1,
+            started_at=now,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+        )
+        .returning(jobs.c.id)
+    )).scalar()
+    await db.commit()
+    return job_id
+
+async def finish_analysis_job(
+    db: AsyncSession, job_id: int, status: str, result_json: Optional[str] = None,
+    error_message: Optional[str] = None, cached: bool = False
+):
+    await db.execute(update(models.AnalysisJob).where(models.AnalysisJob.id == job_id).values(
+        status=status,
+        result=result_json,
+        error_message=error_message,
+        cached=cached,
+        lease_expires_at=None,
+        finished_at=datetime.utcnow(),
+    ))
+    await db.commit()
+
+async def requeue_analysis_jobs(
+    db: AsyncSession, job_ids: List[int], delay_seconds: float = 0,
+    error_message: Optional[str] = None, refund_attempt: bool = False
+):
+    """Returns processing jobs to the queue, due after delay_seconds. refund_attempt undoes the claim's attempt count."""
+    if not job_ids:
+        return
+    values = {
+        "status": "pending",
+        "available_at": datetime.utcnow() + timedelta(seconds=delay_seconds),
+        "lease_expires_at": None,
+        "error_message": error_message,
+    }
+    if refund_attempt:
+        values["attempts"] = models.AnalysisJob.attempts - 1
+    await db.execute(update(models.AnalysisJob).where(
+        models.AnalysisJob.id.in_(job_ids),
+        models.AnalysisJob.status == "processing"
+    ).values(**values))
+    await db.commit()
+
+async def reclaim_expired_analysis_jobs(db: AsyncSession, max_attempts: int) -> int:
+    """Handles jobs whose worker vanished (lease expired): requeued, or failed once out of attempts."""
+    now = datetime.utcnow()
+    expired = (
+        models.AnalysisJob.status == "processing",
+        models.AnalysisJob.lease_expires_at < now,
+    )
+    failed = (await db.execute(update(models.AnalysisJob).where(
+        *expired, models.AnalysisJob.attempts >= max_attempts
+    ).values(
+        status="failed",
+        error_message="Analysis worker stopped responding",
+        lease_expires_at=None,
+        finished_at=now,
+    ))).rowcount
+    requeued = (await db.execute(update(models.AnalysisJob).where(*expired).values(
+        status="pending",
+        available_at=now,
+        lease_expires_at=None,
+    ))).rowcount
+    await db.commit()
+    return failed + requeued
+
+# --- College Scorecard mirror (searches; bulk imports are in crud.py) ---
+
+async def get_active_scorecard_import(db: AsyncSession) -> Optional[models.ScorecardImport]:
+    return await db.scalar(
+        select(models.ScorecardImport)
+        .where(models.ScorecardImport.status == "active")
+        .order_by(models.ScorecardImport.generation.desc()).limit(1)
+    )
+
+async def get_loading_scorecard_import(db: AsyncSession, started_after: datetime) -> Optional[models.ScorecardImport]:
+    """The import currently loading, ignoring ones older than started_after (abandoned)."""
+    return await db.scalar(select(models.ScorecardImport).where(
+        models.ScorecardImport.status == "loading",
+        models.ScorecardImport.started_at >= started_after,
+    ).limit(1))
+
+async def find_scorecard_cip_codes(db: AsyncSession, generation: int, terms: List[str], limit: int = 100) -> List[str]:
+    """CIP codes whose program title contains every term, best matches first."""
+    if not terms:
+        return []
+    if db.bind.dialect.name == "sqlite":
+        rows = await db.execute(text("""
+            SELECT cip_code FROM scorecard_cip_fts
+            WHERE scorecard_cip_fts MATCH :match AND generation = :generation
+            ORDER BY rank LIMIT :limit
+        """), {"match": _fts_match_expression(" ".join(terms)), "generation": generation, "limit": limit})
+    else:
+        program = models.ScorecardProgram
+        rows = await db.execute(
+            select(program.cip_code).distinct()
+            .where(program.generation == generation, *[program.cip_title.ilike(f"%{term}%") for term in terms])
+            .limit(limit)
+        )
+    return [row[0] for row in rows]
+
+async def search_scorecard_institutions(
+    db: AsyncSession,
+    generation: int,
+    name_terms: List[str],
+    cip_codes: List[str],
+    match_required: bool = False,
+    credential_level: Optional[int] = None,
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    max_tuition: Optional[int] = None,
+    min_student_size: Optional[int] = None,
+    max_student_size: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> List[Tuple[models.ScorecardInstitution, bool]]:
+    """
+    One page of schools in a generation, as (institution, name matched) pairs.
+    With match_required, only schools whose name contains every name term or that offer
+    one of cip_codes are returned; otherwise name matches are just ranked first.
+    credential_level restricts both to schools offering programs at that level.
+    Ordered by name match, then enrollment (largest first).
+    """
+    institution = models.ScorecardInstitution
+    program = models.ScorecardProgram
+
+    name_match = false()
+    has_name_matches = False
+    if name_terms:
+        if db.bind.dialect.name == "sqlite":
+            fts_ids = text(
+                "SELECT rowid FROM scorecard_institutions_fts WHERE scorecard_institutions_fts MATCH :name_match"
+            ).bindparams(name_match=_fts_match_expression(" ".join(name_terms))).columns(column("rowid", Integer))
+            name_match = institution.id.in_(fts_ids)
+        else:
+            name_match = and_(*[institution.name.ilike(f"%{term}%") for term in name_terms])
+        # Without name matches the order is plain enrollment, which walks the
+        # (generation, [state,] student_size) index and stops after one page
+        # instead of sorting every matching school: check for any first
+        has_name_matches = await db.scalar(select(exists().where(institution.generation == generation, name_match)))
+        if not has_name_matches:
+            name_match = false()
+
+    def offers(*conditions):
+        return exists().where(program.generation == generation, program.unit_id == institution.unit_id, *conditions)
+
+    level = [program.credential_level == credential_level] if credential_level is not None else []
+    query = select(institution, name_match).where(institution.generation == generation)
+    if match_required:
+        offers_match = offers(program.cip_code.in_(cip_codes), *level) if cip_codes else false()
+        query = query.where(or_(and_(name_match, offers(*level) if level else true()), offers_match))
+    elif level:
+        query = query.where(offers(*level))
+    if state:
+        query = query.where(institution.state == state)
+    if city:
+        query = query.where(func.lower(institution.city) == city.lower())
+    if max_tuition is not None:
+        query = query.where(institution.tuition_out_of_state <= max_tuition)
+    if min_student_size is not None:
+        query = query.where(institution.student_size >= min_student_size)
+    if max_student_size is not None:
+        query = query.where(institution.student_size <= max_student_size)
+
+    order = [institution.student_size.desc().nulls_last(), institution.id.desc()]
+    if has_name_matches:
+        order.insert(0, case((name_match, 0), else_=1))
+    query = query.order_by(*order).limit(limit).offset(offset)
+    return [(row[0], bool(row[1])) for row in await db.execute(query)]
+
+async def get_scorecard_programs(
+    db: AsyncSession, generation: int, unit_ids: List[int], cip_codes: List[str], credential_level: Optional[int] = None
+) -> Dict[int, List[models.ScorecardProgram]]:
+    """Programs of the given schools matching cip_codes (all codes if empty) and credential_level, by unit_id."""
+    if not unit_ids:
+        return {}
+    program = models.ScorecardProgram
+    query = select(program).where(program.generation == generation, program.unit_id.in_(unit_ids))
+    if cip_codes:
+        query = query.where(program.cip_code.in_(cip_codes))
+    if credential_level is not None:
+        query = query.where(program.credential_level == credential_level)
+    by_unit: Dict[int, List[models.ScorecardProgram]] = {}
+    for db_program in await db.scalars(query.order_by(program.unit_id, program.credential_level, program.cip_title)):
+        by_unit.setdefault(db_program.unit_id, []).append(db_program)
+    return by_unit
+
+# --- Program catalog ---
+
+async def record_catalog_results(db: AsyncSession, source: str, rows: List[dict], query_key: Optional[str] = None) -> List[int]:
+    """
+    Upserts catalog rows by dedup_key (new non-null values win, fetched_at is refreshed)
+    and, with query_key, replaces the stored answer of that query for source. Returns the row ids.
+    """
+    table = models.CatalogProgram.__table__
+    program_ids = []
+    for row in rows:
+        insert_stmt = _dialect_insert(db, table).values(**row)
+        excluded = insert_stmt.excluded
+        merged = {
+            column: func.coalesce(excluded[column], table.c[column])
+            for column in ("country", "country_key", "url", "description", "tuition_fees", "ranking", "intake_dates", "visa_support")
+        }
+        program_ids.append((await db.execute(insert_stmt.on_conflict_do_update(
+            index_elements=["dedup_key"],
+            set_={
+                **merged,
+                "program_name": excluded.program_name,
+                "university_name": excluded.university_name,
+                "degree_level": excluded.degree_level,
+                "source": excluded.source,
+                "fetched_at": excluded.fetched_at,
+            },
+        ).returning(table.c.id))).scalar_one())
+    if query_key is not None:
+        results = models.CatalogQueryResult
+        await db.execute(delete(results).where(results.query_key == query_key, results.source == source))
+        now = datetime.utcnow()
+        db.add_all([
+            results(query_key=query_key, source=source, position=position, program_id=program_id, fetched_at=now)
+            for position, program_id in enumerate(program_ids)
+        ])
+    await db.commit()
+    return program_ids
+
+async def get_catalog_query_results(
+    db: AsyncSession, query_key: str, source: str, fetched_after: datetime
+) -> List[models.CatalogProgram]:
+    """The stored answer of source for query_key, if it was fetched after fetched_after."""
+    results = models.CatalogQueryResult
+    return list(await db.scalars(
+        select(models.CatalogProgram)
+        .join(results, results.program_id == models.CatalogProgram.id)
+        .where(results.query_key == query_key, results.source == source, results.fetched_at >= fetched_after)
+        .order_by(results.position)
+    ))
+
+async def search_catalog_programs(
+    db: AsyncSession,
+    terms: List[str],
+    source: str,
+    fetched_after: datetime,
+    country: Optional[str] = None,
+    degree_level: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> List[models.CatalogProgram]:
+    """
+    Catalog programs from source fetched after fetched_after whose text contains every
+    term, best matches first. country is compared with country_key (normalized);
+    degree_level excludes programs of another or an unknown level.
+    """
+    if not terms:
+        return []
+    program = models.CatalogProgram
+    query = select(program).where(program.source == source, program.fetched_at >= fetched_after)
+    if db.bind.dialect.name == "sqlite":
+        fts = text(
+            "SELECT rowid AS id, rank FROM catalog_programs_fts WHERE catalog_programs_fts MATCH :match"
+        ).bindparams(match=_fts_match_expression(" ".join(terms))).columns(column("id", Integer), column("rank", Float)).subquery("fts")
+        query = query.join(fts, fts.c.id == program.id).order_by(fts.c.rank, program.id)
+    else:
+        # No FTS5 outside SQLite: unranked substring match, most recently fetched first
+        query = query.where(*[
+            or_(program.program_name.ilike(f"%{term}%"), program.university_name.ilike(f"%{term}%"), program.description.ilike(f"%{term}%"))
+            for term in terms
+        ]).order_by(program.fetched_at.desc(), program.id)
+    if country:
+        query = query.where(program.country_key == country)
+    if degree_level is not None:
+        query = query.where(program.degree_level == degree_level)
+    return list(await db.scalars(query.limit(limit).offset(offset)))
@@ -1,6 +1,45 @@
+from sqlalchemy import DateTime, bindparam, case, func, insert, or_, select, text, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from . import models, schemas, security
 from typing import List, Optional # Added Optional
+from datetime import datetime, timedelta
+import base64
+import json
+
+# --- Keyset pagination helpers ---
+# Cursors are opaque to clients: base64url(JSON [sort_value, id]) of the last row on a page.
+# Pages are ordered newest first by (sort column, id), and each page starts with an
+# index seek past the cursor, so page N costs the same as page 1.
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Returns (sort_value, id). Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception as e:
+        raise ValueError("Invalid pagination cursor") from e
+
+def next_cursor(rows: list, sort_attr: str, limit: int) -> Optional[str]:
+    """Cursor for the page after rows, or None if rows was the last page."""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(getattr(last, sort_attr), last.id)
+
+def _keyset_page(query, sort_column, id_column, cursor: Optional[str], skip: int, limit: int):
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(sort_column, id_column) < tuple_(sort_value, row_id))
+    query = query.order_by(sort_column.desc(), id_column.desc())
+    if skip and not cursor: # Legacy offset paging; cursors make it unnecessary
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
 # --- User CRUD ---
 
@@ -10,8 +49,10 @@ def get_user(db: Session, user_id: int):
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = security.get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    # Async callers hash on the security process pool and pass the result in
+    if hashed_password is None:
+        hashed_password = security.get_password_hash(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
@@ -20,8 +61,9 @@ def create_user(db: Session, user: schemas.UserCreate):
 
 # --- Program CRUD ---
 
-def get_programs_by_owner(db: Session, owner_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Program).filter(models.Program.owner_id == owner_id).offset(skip).limit(limit).all()
+def get_programs_by_owner(db: Session, owner_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Program).filter(models.Program.owner_id == owner_id)
+    return _keyset_page(query, models.Program.created_at, models.Program.id, cursor, skip, limit)
 
 def create_user_program(db: Session, program: schemas.ProgramCreate, owner_id: int):
     db_program = models.Program(**program.model_dump(), owner_id=owner_id)
@@ -43,16 +85,28 @@ def delete_program(db: Session, program_id: int, owner_id: int):
 
 # --- Document CRUD ---
 
-def get_documents_by_owner(db: Session, owner_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Document).filter(models.Document.owner_id == owner_id).offset(skip).limit(limit).all()
+def get_documents_by_owner(db: Session, owner_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Document).filter(models.Document.owner_id == owner_id)
+    return _keyset_page(query, models.Document.created_at, models.Document.id, cursor, skip, limit)
 
-def create_user_document(db: Session, document: schemas.DocumentCreate, file_path: str, owner_id: int):
+def create_user_document(
+    db: Session,
+    document: schemas.DocumentCreate,
+    file_path: str,
+    owner_id: int,
+    content_type: Optional[str] = None,
+    size_bytes: Optional[int] = None,
+    content_sha256: Optional[str] = None
+):
     # Ensure description is handled correctly (it's optional in schema)
     db_document = models.Document(
         filename=document.filename,
         description=document.description,
         file_path=file_path,
-        owner_id=owner_id
+        owner_id=owner_id,
+        content_type=content_type,
+        size_bytes=size_bytes,
+        content_sha256=content_sha256
     )
     db.add(db_document)
     db.commit()
@@ -69,11 +123,203 @@ def delete_document(db: Session, document_id: int, owner_id: int):
         # import os
         # if os.path.exists(db_document.file_path):
         #     os.remove(db_document.file_path)
+        db.query(models.DocumentText).filter(models.DocumentText.document_id == document_id).delete(synchronize_session=False)
+        db.query(models.AnalysisJob).filter(models.AnalysisJob.document_id == document_id).delete(synchronize_session=False)
+        delete_document_chunks(db, document_id)
         db.delete(db_document)
+        db.flush()
+        if db_document.content_sha256 and not _content_in_use(db, db_document.content_sha256):
+            delete_cached_analyses(db, db_document.content_sha256) # Last copy of this content is gone
         db.commit()
         return True
     return False
 
+def get_document_text(db: Session, document_id: int) -> Optional[models.DocumentText]:
+    return db.query(models.DocumentText).filter(models.DocumentText.document_id == document_id).first()
+
+def set_document_text(db: Session, document_id: int, status: str, **fields) -> models.DocumentText:
+    """Creates or updates the extraction record for a document (status plus any DocumentText columns)."""
+    db_text = get_document_text(db, document_id)
+    if db_text is None:
+        db_text = models.DocumentText(document_id=document_id)
+        db.add(db_text)
+    db_text.status = status
+    for name, value in fields.items():
+        setattr(db_text, name, value)
+    db.commit()
+    db.refresh(db_text)
+    return db_text
+
+def get_document_ids_by_text_status(db: Session, statuses: List[str]) -> List[int]:
+    rows = db.query(models.DocumentText.document_id).filter(models.DocumentText.status.in_(statuses)).all()
+    return [row.document_id for row in rows]
+
+# --- Document chunk index ---
+# Retrieval chunks and their term postings (see services/retrieval_service).
+
+def replace_document_chunks(db: Session, document_id: int, owner_id: int, chunks: List[dict]) -> int:
+    """
+    Replaces a document's text chunk index in one transaction. Each chunk dict has
+    ordinal, start_byte, end_byte, token_count, terms ({term: frequency}) and optionally
+    embedding / embedding_model. Also records chunk_count on the DocumentText row.
+    """
+    _delete_chunks(db, document_id, text_only=True)
+    _insert_chunks(db, document_id, owner_id, chunks)
+    db.query(models.DocumentText).filter(models.DocumentText.document_id == document_id).update(
+        {models.DocumentText.chunk_count: len(chunks)}, synchronize_session=False
+    )
+    db.commit()
+    return len(chunks)
+
+def replace_description_chunk(db: Session, document_id: int, owner_id: int, chunk: Optional[dict]):
+    """Replaces the indexed description of a document (chunk None: no description)."""
+    _delete_chunks(db, document_id, description_only=True)
+    if chunk is not None:
+        _insert_chunks(db, document_id, owner_id, [dict(chunk, ordinal=models.DocumentChunk.DESCRIPTION_ORDINAL)])
+    db.commit()
+
+def _insert_chunks(db: Session, document_id: int, owner_id: int, chunks: List[dict]):
+    if chunks:
+        db.execute(insert(models.DocumentChunk.__table__), [
+            {
+                "document_id": document_id,
+                "owner_id": owner_id,
+                "ordinal": chunk["ordinal"],
+                "start_byte": chunk["start_byte"],
+                "end_byte": chunk["end_byte"],
+                "token_count": chunk["token_count"],
+                "embedding": chunk.get("embedding"),
+                "embedding_model": chunk.get("embedding_model"),
+            }
+            for chunk in chunks
+        ])
+        chunk_ids = dict(db.query(models.DocumentChunk.ordinal, models.DocumentChunk.id).filter(
+            models.DocumentChunk.document_id == document_id
+        ).all())
+        postings = [
+            {"chunk_id": chunk_ids[chunk["ordinal"]], "term": term, "document_id": document_id,
+             "owner_id": owner_id, "term_frequency": frequency}
+            for chunk in chunks
+            for term, frequency in chunk["terms"].items()
+        ]
+        if postings:
+            db.execute(insert(models.DocumentChunkTerm.__table__), postings)
+
+def _delete_chunks(db: Session, document_id: int, text_only: bool = False, description_only: bool = False):
+    chunks = db.query(models.DocumentChunk.id).filter(models.DocumentChunk.document_id == document_id)
+    if text_only:
+        chunks = chunks.filter(models.DocumentChunk.ordinal != models.DocumentChunk.DESCRIPTION_ORDINAL)
+    elif description_only:
+        chunks = chunks.filter(models.DocumentChunk.ordinal == models.DocumentChunk.DESCRIPTION_ORDINAL)
+    chunk_ids = chunks.scalar_subquery()
+    db.query(models.DocumentChunkTerm).filter(
+        models.DocumentChunkTerm.document_id == document_id,
+        models.DocumentChunkTerm.chunk_id.in_(chunk_ids)
+    ).delete(synchronize_session=False)
+    db.query(models.DocumentChunk).filter(models.DocumentChunk.id.in_(chunk_ids)).delete(synchronize_session=False)
+
+def delete_document_chunks(db: Session, document_id: int):
+    _delete_chunks(db, document_id)
+
+def get_document_chunks(db: Session, document_id: int) -> List[models.DocumentChunk]:
+    """Text chunks of a document, in order (the description chunk excluded)."""
+    return db.query(models.DocumentChunk).filter(
+        models.DocumentChunk.document_id == document_id,
+        models.DocumentChunk.ordinal != models.DocumentChunk.DESCRIPTION_ORDINAL
+    ).order_by(models.DocumentChunk.ordinal).all()
+
+def get_document_chunk_postings(db: Session, document_id: int, terms: List[str]) -> list:
+    """(chunk_id, term, term_frequency) rows of the document for the given terms."""
+    if not terms:
+        return []
+    return db.query(
+        models.DocumentChunkTerm.chunk_id, models.DocumentChunkTerm.term, models.DocumentChunkTerm.term_frequency
+    ).filter(
+        models.DocumentChunkTerm.document_id == document_id,
+        models.DocumentChunkTerm.term.in_(terms)
+    ).all()
+
+def get_owner_chunk_postings(
+    db: Session, owner_id: int, terms: List[str], per_term_limit: int,
+    average_length: float, k1: float, b: float
+) -> list:
+    """
+    (chunk_id, term, term_frequency, document_id, ordinal, token_count) rows across
+    all of the user's documents, i.e. postings with the chunk data BM25 needs. Only
+    the per_term_limit postings of each term with the highest BM25 term weight
+    (k1, b, average_length) are returned, so common terms don't load the whole library.
+    """
+    if not terms:
+        return []
+    terms_table, chunks = models.DocumentChunkTerm, models.DocumentChunk
+    length_norm = 1 - b + b * chunks.token_count / (average_length or 1.0)
+    weight = terms_table.term_frequency * (k1 + 1) / (terms_table.term_frequency + k1 * length_norm)
+    ranked = select(
+        terms_table.chunk_id, terms_table.term, terms_table.term_frequency,
+        chunks.document_id, chunks.ordinal, chunks.token_count,
+        func.row_number().over(partition_by=terms_table.term, order_by=(weight.desc(), terms_table.chunk_id)).label("term_rank"),
+    ).join(
+        chunks, chunks.id == terms_table.chunk_id
+    ).where(
+        terms_table.owner_id == owner_id,
+        terms_table.term.in_(terms)
+    ).subquery()
+    return db.execute(
+        select(ranked.c.chunk_id, ranked.c.term, ranked.c.term_frequency, ranked.c.document_id, ranked.c.ordinal, ranked.c.token_count)
+        .where(ranked.c.term_rank <= per_term_limit)
+    ).all()
+
+def get_owner_term_chunk_counts(db: Session, owner_id: int, terms: List[str]) -> dict:
+    """{term: number of the user's chunks containing it} (BM25 document frequency)."""
+    if not terms:
+        return {}
+    return dict(db.query(models.DocumentChunkTerm.term, func.count()).filter(
+        models.DocumentChunkTerm.owner_id == owner_id,
+        models.DocumentChunkTerm.term.in_(terms)
+    ).group_by(models.DocumentChunkTerm.term).all())
+
+def get_owner_chunk_stats(db: Session, owner_id: int):
+    """(chunk count, average token count) over the user's library, for BM25."""
+    return db.query(func.count(models.DocumentChunk.id), func.avg(models.DocumentChunk.token_count)).filter(
+        models.DocumentChunk.owner_id == owner_id
+    ).one()
+
+def get_chunks_by_ids(db: Session, chunk_ids: List[int]) -> List[models.DocumentChunk]:
+    if not chunk_ids:
+        return []
+    return db.query(models.DocumentChunk).filter(models.DocumentChunk.id.in_(chunk_ids)).all()
+
+def get_documents_by_ids(db: Session, document_ids: List[int], owner_id: int) -> List[models.Document]:
+    if not document_ids:
+        return []
+    return db.query(models.Document).filter(
+        models.Document.id.in_(document_ids), models.Document.owner_id == owner_id
+    ).all()
+
+def get_document_texts(db: Session, document_ids: List[int]) -> List[models.DocumentText]:
+    if not document_ids:
+        return []
+    return db.query(models.DocumentText).filter(models.DocumentText.document_id.in_(document_ids)).all()
+
+def get_unindexed_document_ids(db: Session) -> List[int]:
+    """Documents whose text is extracted but has no chunk index yet."""
+    return [row.document_id for row in db.query(models.DocumentText.document_id).filter(
+        models.DocumentText.status == "completed",
+        models.DocumentText.chunk_count.is_(None)
+    ).all()]
+
+# --- Analysis result cache ---
+# Lookups and stores are in async_crud; deleting the last document with a given
+# content hash drops its cached results here.
+
+def _content_in_use(db: Session, content_sha256: str) -> bool:
+    return db.query(models.Document.id).filter(models.Document.content_sha256 == content_sha256).first() is not None
+
+def delete_cached_analyses(db: Session, content_sha256: str) -> int:
+    return db.query(models.AnalysisResult).filter(
+        models.AnalysisResult.content_sha256 == content_sha256
+    ).delete(synchronize_session=False)
+
 # --- Email Message CRUD ---
 
 def create_email_message(db: Session, email: schemas.EmailMessageCreate, owner_id: int) -> models.EmailMessage:
@@ -84,10 +330,101 @@ def create_email_message(db: Session, email: schemas.EmailMessageCreate, owner_i
         db_email.sent_at = db_email.received_at # Or use a specific sent time if provided
 
     db.add(db_email)
+    db.flush() # Assigns the id used by the thread summary
+    _add_to_threads(db, owner_id, [db_email])
+    _apply_folder_deltas(db, owner_id, _folder_deltas(added=[db_email]))
     db.commit()
     db.refresh(db_email)
     return db_email
 
+def _insert_ignoring_duplicates(db: Session, table):
+    """INSERT that silently skips rows whose unique keys (message_id) already exist."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+def bulk_create_email_messages(
+    db: Session,
+    emails: List[schemas.EmailMessageCreate],
+    owner_id: int,
+    on_duplicate: str = "skip"
+) -> dict:
+    """
+    Inserts a batch of email messages in a single transaction.
+
+    Messages whose message_id already exists are skipped, or with on_duplicate="update"
+    have their is_read/folder state refreshed (only if they belong to the same owner).
+    Returns counts: received, inserted, updated, skipped.
+    """
+    summary = {"received": len(emails), "inserted": 0, "updated": 0, "skipped": 0}
+
+    # Duplicates inside the batch itself: first one wins
+    seen_ids = set()
+    unique_emails = []
+    for email in emails:
+        if email.message_id is not None:
+            if email.message_id in seen_ids:
+                summary["skipped"] += 1
+                continue
+            seen_ids.add(email.message_id)
+        unique_emails.append(email)
+
+    # Duplicates already stored, found with one indexed IN lookup
+    existing = {}
+    if seen_ids:
+        rows = db.query(
+            models.EmailMessage.id, models.EmailMessage.message_id, models.EmailMessage.owner_id,
+            models.EmailMessage.is_read, models.EmailMessage.folder, models.EmailMessage.thread_id
+        ).filter(models.EmailMessage.message_id.in_(seen_ids)).all()
+        existing = {row.message_id: row for row in rows}
+
+    now = datetime.utcnow()
+    new_rows = []
+    status_updates = []
+    for email in unique_emails:
+        row = existing.get(email.message_id) if email.message_id is not None else None
+        if row is None:
+            values = email.model_dump()
+            values.update(owner_id=owner_id, received_at=now)
+            # Same rule as create_email_message
+            values["sent_at"] = now if (email.folder == "sent" or email.is_sent_by_user) else None
+            new_rows.append(values)
+        elif on_duplicate == "update" and row.owner_id == owner_id and (row.is_read != email.is_read or row.folder != email.folder):
+            status_updates.append({"id": row.id, "is_read": email.is_read, "folder": email.folder, "_old": row})
+        else:
+            summary["skipped"] += 1
+
+    if new_rows:
+        stmt = _insert_ignoring_duplicates(db, models.EmailMessage).returning(
+            models.EmailMessage.id, models.EmailMessage.thread_id, models.EmailMessage.is_read,
+            models.EmailMessage.received_at, models.EmailMessage.sender, models.EmailMessage.subject,
+            models.EmailMessage.folder
+        )
+        inserted = db.execute(stmt, new_rows).all()
+        summary["inserted"] = len(inserted)
+        summary["skipped"] += len(new_rows) - len(inserted) # Lost a race with a concurrent insert
+        _add_to_threads(db, owner_id, inserted)
+        _apply_folder_deltas(db, owner_id, _folder_deltas(added=inserted))
+    if status_updates:
+        unread_deltas = {}
+        folder_deltas = {}
+        for change in status_updates:
+            old = change.pop("_old")
+            if old.is_read != change["is_read"]:
+                key = _thread_key(old.thread_id, old.id)
+                unread_deltas[key] = unread_deltas.get(key, 0) + (-1 if change["is_read"] else 1)
+            _folder_move(folder_deltas, old.folder, old.is_read, change["folder"], change["is_read"])
+        db.execute(update(models.EmailMessage), status_updates) # Bulk UPDATE by primary key
+        _adjust_thread_unread(db, owner_id, unread_deltas)
+        _apply_folder_deltas(db, owner_id, folder_deltas)
+        summary["updated"] = len(status_updates)
+
+    db.commit()
+    return summary
+
 def get_email_message(db: Session, email_id: int, owner_id: int) -> Optional[models.EmailMessage]:
     """Retrieves a single email message by its ID for a specific owner."""
     return db.query(models.EmailMessage).filter(
@@ -101,9 +438,10 @@ def get_email_messages_by_owner(
     folder: Optional[str] = None,
     is_read: Optional[bool] = None,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ) -> List[models.EmailMessage]:
-    """Retrieves a list of email messages for a specific owner, with optional filters."""
+    """Retrieves a page of email messages for a specific owner, newest first, with optional filters."""
     query = db.query(models.EmailMessage).filter(models.EmailMessage.owner_id == owner_id)
 
     if folder is not None:
@@ -111,10 +449,81 @@ def get_email_messages_by_owner(
     if is_read is not None:
         query = query.filter(models.EmailMessage.is_read == is_read)
 
-    # Add sorting, e.g., by received date descending
-    query = query.order_by(models.EmailMessage.received_at.desc())
+    # Sorted by received date descending; served from ix_email_messages_owner_(folder_)received
+    return _keyset_page(query, models.EmailMessage.received_at, models.EmailMessage.id, cursor, skip, limit)
+
+HIGHLIGHT_START, HIGHLIGHT_END = "<mark>", "</mark>"
+
+def _fts_match_expression(query_text: str) -> str:
+    """Turns free text into a safe FTS5 query: every word must match, the last one as a prefix."""
+    terms = ['"' + term.replace('"', '""') + '"' for term in query_text.split()]
+    if terms:
+        terms[-1] += "*" # Search-as-you-type
+    return " ".join(terms)
 
-    return query.offset(skip).limit(limit).all()
+def search_email_messages(
+    db: Session,
+    owner_id: int,
+    query_text: str,
+    folder: Optional[str] = None,
+    is_read: Optional[bool] = None,
+    limit: int = 20
+) -> list:
+    """
+    Full-text search over subject, sender and body_text, best matches first.
+    Returns rows with message metadata, a highlighted subject and a body snippet.
+    """
+    match = _fts_match_expression(query_text)
+    if not match:
+        return []
+
+    if db.get_bind().dialect.name != "sqlite":
+        # No FTS5 outside SQLite: unranked substring match, newest first
+        pattern = f"%{query_text}%"
+        query = db.query(models.EmailMessage).filter(
+            models.EmailMessage.owner_id == owner_id,
+            or_(
+                models.EmailMessage.subject.ilike(pattern),
+                models.EmailMessage.sender.ilike(pattern),
+                models.EmailMessage.body_text.ilike(pattern),
+            ),
+        )
+        if folder is not None:
+            query = query.filter(models.EmailMessage.folder == folder)
+        if is_read is not None:
+            query = query.filter(models.EmailMessage.is_read == is_read)
+        return [
+            {
+                "id": m.id, "subject": m.subject, "sender": m.sender, "folder": m.folder,
+                "is_read": m.is_read, "thread_id": m.thread_id, "received_at": m.received_at,
+                "subject_highlight": m.subject, "snippet": (m.body_text or "")[:200], "rank": 0.0,
+            }
+            for m in query.order_by(models.EmailMessage.received_at.desc()).limit(limit).all()
+        ]
+
+    # The owner's token is part of the MATCH, so FTS5 only ranks this mailbox's matches
+    match = f'owner_id : "{int(owner_id)}" AND {{subject sender body_text}} : ({match})'
+    filters = ""
+    params = {"match": match, "owner_id": owner_id, "limit": limit, "hs": HIGHLIGHT_START, "he": HIGHLIGHT_END}
+    if folder is not None:
+        filters += " AND m.folder = :folder"
+        params["folder"] = folder
+    if is_read is not None:
+        filters += " AND m.is_read = :is_read"
+        params["is_read"] = is_read
+    # bm25 column weights: subject > sender > body
+    stmt = text(f"""
+        SELECT m.id, m.subject, m.sender, m.folder, m.is_read, m.thread_id, m.received_at,
+               highlight(email_messages_fts, 0, :hs, :he) AS subject_highlight,
+               snippet(email_messages_fts, -1, :hs, :he, '…', 12) AS snippet,
+               bm25(email_messages_fts, 5.0, 2.0, 1.0, 0.0) AS rank
+        FROM email_messages_fts
+        JOIN email_messages m ON m.id = email_messages_fts.rowid
+        WHERE email_messages_fts MATCH :match AND m.owner_id = :owner_id{filters}
+        ORDER BY rank
+        LIMIT :limit
+    """).columns(received_at=DateTime)
+    return [dict(row._mapping) for row in db.execute(stmt, params)]
 
 def update_email_message_status(
     db: Session,
@@ -128,15 +537,20 @@ def update_email_message_status(
     if not db_email:
         return None
 
+    old_folder, old_is_read = db_email.folder, db_email.is_read
     updated = False
     if is_read is not None and db_email.is_read != is_read:
         db_email.is_read = is_read
+        _adjust_thread_unread(db, owner_id, {_thread_key(db_email.thread_id, db_email.id): -1 if is_read else 1})
         updated = True
     if folder is not None and db_email.folder != folder:
         db_email.folder = folder
         updated = True
 
     if updated:
+        folder_deltas = {}
+        _folder_move(folder_deltas, old_folder, old_is_read, db_email.folder, db_email.is_read)
+        _apply_folder_deltas(db, owner_id, folder_deltas)
         db.commit()
         db.refresh(db_email)
 
@@ -148,7 +562,287 @@ def delete_email_message(db: Session, email_id: int, owner_id: int) -> bool:
     db_email = get_email_message(db, email_id=email_id, owner_id=owner_id)
     if db_email:
         db.delete(db_email)
+        db.flush()
+        _remove_from_thread(db, owner_id, db_email)
+        _apply_folder_deltas(db, owner_id, _folder_deltas(removed=[db_email]))
         db.commit()
         return True
     return False
 
+# --- Email Thread summaries ---
+# email_threads holds one row per conversation, kept current by the email CRUD
+# functions above in the same transaction as the message change. Counter changes
+# are applied as SQL increments / upserts so concurrent writers don't lose updates.
+
+def _thread_key(thread_id: Optional[str], email_id: int) -> str:
+    return thread_id or f"email:{email_id}" # Messages without a thread are their own conversation
+
+def _dialect_insert(db: Session, table):
+    return (sqlite if db.get_bind().dialect.name == "sqlite" else postgresql).insert(table)
+
+def _add_to_threads(db: Session, owner_id: int, emails: list):
+    """Folds newly inserted messages (anything with id/thread_id/is_read/received_at/sender/subject) into their threads."""
+    by_key = {}
+    for email in emails:
+        key = _thread_key(email.thread_id, email.id)
+        agg = by_key.get(key)
+        if agg is None:
+            agg = by_key[key] = {"owner_id": owner_id, "thread_key": key, "message_count": 0, "unread_count": 0, "latest": email}
+        agg["message_count"] += 1
+        agg["unread_count"] += 0 if email.is_read else 1
+        if (email.received_at, email.id) > (agg["latest"].received_at, agg["latest"].id):
+            agg["latest"] = email
+    if not by_key:
+        return
+
+    rows = []
+    for agg in by_key.values():
+        latest = agg.pop("latest")
+        agg.update(last_message_id=latest.id, last_message_at=latest.received_at, last_sender=latest.sender, subject=latest.subject)
+        rows.append(agg)
+
+    threads = models.EmailThread.__table__
+    stmt = _dialect_insert(db, threads)
+    newer = tuple_(stmt.excluded.last_message_at, stmt.excluded.last_message_id) >= tuple_(threads.c.last_message_at, threads.c.last_message_id)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["owner_id", "thread_key"],
+        set_={
+            "message_count": threads.c.message_count + stmt.excluded.message_count,
+            "unread_count": threads.c.unread_count + stmt.excluded.unread_count,
+            **{
+                col: case((newer, stmt.excluded[col]), else_=threads.c[col])
+                for col in ("last_message_id", "last_message_at", "last_sender", "subject")
+            },
+        },
+    )
+    db.execute(stmt, rows)
+
+def _adjust_thread_unread(db: Session, owner_id: int, deltas: dict):
+    """Applies {thread_key: unread delta} for read-state changes."""
+    params = [{"o": owner_id, "k": key, "d": delta} for key, delta in deltas.items() if delta]
+    if not params:
+        return
+    threads = models.EmailThread.__table__
+    db.execute(
+        update(threads)
+        .where(threads.c.owner_id == bindparam("o"), threads.c.thread_key == bindparam("k"))
+        .values(unread_count=threads.c.unread_count + bindparam("d")),
+        params,
+    )
+
+def _remove_from_thread(db: Session, owner_id: int, email: models.EmailMessage):
+    """Call after `email` has been deleted and flushed."""
+    key = _thread_key(email.thread_id, email.id)
+    threads = models.EmailThread.__table__
+    db.execute(
+        update(threads)
+        .where(threads.c.owner_id == owner_id, threads.c.thread_key == key)
+        .values(
+            message_count=threads.c.message_count - 1,
+            unread_count=threads.c.unread_count - (0 if email.is_read else 1),
+        )
+    )
+    thread = db.query(models.EmailThread).filter(
+        models.EmailThread.owner_id == owner_id, models.EmailThread.thread_key == key
+    ).populate_existing().first()
+    if thread is None:
+        return
+    if thread.message_count <= 0:
+        db.delete(thread)
+    elif thread.last_message_id == email.id:
+        # The latest message went away: one indexed read for its predecessor
+        latest = db.query(models.EmailMessage).filter(
+            models.EmailMessage.owner_id == owner_id, models.EmailMessage.thread_id == email.thread_id
+        ).order_by(models.EmailMessage.received_at.desc(), models.EmailMessage.id.desc()).first()
+        if latest is not None:
+            thread.last_message_id = latest.id
+            thread.last_message_at = latest.received_at
+            thread.last_sender = latest.sender
+            thread.subject = latest.subject
+
+def get_email_threads_by_owner(db: Session, owner_id: int, limit: int = 50, cursor: Optional[str] = None) -> List[models.EmailThread]:
+    """Conversations ordered by latest activity, newest first (keyset paginated)."""
+    query = db.query(models.EmailThread).filter(models.EmailThread.owner_id == owner_id)
+    return _keyset_page(query, models.EmailThread.last_message_at, models.EmailThread.id, cursor, 0, limit)
+
+def rebuild_email_threads(db: Session, owner_id: Optional[int] = None):
+    """Recomputes thread summaries from email_messages (all owners, or one). Repair/backfill tool."""
+    delete_query = db.query(models.EmailThread)
+    if owner_id is not None:
+        delete_query = delete_query.filter(models.EmailThread.owner_id == owner_id)
+    delete_query.delete(synchronize_session=False)
+
+    owner_filter = "WHERE owner_id = :owner_id" if owner_id is not None else ""
+    key = "COALESCE(thread_id, 'email:' || CAST(id AS VARCHAR))"
+    db.execute(text(f"""
+        INSERT INTO email_threads (owner_id, thread_key, message_count, unread_count,
+                                   last_message_id, last_message_at, last_sender, subject)
+        SELECT owner_id, thread_key, message_count, unread_count, id, received_at, sender, subject
+        FROM (
+            SELECT owner_id, {key} AS thread_key, id, received_at, sender, subject,
+                   ROW_NUMBER() OVER (PARTITION BY owner_id, {key} ORDER BY received_at DESC, id DESC) AS rn,
+                   COUNT(*) OVER (PARTITION BY owner_id, {key}) AS message_count,
+                   SUM(CASE WHEN is_read THEN 0 ELSE 1 END) OVER (PARTITION BY owner_id, {key}) AS unread_count
+            FROM email_messages
+            {owner_filter}
+        ) ranked
+        WHERE rn = 1
+    """), {"owner_id": owner_id} if owner_id is not None else {})
+    db.commit()
+
+# --- Email Folder counters ---
+# email_folder_counts keeps (total, unread) per owner and folder so badge counts
+# are a primary-key read instead of a COUNT(*) over the mailbox.
+
+def _folder_deltas(added: list = (), removed: list = ()) -> dict:
+    """{folder: [total delta, unread delta]} for messages added/removed."""
+    deltas = {}
+    for sign, emails in ((1, added), (-1, removed)):
+        for email in emails:
+            delta = deltas.setdefault(email.folder, [0, 0])
+            delta[0] += sign
+            delta[1] += 0 if email.is_read else sign
+    return deltas
+
+def _folder_move(deltas: dict, old_folder: str, old_is_read: bool, new_folder: str, new_is_read: bool):
+    """Accumulates the counter change for one message changing folder and/or read state."""
+    old = deltas.setdefault(old_folder, [0, 0])
+    old[0] -= 1
+    old[1] -= 0 if old_is_read else 1
+    new = deltas.setdefault(new_folder, [0, 0])
+    new[0] += 1
+    new[1] += 0 if new_is_read else 1
+
+def _apply_folder_deltas(db: Session, owner_id: int, deltas: dict):
+    rows = [
+        {"owner_id": owner_id, "folder": folder, "total_count": total, "unread_count": unread}
+        for folder, (total, unread) in deltas.items() if total or unread
+    ]
+    if not rows:
+        return
+    counts = models.EmailFolderCount.__table__
+    stmt = _dialect_insert(db, counts)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["owner_id", "folder"],
+        set_={
+            "total_count": counts.c.total_count + stmt.excluded.total_count,
+            "unread_count": counts.c.unread_count + stmt.excluded.unread_count,
+        },
+    )
+    db.execute(stmt, rows)
+
+def get_email_folder_counts(db: Session, owner_id: int) -> List[models.EmailFolderCount]:
+    return db.query(models.EmailFolderCount).filter(
+        models.EmailFolderCount.owner_id == owner_id,
+        models.EmailFolderCount.total_count > 0
+    ).order_by(models.EmailFolderCount.folder).all()
+
+def reconcile_email_folder_counts(db: Session, owner_id: Optional[int] = None):
+    """Rebuilds folder counters from email_messages (all owners, or one). Repair/backfill tool."""
+    delete_query = db.query(models.EmailFolderCount)
+    if owner_id is not None:
+        delete_query = delete_query.filter(models.EmailFolderCount.owner_id == owner_id)
+    delete_query.delete(synchronize_session=False)
+
+    owner_filter = "WHERE owner_id = :owner_id" if owner_id is not None else ""
+    db.execute(text(f"""
+        INSERT INTO email_folder_counts (owner_id, folder, total_count, unread_count)
+        SELECT owner_id, folder, COUNT(*), SUM(CASE WHEN is_read THEN 0 ELSE 1 END)
+        FROM email_messages
+        {owner_filter}
+        GROUP BY owner_id, folder
+    """), {"owner_id": owner_id} if owner_id is not None else {})
+    db.commit()
+
+# --- College Scorecard mirror (bulk import side; searches are in async_crud) ---
+
+def begin_scorecard_import(db: Session, source: str, stale_after_seconds: float) -> Optional[int]:
+    """
+    Registers a new import and returns its generation, or None if another import is
+    already loading. Imports stuck in 'loading' for stale_after_seconds (their process
+    died) are marked failed first, so their rows get purged.
+    """
+    now = datetime.utcnow()
+    imports = models.ScorecardImport
+    db.query(imports).filter(
+        imports.status == "loading",
+        imports.started_at < now - timedelta(seconds=stale_after_seconds)
+    ).update({"status": "failed", "finished_at": now, "error_message": "Abandoned"}, synchronize_session=False)
+    db_import = imports(source=source, status="loading", started_at=now)
+    db.add(db_import)
+    db.commit()
+    # Insert first, then check: of several imports starting together, only the oldest proceeds
+    first = db.query(func.min(imports.generation)).filter(imports.status == "loading").scalar()
+    if first != db_import.generation:
+        db_import.status = "failed"
+        db_import.finished_at = now
+        db_import.error_message = f"Import {first} already in progress"
+        db.commit()
+        return None
+    return db_import.generation
+
+def insert_scorecard_rows(db: Session, model, rows: List[dict]):
+    """Appends one batch of institution or program rows (one short write transaction per batch)."""
+    if rows:
+        db.execute(insert(model.__table__), rows)
+        db.commit()
+
+def activate_scorecard_import(db: Session, generation: int, institution_count: int, program_count: int):
+    """Indexes a fully loaded generation and makes it the active one, superseding the previous, in one transaction."""
+    now = datetime.utcnow()
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("""
+            INSERT INTO scorecard_institutions_fts(rowid, name, city, generation)
+            SELECT id, name, coalesce(city, ''), generation FROM scorecard_institutions WHERE generation = :generation
+        """), {"generation": generation})
+        db.execute(text("""
+            INSERT INTO scorecard_cip_fts(cip_title, cip_code, generation)
+            SELECT min(cip_title), cip_code, generation FROM scorecard_programs
+            WHERE generation = :generation GROUP BY cip_code
+        """), {"generation": generation})
+    imports = models.ScorecardImport
+    db.query(imports).filter(imports.status == "active").update(
+        {"status": "superseded", "finished_at": now}, synchronize_session=False
+    )
+    db.query(imports).filter(imports.generation == generation).update({
+        "status": "active",
+        "institution_count": institution_count,
+        "program_count": program_count,
+        "finished_at": now,
+        "error_message": None,
+    }, synchronize_session=False)
+    db.commit()
+
+def fail_scorecard_import(db: Session, generation: int, error_message: str):
+    db.query(models.ScorecardImport).filter(models.ScorecardImport.generation == generation).update(
+        {"status": "failed", "finished_at": datetime.utcnow(), "error_message": error_message}, synchronize_session=False
+    )
+    db.commit()
+
+def purge_scorecard_generations(db: Session, older_than: datetime, batch_size: int = 5000) -> List[int]:
+    """
+    Deletes the rows of superseded and failed generations that finished before older_than
+    (kept that long so searches that already read the old generation can finish).
+    Deletes in batches so concurrent writers are not blocked for the whole purge.
+    """
+    imports = models.ScorecardImport
+    generations = [row.generation for row in db.query(imports.generation).filter(
+        imports.status.in_(("superseded", "failed")),
+        imports.purged_at.is_(None),
+        imports.finished_at < older_than,
+    )]
+    sqlite_fts = db.get_bind().dialect.name == "sqlite"
+    for generation in generations:
+        for model in (models.ScorecardProgram, models.ScorecardInstitution):
+            while True:
+                batch = db.query(model.id).filter(model.generation == generation).limit(batch_size).subquery()
+                deleted = db.query(model).filter(model.id.in_(select(batch.c.id))).delete(synchronize_session=False)
+                db.commit()
+                if deleted < batch_size:
+                    break
+        if sqlite_fts:
+            db.execute(text("DELETE FROM scorecard_institutions_fts WHERE generation = :generation"), {"generation": generation})
+            db.execute(text("DELETE FROM scorecard_cip_fts WHERE generation = :generation"), {"generation": generation})
+        db.query(imports).filter(imports.generation == generation).update({"purged_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+    return generations
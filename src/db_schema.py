@@ -0,0 +1,109 @@
+# Database DDL helpers run by the migrations in migrations.py (SQLAlchemy models live in
+# models.py; the API's Pydantic schemas in schemas.py)
+
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+def external_content_fts_ddl(table: str, columns: List[str], tokenize: str) -> List[str]:
+    """
+    DDL for an FTS5 index over `columns` of `table` that stores only tokens (external
+    content: the text stays in the table), kept in sync by insert/update/delete triggers.
+    The index is named <table>_fts and its rowids are the table's ids.
+    """
+    fts = f"{table}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {names},
+            content='{table}', content_rowid='id',
+            tokenize='{tokenize}'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values});
+        END""",
+    ]
+
+def drop_fts_ddl(table: str) -> List[str]:
+    """Drops the index made by external_content_fts_ddl for table, and its triggers."""
+    fts = f"{table}_fts"
+    return [f"DROP TRIGGER IF EXISTS {fts}_{suffix}" for suffix in ("ai", "ad", "au")] + [f"DROP TABLE IF EXISTS {fts}"]
+
+# Full-text index over email subject/sender/body (SQLite FTS5, external content).
+# The index stores only tokens; the text stays in email_messages. Triggers keep it
+# in sync for every insert/update/delete, including bulk inserts. owner_id is
+# indexed too, so a search is restricted to one mailbox inside the MATCH
+# (crud.search_email_messages) instead of matching every user's mail first.
+EMAIL_FTS_COLUMNS = ("subject", "sender", "body_text", "owner_id")
+EMAIL_FTS_TOKENIZE = "unicode61 remove_diacritics 2"
+
+def init_email_search_index(engine: Engine, columns=EMAIL_FTS_COLUMNS, replace: bool = False):
+    """Creates the email index over columns; replace first drops one built over other columns."""
+    if engine.dialect.name != "sqlite":
+        return # crud.search_email_messages falls back to ILIKE elsewhere
+    try:
+        with engine.begin() as conn:
+            if replace:
+                for ddl in drop_fts_ddl("email_messages"):
+                    conn.execute(text(ddl))
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'email_messages_fts'")).first()
+            for ddl in external_content_fts_ddl("email_messages", list(columns), EMAIL_FTS_TOKENIZE):
+                conn.execute(text(ddl))
+            if not exists:
+                # Index messages stored before the FTS table existed
+                conn.execute(text("INSERT INTO email_messages_fts(email_messages_fts) VALUES ('rebuild')"))
+    except OperationalError as e:
+        print(f"Email full-text index unavailable (SQLite built without FTS5?): {e}")
+
+# Full-text indexes for the College Scorecard mirror (SQLite FTS5). Unlike the
+# email index these store their own copy of the text and are filled by
+# crud.activate_scorecard_import for a whole generation at once, not by triggers:
+# the mirror is only written by bulk imports. rowid is scorecard_institutions.id;
+# program titles are indexed once per distinct CIP code, not once per school.
+SCORECARD_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS scorecard_institutions_fts USING fts5(
+        name, city, generation UNINDEXED,
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS scorecard_cip_fts USING fts5(
+        cip_title, cip_code UNINDEXED, generation UNINDEXED,
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+]
+
+def init_scorecard_search_index(engine: Engine):
+    if engine.dialect.name != "sqlite":
+        return # async_crud.search_scorecard_institutions falls back to ILIKE elsewhere
+    try:
+        with engine.begin() as conn:
+            for ddl in SCORECARD_FTS_DDL:
+                conn.execute(text(ddl))
+    except OperationalError as e:
+        print(f"Scorecard full-text index unavailable (SQLite built without FTS5?): {e}")
+
+# Full-text index over the program catalog (external content and triggers like the
+# email index: catalog rows are upserted one response at a time)
+CATALOG_FTS_DDL = external_content_fts_ddl(
+    "catalog_programs", ["program_name", "university_name", "country", "description"], "porter unicode61 remove_diacritics 2"
+)
+
+def init_catalog_search_index(engine: Engine):
+    if engine.dialect.name != "sqlite":
+        return # async_crud.search_catalog_programs falls back to ILIKE elsewhere
+    try:
+        with engine.begin() as conn:
+            for ddl in CATALOG_FTS_DDL:
+                conn.execute(text(ddl))
+    except OperationalError as e:
+        print(f"Catalog full-text index unavailable (SQLite built without FTS5?): {e}")
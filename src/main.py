@@ -1,19 +1,62 @@
-from fastapi import FastAPI
+import inspect
+import os
+import secrets
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import all routers
 from .routers import auth, programs, documents, search, ai_assistance, emails
-from .database import engine
-from . import models
+from .database import engine, read_engine
+from . import database, metrics, migrations, security
+from .services import catalog_service, extraction_service, job_service, scorecard_service, search_service
+
+OPS_TOKEN = os.getenv("OPS_TOKEN", "") # Bearer token for /metrics and /db/pool-stats; unset disables both
+
+async def _startup_phase(phase: str, step):
+    """Runs one startup step, reporting its duration (also exported as app_startup_phase_seconds)."""
+    started = time.perf_counter()
+    result = step()
+    if inspect.isawaitable(result):
+        result = await result
+    elapsed = time.perf_counter() - started
+    metrics.STARTUP_SECONDS.set(elapsed, phase)
+    print(f"Startup phase '{phase}' took {elapsed * 1000:.1f} ms")
+    return result
 
-# Create database tables (consider using Alembic for migrations in production)
-# Uncommenting to create missing tables
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Long-lived resources shared by all requests in this worker
+    started = time.perf_counter()
+    await _startup_phase("migrations", lambda: migrations.run_migrations(engine)) # One version read when up to date
+    await _startup_phase("http_client", search_service.startup) # Pooled outbound HTTP client
+    await _startup_phase("extraction", extraction_service.startup) # Resume document text extraction interrupted by a restart
+    await _startup_phase("analysis_jobs", job_service.startup) # Analysis job workers
+    await _startup_phase("scorecard_refresh", scorecard_service.startup) # Background refresh of the local Scorecard data
+    metrics.STARTUP_SECONDS.set(time.perf_counter() - started, "total")
+    try:
+        yield
+    finally:
+        await scorecard_service.shutdown()
+        await job_service.shutdown()
+        await search_service.shutdown()
+        await catalog_service.shutdown() # Finish pending catalog writes
+        security.shutdown_hasher() # Password hashing process pool
+        extraction_service.shutdown()
+        engine.dispose()
+        await database.async_engine.dispose()
+        if read_engine is not engine:
+            read_engine.dispose()
 
 app = FastAPI(
     title="Program Pal Pathfinder API",
     description="API for managing university program applications, documents, and insights.",
     version="0.1.1", # Increment version
+    lifespan=lifespan,
 )
 
 # CORS Middleware
@@ -31,8 +74,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Location"], # Keyset pagination cursor; job URL from POST /ai/jobs
 )
 
+# Outermost, so latency covers CORS handling and the whole streamed body
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Existing stats dicts, exported on each /metrics scrape
+metrics.register_stats("cache", lambda: {
+    **search_service.cache_stats(),
+    security.principal_cache.name: security.principal_cache.stats(),
+}, label="cache")
+metrics.register_stats("password_hasher", security.hasher_stats)
+metrics.register_stats("catalog", catalog_service.stats)
+metrics.register_stats("db_pool", database.pool_stats, label="engine")
+
 # Include Routers
 app.include_router(auth.router)
 app.include_router(programs.router)
@@ -45,4 +101,20 @@ app.include_router(emails.router) # Include the new emails router
 def read_root():
     return {"message": "Welcome to the Program Pal Pathfinder API"}
 
+def require_ops_token(authorization: Optional[str] = Header(None)):
+    """Guards operational endpoints: 404 unless OPS_TOKEN is set, 401 without it as a bearer token."""
+    if not OPS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), OPS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid ops token", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/db/pool-stats", dependencies=[Depends(require_ops_token)])
+def read_db_pool_stats():
+    """Connection pool occupancy and checkout wait counters (primary and read replica)."""
+    return database.pool_stats()
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False, dependencies=[Depends(require_ops_token)])
+def read_metrics():
+    """Request, database, upstream and cache metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
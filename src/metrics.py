@@ -0,0 +1,239 @@
+# Process-local metrics exported in the Prometheus text format at /metrics.
+# Dependency-free and cheap enough to leave on: recording a sample is a dict
+# lookup and a few additions under a per-metric lock. Rendering only happens
+# when /metrics is scraped.
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = "unmatched" # Label for requests no route matched (keeps label cardinality bounded)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            samples = list(self._values.items())
+        lines = self._header()
+        for labels, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value) # First bucket with upper bound >= value; len() means +Inf
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0] # bucket counts, sum, count
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            samples = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items()]
+        lines = self._header()
+        for labels, (counts, total, count) in samples:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {_format_value(total)}")
+            lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+_collectors: List[Callable[[], Iterable[str]]] = []
+
+# --- Metrics ---
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled, by route template and status code.", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Time to handle an HTTP request, including streaming the body.", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+HTTP_DB_QUERIES = Histogram("http_request_db_queries", "Database queries issued while handling one HTTP request.", ("method", "route"), buckets=QUERY_COUNT_BUCKETS)
+HTTP_DB_SECONDS = Histogram("http_request_db_seconds", "Database time spent while handling one HTTP request.", ("method", "route"))
+
+DB_QUERIES = Counter("db_queries_total", "Database statements executed, by dialect.", ("dialect",))
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Database statement execution time, by dialect.", ("dialect",), buckets=DB_QUERY_BUCKETS)
+
+STARTUP_SECONDS = Gauge("app_startup_phase_seconds", "Duration of each startup phase of this worker.", ("phase",))
+
+UPSTREAM_REQUESTS = Counter("upstream_requests_total", "Outbound API calls, by source and outcome.", ("source", "outcome"))
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds", "Outbound API call duration, by source and outcome.", ("source", "outcome"))
+
+# --- Per-request database accounting ---
+# The middleware puts a fresh [queries, seconds] pair in this context variable;
+# threadpool and async sessions run inside the request's context, so their
+# statements are added to it. Work outside a request (job workers) is only counted globally.
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    dialect = conn.dialect.name
+    DB_QUERIES.inc(dialect)
+    DB_QUERY_LATENCY.observe(elapsed, dialect)
+    totals = _request_db.get()
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += elapsed
+
+def instrument_engine(db_engine: Engine):
+    """Times every statement on db_engine (for async engines pass engine.sync_engine)."""
+    event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+
+# --- Outbound calls ---
+
+def observe_upstream(source: str, outcome: str, seconds: float):
+    UPSTREAM_REQUESTS.inc(source, outcome)
+    UPSTREAM_LATENCY.observe(seconds, source, outcome)
+
+# --- Request middleware ---
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status and DB usage per route template.
+    (BaseHTTPMiddleware would buffer streamed responses and add a task per request.)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = "500" # Reported if the app raises before starting a response
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        totals = [0, 0.0]
+        token = _request_db.set(totals)
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _request_db.reset(token)
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE # Set by the router once matched
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, route, status)
+            HTTP_LATENCY.observe(elapsed, method, route)
+            HTTP_DB_QUERIES.observe(totals[0], method, route)
+            HTTP_DB_SECONDS.observe(totals[1], method, route)
+
+# --- Stats collected at scrape time ---
+
+def _metric_name(*parts: str) -> str:
+    return "_".join(part.strip("_") for part in parts if part)
+
+def register_stats(prefix: str, fetch: Callable[[], dict], label: Optional[str] = None):
+    """
+    Exports a stats dict (e.g. cache or pool stats) on every scrape as `<prefix>_<key>` samples.
+    With label set, fetch returns {label value: stats dict} and each entry gets that label.
+    Non-numeric values are skipped.
+    """
+    def collect() -> Iterable[str]:
+        stats = fetch()
+        groups = stats.items() if label else [(None, stats)]
+        series: Dict[str, List[str]] = {}
+        for group, values in groups:
+            labels = _format_labels((label,), (group,)) if label else ""
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = _metric_name(prefix, key)
+                series.setdefault(name, []).append(f"{name}{labels} {_format_value(value)}")
+        for name, samples in series.items():
+            yield f"# TYPE {name} untyped"
+            yield from samples
+    _collectors.append(collect)
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            lines.extend(collect())
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
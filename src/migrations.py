@@ -0,0 +1,445 @@
+# Versioned schema migrations, run once per deploy from the app lifespan.
+#
+# The applied version lives in schema_version, so a worker starting against an
+# up-to-date database does one indexed read and nothing else (no table
+# introspection). Pending migrations run in order under a cross-process lock,
+# so several workers booting together apply each one exactly once.
+#
+# To change the schema: update models.py, then append a migration below with the
+# next version number (and a frozen copy of any table it creates). Never edit or
+# renumber a migration that has shipped.
+
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, ForeignKey, Index, Integer, LargeBinary, MetaData, PrimaryKeyConstraint, String, Table,
+    Text, UniqueConstraint, func, inspect, select, text,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from . import crud, db_schema
+
+try:
+    import fcntl # POSIX only; elsewhere SQLite migrations run unlocked (single-process dev servers)
+except ImportError:
+    fcntl = None
+
+POSTGRES_LOCK_KEY = 0x70616C5F6D6967 # Arbitrary, fixed advisory lock id ("pal_mig")
+
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version", version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# --- Frozen table definitions ---
+# Each table as the migration that created it left it; later changes are separate
+# migrations (ALTER TABLE / CREATE INDEX). These never follow models.py, so a
+# migration does the same thing on every database, whenever it runs.
+frozen_metadata = MetaData()
+
+# Migration 1: the schema before versioning (what create_all made at import)
+users_v1 = Table(
+    "users", frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True, index=True, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("created_at", DateTime),
+)
+programs_v1 = Table(
+    "programs", frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, index=True, nullable=False),
+    Column("university", String, index=True),
+    Column("country", String, index=True),
+    Column("details", String),
+    Column("owner_id", Integer, ForeignKey("users.id")),
+    Column("created_at", DateTime),
+)
+documents_v1 = Table(
+    "documents", frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("filename", String, index=True, nullable=False),
+    Column("file_path", String, nullable=False),
+    Column("description", String),
+    Column("owner_id", Integer, ForeignKey("users.id")),
+    Column("created_at", DateTime),
+)
+email_messages_v1 = Table(
+    "email_messages", frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("owner_id", Integer, ForeignKey("users.id")),
+    Column("message_id", String, unique=True, index=True, nullable=True),
+    Column("thread_id", String, index=True, nullable=True),
+    Column("sender", String, nullable=False),
+    Column("recipient", String, nullable=False),
+    Column("subject", String),
+    Column("body_text", Text),
+    Column("body_html", Text),
+    Column("received_at", DateTime, index=True),
+    Column("sent_at", DateTime, nullable=True, index=True),
+    Column("is_read", Boolean),
+    Column("is_draft", Boolean),
+    Column("is_sent_by_user", Boolean),
+    Column("folder", String),
+)
+
+# Migration 4
+email_threads_v4 = Table(
+    "email_threads", frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("owner_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("thread_key", String, nullable=False),
+    Column("message_count", Integer, nullable=False),
+    Column("unread_count", Integer, nullable=False),
+    Column("last_message_id", Integer),
+    Column("last_message_at", DateTime),
+    Column("last_sender", String),
+    Column("subject", String),
+    UniqueConstraint("owner_id", "thread_key", name="uq_email_threads_owner_key"),
+    Index("ix_email_threads_owner_last", "owner_id", "last_message_at", "id"),
+)
+
+# Migration 5
+email_folder_counts_v5 = Table(
+    "email_folder_counts", frozen_metadata,
+    Column("owner_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("folder", String, primary_key=True),
+    Column("total_count", Integer, nullable=False),
+    Column("unread_count", Integer, nullable=False),
+)
+
+# Migration 7
+document_texts_v7 = Table(
+    "document_texts", frozen_metadata,
+    Column("document_id", Integer, ForeignKey("documents.id"), primary_key=True),
+    Column("status", String, nullable=False),
+    Column("text_path", String, nullable=True),
+    Column("char_count", Integer, nullable=True),
+    Column("byte_count", Integer, nullable=True),
+    Column("page_offsets", Text, nullable=True),
+    Column("error_message", String, nullable=True),
+    Column("updated_at", DateTime),
+)
+
+# Migration 8
+analysis_results_v8 = Table(
+    "analysis_results", frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("content_sha256", String(64), nullable=False),
+    Column("analysis_type", String, nullable=False),
+    Column("query_key", String, nullable=False),
+    Column("model_version", String, nullable=False),
+    Column("result", Text, nullable=False),
+    Column("size_bytes", Integer, nullable=False),
+    Column("created_at", DateTime),
+    Column("last_used_at", DateTime),
+    Column("expires_at", DateTime, nullable=False),
+    UniqueConstraint("content_sha256", "analysis_type", "query_key", "model_version", name="uq_analysis_results_key"),
+    Index("ix_analysis_results_last_used", "last_used_at"),
+    Index("ix_analysis_results_expires", "expires_at"),
+)
+
+# Migration 9
+analysis_jobs_v9 = Table(
+    "analysis_jobs", frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("owner_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("document_id", Integer, ForeignKey("documents.id"), nullable=False),
+    Column("analysis_type", String, nullable=False),
+    Column("query", Text, nullable=True),
+    Column("status", String, nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("available_at", DateTime, nullable=False),
+    Column("lease_expires_at", DateTime, nullable=True),
+    Column("result", Text, nullable=True),
+    Column("cached", Boolean, nullable=False),
+    Column("error_message", Text, nullable=True),
+    Column("created_at", DateTime),
+    Column("started_at", DateTime, nullable=True),
+    Column("finished_at", DateTime, nullable=True),
+    Index("ix_analysis_jobs_status_available", "status", "available_at", "id"),
+    Index("ix_analysis_jobs_owner_status", "owner_id", "status"),
+    Index("ix_analysis_jobs_document", "document_id"),
+)
+
+# Migration 10
+document_chunks_v10 = Table(
+    "document_chunks", frozen_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("document_id", Integer, ForeignKey("documents.id"), nullable=False),
+    Column("owner_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("ordinal", Integer, nullable=False),
+    Column("start_byte", Integer, nullable=False),
+    Column("end_byte", Integer, nullable=False),
+    Column("token_count", Integer, nullable=False),
+    Column("embedding", LargeBinary, nullable=True),
+    Column("embedding_model", String, nullable=True),
+    Index("ix_document_chunks_document_ordinal", "document_id", "ordinal"),
+)
+document_chunk_terms_v10 = Table(
+    "document_chunk_terms", frozen_metadata,
+    Column("chunk_id", Integer, ForeignKey("document_chunks.id"), nullable=False),
+    Column("term", String, nullable=False),
+    Column("document_id", Integer, nullable=False),
+    Column("owner_id", Integer, nullable=False),
+    Column("term_frequency", Integer, nullable=False),
+    PrimaryKeyConstraint("chunk_id", "term"),
+    Index("ix_document_chunk_terms_document_term", "document_id", "term"),
+    Index("ix_document_chunk_terms_owner_term", "owner_id", "term"),
+)
+
+# Migration 12
+scorecard_imports_v12 = Table(
+    "scorecard_imports", frozen_metadata,
+    Column("generation", Integer, primary_key=True, index=True),
+    Column("source", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("institution_count", Integer, nullable=False),
+    Column("program_count", Integer, nullable=False),
+    Column("started_at", DateTime, nullable=False),
+    Column("finished_at", DateTime, nullable=True),
+    Column("purged_at", DateTime, nullable=True),
+    Column("error_message", Text, nullable=True),
+    Index("ix_scorecard_imports_status", "status", "generation"),
+)
+scorecard_institutions_v12 = Table(
+    "scorecard_institutions", frozen_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("generation", Integer, nullable=False),
+    Column("unit_id", Integer, nullable=False),
+    Column("name", String, nullable=False),
+    Column("city", String),
+    Column("state", String),
+    Column("url", String),
+    Column("student_size", Integer),
+    Column("tuition_in_state", Integer),
+    Column("tuition_out_of_state", Integer),
+    UniqueConstraint("generation", "unit_id", name="uq_scorecard_institutions_generation_unit"),
+    Index("ix_scorecard_institutions_generation_state", "generation", "state", "student_size"),
+    Index("ix_scorecard_institutions_generation_size", "generation", "student_size"),
+)
+scorecard_programs_v12 = Table(
+    "scorecard_programs", frozen_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("generation", Integer, nullable=False),
+    Column("unit_id", Integer, nullable=False),
+    Column("cip_code", String, nullable=False),
+    Column("cip_title", String, nullable=False),
+    Column("credential_level", Integer),
+    Column("credential_title", String),
+    Index("ix_scorecard_programs_generation_cip", "generation", "cip_code", "unit_id"),
+    Index("ix_scorecard_programs_generation_unit", "generation", "unit_id"),
+)
+
+# Migration 13
+catalog_programs_v13 = Table(
+    "catalog_programs", frozen_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("dedup_key", String, nullable=False, unique=True),
+    Column("program_name", String, nullable=False),
+    Column("university_name", String, nullable=False),
+    Column("country", String),
+    Column("country_key", String),
+    Column("url", String),
+    Column("description", Text),
+    Column("tuition_fees", String),
+    Column("ranking", String),
+    Column("intake_dates", Text),
+    Column("visa_support", Boolean),
+    Column("source", String, nullable=False),
+    Column("first_seen_at", DateTime, nullable=False),
+    Column("fetched_at", DateTime, nullable=False),
+    Index("ix_catalog_programs_source_fetched", "source", "fetched_at"),
+    Index("ix_catalog_programs_country_university", "country_key", "university_name"),
+    Index("ix_catalog_programs_university", "university_name"),
+)
+catalog_query_results_v13 = Table(
+    "catalog_query_results", frozen_metadata,
+    Column("query_key", String, nullable=False),
+    Column("source", String, nullable=False),
+    Column("position", Integer, nullable=False),
+    Column("program_id", Integer, ForeignKey("catalog_programs.id", ondelete="CASCADE"), nullable=False),
+    Column("fetched_at", DateTime, nullable=False),
+    PrimaryKeyConstraint("query_key", "source", "position"),
+)
+
+# --- DDL helpers ---
+# DDL is not transactional on every backend, so each step is safe to re-run
+# (checkfirst, IF NOT EXISTS) in case a deploy dies halfway through a migration.
+# That also lets databases made by create_all before versioning, which may already
+# have some of these tables, go through every migration.
+
+def _create_tables(engine: Engine, *tables: Table) -> List[str]:
+    """Creates the missing tables (with their indexes); returns the names of those it created."""
+    missing = [table for table in tables if not inspect(engine).has_table(table.name)]
+    frozen_metadata.create_all(bind=engine, tables=list(tables)) # checkfirst
+    return [table.name for table in missing]
+
+def _add_column(engine: Engine, table: str, column: Column):
+    if column.name in {existing["name"] for existing in inspect(engine).get_columns(table)}:
+        return
+    column_type = column.type.compile(dialect=engine.dialect)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+
+def _create_index(engine: Engine, name: str, table: str, *columns: str):
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+# --- Migrations ---
+# Each one gets the engine and must leave the schema at its version. Only use the
+# frozen tables and the helpers above (never models.py), and never edit one that
+# has shipped: append a new migration instead.
+
+def _baseline(engine: Engine):
+    # The schema before versioning; a no-op on databases created by create_all back then
+    _create_tables(engine, users_v1, programs_v1, documents_v1, email_messages_v1)
+
+def _keyset_pagination(engine: Engine):
+    _create_index(engine, "ix_programs_owner_created", "programs", "owner_id", "created_at", "id")
+    _create_index(engine, "ix_documents_owner_created", "documents", "owner_id", "created_at", "id")
+    _create_index(engine, "ix_email_messages_owner_folder_received", "email_messages", "owner_id", "folder", "received_at", "id")
+    _create_index(engine, "ix_email_messages_owner_received", "email_messages", "owner_id", "received_at", "id")
+
+def _email_search(engine: Engine):
+    # Indexes existing mail when first created
+    db_schema.init_email_search_index(engine, columns=("subject", "sender", "body_text"))
+
+def _email_threads(engine: Engine):
+    _create_index(engine, "ix_email_messages_owner_thread_received", "email_messages", "owner_id", "thread_id", "received_at", "id")
+    if _create_tables(engine, email_threads_v4):
+        with Session(bind=engine) as db:
+            crud.rebuild_email_threads(db) # Summaries of mail stored before the table existed
+
+def _email_folder_counts(engine: Engine):
+    if _create_tables(engine, email_folder_counts_v5):
+        with Session(bind=engine) as db:
+            crud.reconcile_email_folder_counts(db)
+
+def _document_upload_metadata(engine: Engine):
+    _add_column(engine, "documents", Column("content_type", String))
+    _add_column(engine, "documents", Column("size_bytes", Integer))
+    _add_column(engine, "documents", Column("content_sha256", String(64)))
+    _create_index(engine, "ix_documents_content_sha256", "documents", "content_sha256")
+
+def _document_texts(engine: Engine):
+    _create_tables(engine, document_texts_v7)
+
+def _analysis_results(engine: Engine):
+    _create_tables(engine, analysis_results_v8)
+
+def _analysis_jobs(engine: Engine):
+    _create_tables(engine, analysis_jobs_v9)
+
+def _document_chunks(engine: Engine):
+    _add_column(engine, "document_texts", Column("chunk_count", Integer))
+    _create_tables(engine, document_chunks_v10, document_chunk_terms_v10)
+
+def _document_chunks_owner_index(engine: Engine):
+    _create_index(engine, "ix_document_chunks_owner", "document_chunks", "owner_id")
+
+def _scorecard_mirror(engine: Engine):
+    # Tables for the local College Scorecard copy, plus their full-text indexes
+    _create_tables(engine, scorecard_imports_v12, scorecard_institutions_v12, scorecard_programs_v12)
+    db_schema.init_scorecard_search_index(engine)
+
+def _program_catalog(engine: Engine):
+    # Catalog of past upstream search results, with its full-text index
+    _create_tables(engine, catalog_programs_v13, catalog_query_results_v13)
+    db_schema.init_catalog_search_index(engine)
+
+def _email_search_by_owner(engine: Engine):
+    # Rebuilt with owner_id as an indexed column, so searches filter by mailbox inside the MATCH
+    db_schema.init_email_search_index(engine, columns=("subject", "sender", "body_text", "owner_id"), replace=True)
+
+def _user_password_changed_at(engine: Engine):
+    _add_column(engine, "users", Column("password_changed_at", DateTime))
+
+def _catalog_degree_level(engine: Engine):
+    # Rows stored before this stay NULL (unknown level) until an upstream returns them again
+    _add_column(engine, "catalog_programs", Column("degree_level", Integer))
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Engine], None]]] = [
+    (1, "baseline", _baseline),
+    (2, "keyset_pagination", _keyset_pagination),
+    (3, "email_search", _email_search),
+    (4, "email_threads", _email_threads),
+    (5, "email_folder_counts", _email_folder_counts),
+    (6, "document_upload_metadata", _document_upload_metadata),
+    (7, "document_texts", _document_texts),
+    (8, "analysis_results", _analysis_results),
+    (9, "analysis_jobs", _analysis_jobs),
+    (10, "document_chunks", _document_chunks),
+    (11, "document_chunks_owner_index", _document_chunks_owner_index),
+    (12, "scorecard_mirror", _scorecard_mirror),
+    (13, "program_catalog", _program_catalog),
+    (14, "email_search_by_owner", _email_search_by_owner),
+    (15, "user_password_changed_at", _user_password_changed_at),
+    (16, "catalog_degree_level", _catalog_degree_level),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version(engine: Engine) -> int:
+    """Highest applied version, 0 for a database that has never been migrated."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return 0 # No schema_version table yet
+
+@contextmanager
+def _migration_lock(engine: Engine):
+    """Serializes migrations across worker processes sharing the database."""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": POSTGRES_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": POSTGRES_LOCK_KEY})
+        return
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or fcntl is None or database in (None, "", ":memory:"):
+        yield
+        return
+    # SQLite: a lock file next to the database. (Holding SQLite's own write lock
+    # would make the other workers fail with "database is locked" on long backfills.)
+    with open(Path(database).with_name(Path(database).name + ".migrate.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def run_migrations(engine: Engine) -> dict:
+    """Applies pending migrations. Returns {"from_version", "to_version", "applied": [{version, name, seconds}]}."""
+    version = current_version(engine)
+    if version >= LATEST_VERSION:
+        return {"from_version": version, "to_version": version, "applied": []} # Fast path: one read
+
+    applied = []
+    with _migration_lock(engine):
+        version_metadata.create_all(bind=engine)
+        version = current_version(engine) # Another worker may have migrated while we waited
+        start_version = version
+        for number, name, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            started = time.perf_counter()
+            migrate(engine)
+            with engine.begin() as conn:
+                conn.execute(schema_version.insert().values(version=number, name=name, applied_at=datetime.utcnow()))
+            seconds = time.perf_counter() - started
+            applied.append({"version": number, "name": name, "seconds": round(seconds, 3)})
+            print(f"Applied schema migration {number} ({name}) in {seconds * 1000:.0f} ms")
+            version = number
+    return {"from_version": start_version, "to_version": version, "applied": applied}
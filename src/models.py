@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean # Added Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index, LargeBinary, PrimaryKeyConstraint, UniqueConstraint # Added Text, Boolean
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -10,6 +10,7 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    password_changed_at = Column(DateTime, nullable=True) # Tokens issued before this are rejected
 
     # Relationships
     programs = relationship("Program", back_populates="owner")
@@ -30,6 +31,10 @@ class Program(Base):
 
     owner = relationship("User", back_populates="programs")
 
+    __table_args__ = (
+        Index("ix_programs_owner_created", "owner_id", "created_at", "id"), # Keyset pagination
+    )
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -37,11 +42,130 @@ class Document(Base):
     filename = Column(String, index=True, nullable=False)
     file_path = Column(String, nullable=False) # Store path to the actual file
     description = Column(String)
+    content_type = Column(String, nullable=True) # As sent by the client
+    size_bytes = Column(Integer, nullable=True)
+    content_sha256 = Column(String(64), nullable=True, index=True) # Hex digest, computed while uploading
     owner_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
 
     owner = relationship("User", back_populates="documents")
 
+    __table_args__ = (
+        Index("ix_documents_owner_created", "owner_id", "created_at", "id"), # Keyset pagination
+    )
+
+class DocumentText(Base):
+    """
+    Normalized text extracted once per document by services/extraction_service.
+    The text itself lives in a UTF-8 sidecar file next to the upload (text_path).
+    """
+    __tablename__ = "document_texts"
+
+    document_id = Column(Integer, ForeignKey("documents.id"), primary_key=True)
+    status = Column(String, nullable=False, default="pending") # pending, processing, completed, failed
+    text_path = Column(String, nullable=True)
+    char_count = Column(Integer, nullable=True)
+    byte_count = Column(Integer, nullable=True)
+    page_offsets = Column(Text, nullable=True) # JSON list: byte offset in the text file where each page starts
+    chunk_count = Column(Integer, nullable=True) # Retrieval chunks indexed; None until the chunk index is built
+    error_message = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DocumentChunk(Base):
+    """
+    Overlapping passage of a document's extracted text, addressed by byte range in
+    the text sidecar file (the text itself is not copied into the DB).
+    Built by services/retrieval_service. The document description is indexed as
+    one extra chunk (ordinal DESCRIPTION_ORDINAL, byte range into the description).
+    """
+    __tablename__ = "document_chunks"
+    DESCRIPTION_ORDINAL = -1
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    ordinal = Column(Integer, nullable=False)
+    start_byte = Column(Integer, nullable=False)
+    end_byte = Column(Integer, nullable=False)
+    token_count = Column(Integer, nullable=False) # BM25 document length
+    embedding = Column(LargeBinary, nullable=True) # float32 vector from the configured embedder
+    embedding_model = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_document_chunks_document_ordinal", "document_id", "ordinal"),
+        Index("ix_document_chunks_owner", "owner_id"), # Library-wide BM25 statistics
+    )
+
+class DocumentChunkTerm(Base):
+    """Inverted index posting: how often a term occurs in a chunk."""
+    __tablename__ = "document_chunk_terms"
+
+    chunk_id = Column(Integer, ForeignKey("document_chunks.id"), nullable=False)
+    term = Column(String, nullable=False)
+    document_id = Column(Integer, nullable=False) # Denormalized for per-document lookups and deletes
+    owner_id = Column(Integer, nullable=False) # Denormalized for per-user (library-wide) lookups
+    term_frequency = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("chunk_id", "term"),
+        Index("ix_document_chunk_terms_document_term", "document_id", "term"),
+        Index("ix_document_chunk_terms_owner_term", "owner_id", "term"),
+    )
+
+class AnalysisResult(Base):
+    """
+    Cached ai_service output. Keyed by document content rather than document id, so
+    every upload of the same bytes shares results and a changed file never hits a stale one.
+    """
+    __tablename__ = "analysis_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_sha256 = Column(String(64), nullable=False)
+    analysis_type = Column(String, nullable=False)
+    query_key = Column(String, nullable=False, default="") # Normalized query ("" when the type takes none)
+    model_version = Column(String, nullable=False)
+    result = Column(Text, nullable=False) # JSON-encoded result
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("content_sha256", "analysis_type", "query_key", "model_version", name="uq_analysis_results_key"),
+        Index("ix_analysis_results_last_used", "last_used_at"), # LRU eviction
+        Index("ix_analysis_results_expires", "expires_at"),
+    )
+
+class AnalysisJob(Base):
+    """
+    Durable queue entry for an asynchronous document analysis (POST /ai/jobs),
+    run by services/job_service workers. A claimed job holds a lease; if its
+    worker dies the lease expires and the job is handed out again.
+    """
+    __tablename__ = "analysis_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    analysis_type = Column(String, nullable=False)
+    query = Column(Text, nullable=True)
+    status = Column(String, nullable=False, default="pending") # pending, processing, completed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow) # Not claimable before this (retry backoff)
+    lease_expires_at = Column(DateTime, nullable=True)
+    result = Column(Text, nullable=True) # JSON-encoded result
+    cached = Column(Boolean, nullable=False, default=False)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_analysis_jobs_status_available", "status", "available_at", "id"), # Claiming the next job
+        Index("ix_analysis_jobs_owner_status", "owner_id", "status"), # Per-user caps
+        Index("ix_analysis_jobs_document", "document_id"),
+    )
+
 # New Models for Email Feature
 
 # class EmailAccount(Base):
@@ -78,4 +202,156 @@ class EmailMessage(Base):
 
     owner = relationship("User", back_populates="emails")
 
+    __table_args__ = (
+        # Keyset pagination, newest first: per folder, and across all folders
+        Index("ix_email_messages_owner_folder_received", "owner_id", "folder", "received_at", "id"),
+        Index("ix_email_messages_owner_received", "owner_id", "received_at", "id"),
+        # Latest message of a thread (thread summary maintenance)
+        Index("ix_email_messages_owner_thread_received", "owner_id", "thread_id", "received_at", "id"),
+    )
+
+class EmailThread(Base):
+    """
+    Materialized conversation summary, one row per (owner, thread).
+    Maintained incrementally by the email CRUD functions; rebuild with crud.rebuild_email_threads.
+    """
+    __tablename__ = "email_threads"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    thread_key = Column(String, nullable=False) # EmailMessage.thread_id, or "email:<id>" for messages without one
+    message_count = Column(Integer, nullable=False, default=0)
+    unread_count = Column(Integer, nullable=False, default=0)
+    last_message_id = Column(Integer)
+    last_message_at = Column(DateTime)
+    last_sender = Column(String)
+    subject = Column(String) # Subject of the latest message
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "thread_key", name="uq_email_threads_owner_key"),
+        Index("ix_email_threads_owner_last", "owner_id", "last_message_at", "id"), # Keyset pagination
+    )
+
+
+
+class EmailFolderCount(Base):
+    """
+    Per-(owner, folder) message totals for inbox badges, kept current by the email
+    CRUD functions; repair with crud.reconcile_email_folder_counts.
+    """
+    __tablename__ = "email_folder_counts"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    folder = Column(String, primary_key=True)
+    total_count = Column(Integer, nullable=False, default=0)
+    unread_count = Column(Integer, nullable=False, default=0)
+
+# --- College Scorecard mirror ---
+# Local copy of the public College Scorecard bulk files, searched instead of
+# calling the Scorecard API for every query (see services/scorecard_service.py).
+# Each import loads a new generation alongside the active one and then switches
+# over in one transaction, so reads never see a half-loaded dataset.
+
+class ScorecardImport(Base):
+    """One bulk load of the Scorecard files. At most one generation is 'active'."""
+    __tablename__ = "scorecard_imports"
+
+    generation = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False) # Institution file path or URL
+    status = Column(String, nullable=False, default="loading") # loading, active, superseded, failed
+    institution_count = Column(Integer, nullable=False, default=0)
+    program_count = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True) # When it became active (or failed / was superseded)
+    purged_at = Column(DateTime, nullable=True) # Rows of a superseded/failed generation deleted
+    error_message = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_scorecard_imports_status", "status", "generation"),
+    )
+
+class ScorecardInstitution(Base):
+    """A school from the Scorecard institution-level file (one row per UNITID and generation)."""
+    __tablename__ = "scorecard_institutions"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False)
+    unit_id = Column(Integer, nullable=False) # IPEDS UNITID
+    name = Column(String, nullable=False)
+    city = Column(String)
+    state = Column(String) # Two-letter postal code
+    url = Column(String)
+    student_size = Column(Integer) # Undergraduate enrollment (UGDS)
+    tuition_in_state = Column(Integer)
+    tuition_out_of_state = Column(Integer)
+
+    __table_args__ = (
+        UniqueConstraint("generation", "unit_id", name="uq_scorecard_institutions_generation_unit"),
+        Index("ix_scorecard_institutions_generation_state", "generation", "state", "student_size"),
+        Index("ix_scorecard_institutions_generation_size", "generation", "student_size"),
+    )
+
+class ScorecardProgram(Base):
+    """A program (CIP code and credential level) offered by a school, from the field-of-study file."""
+    __tablename__ = "scorecard_programs"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False)
+    unit_id = Column(Integer, nullable=False)
+    cip_code = Column(String, nullable=False) # e.g. "1107" (Computer Science)
+    cip_title = Column(String, nullable=False)
+    credential_level = Column(Integer) # 1-8, see scorecard_service.CREDENTIAL_LEVELS
+    credential_title = Column(String)
+
+    __table_args__ = (
+        Index("ix_scorecard_programs_generation_cip", "generation", "cip_code", "unit_id"),
+        Index("ix_scorecard_programs_generation_unit", "generation", "unit_id"),
+    )
+
+# --- Program catalog ---
+# Every result fetched from an upstream search API, normalized and deduplicated,
+# so later searches can be answered locally (see services/catalog_service.py).
+
+class CatalogProgram(Base):
+    """One program as one source returns it, merged across every response of that source that mentioned it."""
+    __tablename__ = "catalog_programs"
+
+    id = Column(Integer, primary_key=True)
+    dedup_key = Column(String, nullable=False, unique=True) # source|normalized program|university|country
+    program_name = Column(String, nullable=False)
+    university_name = Column(String, nullable=False)
+    country = Column(String)
+    country_key = Column(String) # Normalized country, for filtering
+    degree_level = Column(Integer) # Scorecard CREDLEV named in program_name, None if it names none
+    url = Column(String)
+    description = Column(Text)
+    tuition_fees = Column(String)
+    ranking = Column(String)
+    intake_dates = Column(Text) # JSON list of strings
+    visa_support = Column(Boolean)
+    source = Column(String, nullable=False) # Search source that returned it (part of dedup_key)
+    first_seen_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    fetched_at = Column(DateTime, nullable=False, default=datetime.utcnow) # Last time an upstream returned it
+
+    __table_args__ = (
+        Index("ix_catalog_programs_source_fetched", "source", "fetched_at"),
+        Index("ix_catalog_programs_country_university", "country_key", "university_name"),
+        Index("ix_catalog_programs_university", "university_name"),
+    )
+
+class CatalogQueryResult(Base):
+    """
+    The catalog programs an upstream returned for a query (by search cache key), in
+    order, so the same query can be answered without calling it again.
+    """
+    __tablename__ = "catalog_query_results"
+
+    query_key = Column(String, nullable=False)
+    source = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)
+    program_id = Column(Integer, ForeignKey("catalog_programs.id", ondelete="CASCADE"), nullable=False)
+    fetched_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
+    __table_args__ = (
+        PrimaryKeyConstraint("query_key", "source", "position"),
+    )
@@ -1,10 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import Any
-import os # Import os for path checking
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import crud, models, schemas, database, services
-from ..services import ai_service # Import the AI service
+from .. import async_crud, models, schemas, database
+from ..services import analysis_service, job_service
 from .auth import get_current_user # Import the correct dependency from auth router
 
 router = APIRouter(
@@ -13,87 +11,62 @@ router = APIRouter(
     dependencies=[Depends(get_current_user)], # Use the imported dependency
 )
 
-# Dependency to get DB session
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/analyze_document", response_model=schemas.DocumentAnalysisResponse)
 async def analyze_document(
     request: schemas.DocumentAnalysisRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(get_current_user) # Use the imported dependency
 ):
-    """Endpoint to trigger AI analysis on an uploaded document."""
-    db_document = crud.get_document(db, document_id=request.document_id)
+    """Endpoint to trigger AI analysis on an uploaded document (served from the analysis cache when possible)."""
+    db_document = await async_crud.get_document(db, document_id=request.document_id, owner_id=current_user.id)
 
     if db_document is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    if db_document.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to access this document")
-
-    # --- Retrieve actual document content --- 
-    try:
-        file_path = db_document.file_path
-        if not file_path or not os.path.exists(file_path):
-             print(f"Error: Document file path not found or file does not exist for ID: {request.document_id}, Path: {file_path}")
-             raise FileNotFoundError(f"Document file not found at path: {file_path}")
-
-        with open(file_path, "rb") as f:
-            document_content = f.read()
-        print(f"Successfully read content for document ID: {request.document_id}, Path: {file_path}, Size: {len(document_content)} bytes")
+    return await analysis_service.analyze_document(db, db_document, request.analysis_type, request.query)
 
-    except FileNotFoundError:
-         # Return a pending/failed status immediately if content retrieval fails
-         return schemas.DocumentAnalysisResponse(
-             document_id=request.document_id,
-             analysis_type=request.analysis_type,
-             status="failed",
-             error_message="Document content not found or inaccessible."
-         )
-    except Exception as e:
-        print(f"Error retrieving document content for ID {request.document_id}: {e}")
-        return schemas.DocumentAnalysisResponse(
-             document_id=request.document_id,
-             analysis_type=request.analysis_type,
-             status="failed",
-             error_message=f"Failed to retrieve document content: {e}"
-         )
-    # --- End Content Retrieval ---
+# --- Asynchronous analysis jobs ---
+# Same pipeline as /analyze_document, run by job_service workers instead of inside
+# the request. Submit, then poll (or long-poll with ?wait=) the returned job.
 
-    # Call the AI service, passing content and filename for type detection
+@router.post("/jobs", response_model=schemas.AnalysisJob, status_code=status.HTTP_202_ACCEPTED)
+async def submit_analysis_job(
+    request: schemas.DocumentAnalysisRequest,
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Queues an analysis and returns immediately with the job to poll."""
+    db_document = await async_crud.get_document(db, document_id=request.document_id, owner_id=current_user.id)
+    if db_document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
     try:
-        analysis_result = await ai_service.analyze_document_content(
-            document_content=document_content,
-            filename=db_document.filename, # Pass filename for type inference
-            analysis_type=request.analysis_type,
-            query=request.query
+        db_job = await job_service.submit_job(
+            db, current_user.id, request.document_id, request.analysis_type, request.query
         )
-        status = "completed"
-        error_message = None
-        # Check if the service returned an error string
-        if isinstance(analysis_result, str) and analysis_result.startswith("Error:"):
-            status = "failed"
-            error_message = analysis_result
-            analysis_result = None
-
-    except Exception as e:
-        print(f"AI analysis failed for document {request.document_id}: {e}")
-        status = "failed"
-        analysis_result = None
-        error_message = str(e)
-
-    # TODO: Update document status/result in the database if needed
-
-    return schemas.DocumentAnalysisResponse(
-        document_id=request.document_id,
-        analysis_type=request.analysis_type,
-        status=status,
-        result=analysis_result,
-        error_message=error_message
-    )
+    except job_service.QueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analysis queue is full, please retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    except job_service.UserQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many unfinished analysis jobs (limit {job_service.JOB_USER_QUEUE_LIMIT})",
+            headers={"Retry-After": "5"},
+        )
+    job_service.notify_workers()
+    response.headers["Location"] = f"/ai/jobs/{db_job.id}"
+    return job_service.job_to_schema(db_job)
 
+@router.get("/jobs/{job_id}", response_model=schemas.AnalysisJob)
+async def get_analysis_job(
+    job_id: int,
+    wait: float = Query(0, ge=0, le=job_service.MAX_WAIT_SECONDS, description="Seconds to wait for the job to finish (long-poll)"),
+    current_user: models.User = Depends(get_current_user)
+):
+    job = await job_service.get_job(job_id, current_user.id, wait=wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
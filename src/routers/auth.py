@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from .. import crud, models, schemas, security, database
+from .. import async_crud, models, schemas, security, database
 
 router = APIRouter(
     prefix="/auth",
@@ -12,17 +12,35 @@ router = APIRouter(
 
 ACCESS_TOKEN_EXPIRE_MINUTES = security.ACCESS_TOKEN_EXPIRE_MINUTES
 
+def _hasher_busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+# Register/login are async so bcrypt runs on the security process pool rather than
+# holding one of the threadpool threads every other sync route depends on; their
+# queries use the async session for the same reason.
 @router.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    db_user = await async_crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    try:
+        hashed_password = await security.get_password_hash_async(user.password)
+    except security.HasherBusyError:
+        raise _hasher_busy_exception()
+    return await async_crud.create_user(db, user=user, hashed_password=hashed_password)
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = crud.get_user_by_email(db, email=form_data.username) # OAuth2 form uses username for email
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    user = await async_crud.get_user_by_email(db, email=form_data.username) # OAuth2 form uses username for email
+    try:
+        password_ok = user is not None and await security.verify_password_async(form_data.password, user.hashed_password)
+    except security.HasherBusyError:
+        raise _hasher_busy_exception()
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -37,12 +55,24 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 # Dependency to get current user from token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # Router-level and parameter declarations of this dependency are resolved once
+    # per request by FastAPI; the principal cache saves the decode + lookup across requests.
+    # Async so a cache miss queries on the loop instead of taking a threadpool thread.
+    # The lookup uses its own short-lived session, not a request-scoped one, so long-polls
+    # and streamed responses don't keep a pooled connection checked out.
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cached = security.get_cached_principal(token)
+    if cached is not None:
+        principal, issued_at = cached
+        if security.token_revoked(principal, issued_at):
+            raise credentials_exception
+        return principal
+
     payload = security.decode_access_token(token)
     if payload is None:
         raise credentials_exception
@@ -50,13 +80,42 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     if email is None:
         raise credentials_exception
     token_data = schemas.TokenData(email=email)
-    user = crud.get_user_by_email(db, email=token_data.email)
-    if user is None:
+    async with database.AsyncSessionLocal() as db:
+        user = await async_crud.get_user_by_email(db, email=token_data.email)
+    if user is None or security.token_revoked(user, payload.get("iat")):
         raise credentials_exception
-    return user
+
+    # Cache a detached snapshot, not the session-bound instance: the session closes
+    # (and a commit would expire its attributes) long before the cache entry does.
+    principal = models.User(id=user.id, email=user.email, created_at=user.created_at, password_changed_at=user.password_changed_at)
+    security.cache_principal(token, principal, expires_at=payload.get("exp"), issued_at=payload.get("iat"))
+    return principal
 
 # Example protected route
 @router.get("/users/me", response_model=schemas.User)
 def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
+@router.put("/users/me/password", status_code=status.HTTP_204_NO_CONTENT)
+async def change_password(
+    password_change: schemas.PasswordChange,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Changes the caller's password and revokes every token issued before the change,
+    including the one used for this request: log in again with the new password.
+    Other workers may accept a token they have cached for up to security.PRINCIPAL_CACHE_TTL.
+    """
+    db_user = await async_crud.get_user(db, user_id=current_user.id)
+    if db_user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    try:
+        password_ok = await security.verify_password_async(password_change.current_password, db_user.hashed_password)
+        hashed_password = await security.get_password_hash_async(password_change.new_password) if password_ok else None
+    except security.HasherBusyError:
+        raise _hasher_busy_exception()
+    if not password_ok:
+        raise HTTPException(status_code=400, detail="Incorrect current password")
+    await async_crud.update_user_password(db, user_id=db_user.id, hashed_password=hashed_password)
+
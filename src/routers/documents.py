@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
-import shutil
+from typing import List, Optional
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
 import os
 from pathlib import Path
 
 from .. import crud, models, schemas, database
+from ..services import extraction_service, retrieval_service, upload_service
 from .auth import get_current_user
 
 router = APIRouter(
@@ -14,60 +18,104 @@ router = APIRouter(
     dependencies=[Depends(get_current_user)] # Protect all document routes
 )
 
-UPLOAD_DIRECTORY = "/home/ubuntu/program_pal_uploads"
-Path(UPLOAD_DIRECTORY).mkdir(parents=True, exist_ok=True)
+UPLOAD_DIRECTORY = os.getenv("UPLOAD_DIRECTORY", "/home/ubuntu/program_pal_uploads") # Per-user subdirectories are created on upload
 
-@router.post("/", response_model=schemas.Document)
-def upload_document(
-    description: str | None = None, # Get description from form data
-    file: UploadFile = File(...),
+# The body is parsed by upload_service rather than FastAPI, so describe it for the docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "description": {"type": "string"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+@router.post("/", response_model=schemas.Document, openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_document(
+    request: Request,
+    description: str | None = None, # Query parameter, or a "description" form field
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    user_upload_dir = Path(UPLOAD_DIRECTORY) / str(current_user.id)
-    user_upload_dir.mkdir(parents=True, exist_ok=True)
-
-    # Basic sanitization - replace spaces, avoid path traversal
-    safe_filename = file.filename.replace(" ", "_").replace("/", "_").replace("\\", "_")
-    file_location = user_upload_dir / safe_filename
-
-    # Avoid overwriting existing files by adding a counter if needed (simple approach)
-    counter = 0
-    original_location = file_location
-    while file_location.exists():
-        counter += 1
-        file_location = user_upload_dir / f"{original_location.stem}_{counter}{original_location.suffix}"
-        if counter > 100: # Safety break
-             raise HTTPException(status_code=500, detail="Could not save file due to naming conflict.")
+    """
+    Upload a document as multipart/form-data (`file`, optional `description`).
 
+    The file is streamed to disk as it arrives, with its SHA-256 and size computed on
+    the fly; uploads over MAX_UPLOAD_BYTES are rejected with 413.
+    """
+    user_upload_dir = Path(UPLOAD_DIRECTORY) / str(current_user.id)
     try:
-        with open(file_location, "wb+") as file_object:
-            shutil.copyfileobj(file.file, file_object)
-    except Exception as e:
-        # Clean up partial file if copy fails
-        if file_location.exists():
-            os.remove(file_location)
+        upload = await upload_service.receive_upload(request, user_upload_dir)
+    except upload_service.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except upload_service.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
         raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
-    finally:
-        file.file.close()
 
-    doc_create = schemas.DocumentCreate(filename=safe_filename, description=description)
-    return crud.create_user_document(db=db, document=doc_create, file_path=str(file_location), owner_id=current_user.id)
+    doc_create = schemas.DocumentCreate(
+        filename=upload.filename,
+        description=description if description is not None else upload.fields.get("description")
+    )
+    db_document = await run_in_threadpool(
+        crud.create_user_document,
+        db=db,
+        document=doc_create,
+        file_path=str(upload.path),
+        owner_id=current_user.id,
+        content_type=upload.content_type,
+        size_bytes=upload.size_bytes,
+        content_sha256=upload.sha256
+    )
+    # Description is searchable right away; text is extracted (and indexed) once, in the background
+    await run_in_threadpool(retrieval_service.index_description, db, db_document.id, current_user.id, db_document.description)
+    await run_in_threadpool(extraction_service.enqueue_extraction, db_document.id)
+    return db_document
 
 @router.get("/", response_model=List[schemas.Document])
 def read_documents(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(database.get_db),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    documents = crud.get_documents_by_owner(db, owner_id=current_user.id, skip=skip, limit=limit)
+    """Newest first. Pass the X-Next-Cursor response header back as `cursor` for the next page."""
+    try:
+        documents = crud.get_documents_by_owner(db, owner_id=current_user.id, skip=skip, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    next_cursor = crud.next_cursor(documents, "created_at", limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return documents
 
+# Declared before /{document_id} so "search" is not parsed as an id
+@router.get("/search", response_model=List[schemas.DocumentSearchHit])
+def search_documents(
+    q: str = Query(..., min_length=1, description="Keywords to search for in document text and descriptions"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Ranks the user's documents by relevance, with the best-matching passages of each."""
+    return retrieval_service.search_documents(db, owner_id=current_user.id, query=q, limit=limit, skip=skip)
+
 @router.get("/{document_id}", response_model=schemas.Document)
 def read_document(
     document_id: int,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     db_document = crud.get_document(db, document_id=document_id, owner_id=current_user.id)
@@ -75,6 +123,70 @@ def read_document(
         raise HTTPException(status_code=404, detail="Document not found")
     return db_document
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as required for If-None-Match
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in candidates]
+
+def _not_modified_since(if_modified_since: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return int(mtime) <= since.timestamp() # HTTP dates have 1s resolution
+
+@router.get("/{document_id}/download")
+def download_document(
+    document_id: int,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Download a document's bytes.
+
+    Supports Range/If-Range for resumable and partial reads, and answers
+    If-None-Match / If-Modified-Since with 304. The file is streamed from disk in
+    chunks, never loaded into memory whole. Whole-file responses are handed to the
+    server as a path instead when it offers the ASGI pathsend extension (uvicorn
+    doesn't; granian does).
+    """
+    db_document = crud.get_document(db, document_id=document_id, owner_id=current_user.id)
+    if db_document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        stat_result = os.stat(db_document.file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Document file not found")
+
+    if db_document.content_sha256:
+        etag = f'"{db_document.content_sha256}"' # Strong validator: identical bytes, identical tag
+    else:
+        etag = f'W/"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"' # Uploaded before hashes were stored
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": "private, no-cache", # Cache, but revalidate (cheap 304) before reuse
+    }
+
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        not_modified = if_modified_since is not None and _not_modified_since(if_modified_since, stat_result.st_mtime)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        db_document.file_path,
+        media_type=db_document.content_type or None, # None: guessed from the filename
+        filename=db_document.filename,
+        headers=headers,
+        stat_result=stat_result,
+    )
+
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_document(
     document_id: int,
@@ -85,10 +197,11 @@ def delete_document(
     if db_document is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Attempt to delete the file from storage
+    # Attempt to delete the file (and its extracted text) from storage
     try:
-        if os.path.exists(db_document.file_path):
-            os.remove(db_document.file_path)
+        for path in (db_document.file_path, extraction_service.text_path_for(db_document.file_path)):
+            if os.path.exists(path):
+                os.remove(path)
     except Exception as e:
         # Log error but proceed with DB deletion
         print(f"Error deleting file {db_document.file_path}: {e}")
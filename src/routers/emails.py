@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Literal, Optional
+import os
 
 from .. import crud, models, schemas, database
 from .auth import get_current_user
@@ -13,23 +16,86 @@ router = APIRouter(
 
 @router.get("/", response_model=List[schemas.EmailMessage])
 def read_emails(
+    response: Response,
     folder: Optional[str] = None,
     is_read: Optional[bool] = None,
     skip: int = 0,
     limit: int = 50, # Default limit to 50 for emails
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Retrieve email messages for the current user, newest first, with optional filters.
+    Pass the X-Next-Cursor response header back as `cursor` for the next page.
+    """
+    try:
+        emails = crud.get_email_messages_by_owner(
+            db, owner_id=current_user.id, folder=folder, is_read=is_read, skip=skip, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    next_cursor = crud.next_cursor(emails, "received_at", limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return emails
+
+@router.get("/counts", response_model=List[schemas.EmailFolderCount])
+def read_email_folder_counts(
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Total and unread message counts per folder (for inbox badges)."""
+    return crud.get_email_folder_counts(db, owner_id=current_user.id)
+
+@router.post("/counts/reconcile", response_model=List[schemas.EmailFolderCount])
+def reconcile_email_folder_counts(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Retrieve email messages for the current user, with optional filters."""
-    emails = crud.get_email_messages_by_owner(
-        db, owner_id=current_user.id, folder=folder, is_read=is_read, skip=skip, limit=limit
+    """Recompute the current user's folder counts from their messages."""
+    crud.reconcile_email_folder_counts(db, owner_id=current_user.id)
+    return crud.get_email_folder_counts(db, owner_id=current_user.id)
+
+@router.get("/threads", response_model=List[schemas.EmailThread])
+def read_email_threads(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Conversation list, most recently active first, read from the thread summary table.
+    Pass the X-Next-Cursor response header back as `cursor` for the next page.
+    """
+    try:
+        threads = crud.get_email_threads_by_owner(db, owner_id=current_user.id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    next_cursor = crud.next_cursor(threads, "last_message_at", limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return threads
+
+@router.get("/search", response_model=List[schemas.EmailSearchHit])
+def search_emails(
+    q: str = Query(..., min_length=1, description="Words to find in subject, sender or body"),
+    folder: Optional[str] = None,
+    is_read: Optional[bool] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Ranked full-text search over the current user's mail, with highlighted snippets."""
+    return crud.search_email_messages(
+        db, owner_id=current_user.id, query_text=q, folder=folder, is_read=is_read, limit=limit
     )
-    return emails
 
 @router.get("/{email_id}", response_model=schemas.EmailMessage)
 def read_email(
     email_id: int,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """Retrieve a specific email message by ID."""
@@ -50,6 +116,88 @@ def create_email(
     # (e.g., if saving a draft, recipient might be set, but is_sent_by_user is false)
     return crud.create_email_message(db=db, email=email, owner_id=current_user.id)
 
+MAX_ERRORS_PER_BATCH = 20 # Parse errors echoed back per batch; the rest are only counted
+BULK_MAX_LINE_BYTES = int(os.getenv("EMAIL_BULK_MAX_LINE_BYTES", str(1024 * 1024))) # One NDJSON message
+BULK_MAX_BODY_BYTES = int(os.getenv("EMAIL_BULK_MAX_BODY_BYTES", str(256 * 1024 * 1024))) # Whole request body
+
+@router.post("/bulk", response_model=schemas.EmailBulkIngestResponse)
+async def bulk_create_emails(
+    request: Request,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    on_duplicate: Literal["skip", "update"] = "skip",
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Bulk-load messages from a streamed NDJSON body (one EmailMessageCreate object per line).
+
+    Lines are validated as they arrive and inserted `batch_size` at a time, one transaction
+    per batch. Existing message_ids are skipped, or with on_duplicate=update have their
+    is_read/folder refreshed. Returns totals and a summary per batch.
+
+    Bodies over BULK_MAX_BODY_BYTES or lines over BULK_MAX_LINE_BYTES are rejected with 413;
+    batches inserted before the limit was hit stay committed.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > BULK_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail=f"Request body exceeds {BULK_MAX_BODY_BYTES} bytes")
+
+    batches: List[schemas.EmailBulkBatchSummary] = []
+    pending: List[schemas.EmailMessageCreate] = []
+    errors: List[str] = []
+    failed = 0
+    line_no = 0
+
+    async def flush():
+        nonlocal pending, errors, failed
+        result = await run_in_threadpool(
+            crud.bulk_create_email_messages, db, pending, current_user.id, on_duplicate
+        )
+        batches.append(schemas.EmailBulkBatchSummary(batch=len(batches) + 1, failed=failed, errors=errors, **result))
+        pending, errors, failed = [], [], 0
+
+    def parse(line: bytes):
+        nonlocal failed
+        if not line.strip():
+            return
+        try:
+            pending.append(schemas.EmailMessageCreate.model_validate_json(line))
+        except ValidationError as e:
+            failed += 1
+            if len(errors) < MAX_ERRORS_PER_BATCH:
+                errors.append(f"line {line_no}: {e.errors()[0]['msg']}")
+
+    # Only the unterminated tail is carried between chunks and only new bytes are scanned
+    # for newlines, so a body costs linear time however it is chunked.
+    buffer = bytearray()
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > BULK_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail=f"Request body exceeds {BULK_MAX_BODY_BYTES} bytes")
+        scan_from = len(buffer)
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", scan_from)) != -1:
+            line_no += 1
+            if end - start > BULK_MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Line {line_no} exceeds {BULK_MAX_LINE_BYTES} bytes")
+            parse(bytes(buffer[start:end]))
+            if len(pending) >= batch_size:
+                await flush()
+            start = scan_from = end + 1
+        del buffer[:start]
+        if len(buffer) > BULK_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Line {line_no + 1} exceeds {BULK_MAX_LINE_BYTES} bytes")
+    if buffer:
+        line_no += 1
+        parse(bytes(buffer))
+    if pending or failed:
+        await flush()
+
+    totals = {key: sum(getattr(b, key) for b in batches) for key in ("received", "inserted", "updated", "skipped", "failed")}
+    return schemas.EmailBulkIngestResponse(**totals, batches=batches)
+
 @router.patch("/{email_id}", response_model=schemas.EmailMessage)
 def update_email_status(
     email_id: int,
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import shutil
 import os
 
@@ -23,18 +23,27 @@ def create_program(
 
 @router.get("/", response_model=List[schemas.Program])
 def read_programs(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(database.get_db),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    programs = crud.get_programs_by_owner(db, owner_id=current_user.id, skip=skip, limit=limit)
+    """Newest first. Pass the X-Next-Cursor response header back as `cursor` for the next page."""
+    try:
+        programs = crud.get_programs_by_owner(db, owner_id=current_user.id, skip=skip, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    next_cursor = crud.next_cursor(programs, "created_at", limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return programs
 
 @router.get("/{program_id}", response_model=schemas.Program)
 def read_program(
     program_id: int,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     db_program = crud.get_program(db, program_id=program_id, owner_id=current_user.id)
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import json
 
 from .. import schemas, models, database
 from ..services import search_service
@@ -14,7 +16,7 @@ router = APIRouter(
 @router.post("/", response_model=schemas.SearchResponse)
 async def perform_search(
     search_query: schemas.SearchQuery,
-    db: Session = Depends(database.get_db), # Keep DB session if needed later
+    db: AsyncSession = Depends(database.get_async_db), # Keep DB session if needed later (async: never blocks the loop)
     current_user: models.User = Depends(get_current_user)
 ):
     """Receives a natural language query and returns search results."""
@@ -26,3 +28,34 @@ async def perform_search(
         print(f"Error during search: {e}")
         raise HTTPException(status_code=500, detail=f"Search failed: {e}")
 
+@router.post("/stream")
+async def perform_search_stream(
+    search_query: schemas.SearchQuery,
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Streaming variant of POST /search/ (newline-delimited JSON).
+
+    Emits `results` frames as each source returns (and, for streamed sources, per
+    result as it is parsed), so fast sources are not held back by slow ones, then a
+    final `summary` frame.
+    """
+    async def ndjson_frames():
+        try:
+            async for frame in search_service.stream_advanced_search(search_query):
+                yield json.dumps(frame) + "\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            print(f"Error during streaming search: {e}")
+            yield json.dumps({"type": "error", "detail": f"Search failed: {e}"}) + "\n"
+
+    return StreamingResponse(
+        ndjson_frames(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, # Don't let proxies buffer frames
+    )
+
+@router.get("/cache/stats")
+def read_search_cache_stats():
+    """Hit/miss/eviction counters for the per-source search result caches."""
+    return search_service.cache_stats()
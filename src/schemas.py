@@ -9,6 +9,10 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
 class User(UserBase):
     id: int
     # is_active: bool # Removed as not present in model
@@ -55,14 +59,41 @@ class Document(DocumentBase):
     id: int
     owner_id: int
     file_path: str
+    content_type: Optional[str] = None
+    size_bytes: Optional[int] = None
+    content_sha256: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+# Library-wide document search (GET /documents/search)
+class DocumentSearchPassage(BaseModel):
+    field: str = Field(..., description="'text' (extracted text) or 'description'")
+    start_byte: int = Field(..., description="Snippet start, as a UTF-8 byte offset into the field")
+    end_byte: int
+    snippet: str
+    score: float
+
+class DocumentSearchHit(BaseModel):
+    document: Document
+    score: float
+    passages: List[DocumentSearchPassage] = []
+
 # --- Search Schemas ---
 class SearchQuery(BaseModel):
     query: str
+    # Paging and filters; applied by the College Scorecard source (state and degree
+    # level are also picked up from the query text, e.g. "masters in new york")
+    page: int = Field(1, ge=1)
+    page_size: int = Field(20, ge=1, le=100)
+    state: Optional[str] = Field(None, min_length=2, max_length=2, description="US state code, e.g. 'CA'")
+    city: Optional[str] = None
+    country: Optional[str] = Field(None, description="Country as results name it, e.g. 'UK'; Scorecard only answers for the US")
+    credential_level: Optional[int] = Field(None, ge=1, le=8, description="Scorecard CREDLEV: 3 bachelor's, 5 master's, 6 doctoral, ...")
+    max_tuition: Optional[int] = Field(None, ge=0, description="Maximum out-of-state tuition, USD/year")
+    min_student_size: Optional[int] = Field(None, ge=0)
+    max_student_size: Optional[int] = Field(None, ge=0)
 
 class SearchResultItem(BaseModel):
     program_name: Optional[str] = None
@@ -79,6 +110,7 @@ class SearchResultItem(BaseModel):
 class SearchResponse(BaseModel):
     results: List[SearchResultItem]
     summary: Optional[str] = None
+    timed_out_sources: List[str] = [] # Sources that missed their timeout; results are partial if non-empty
 
 # --- AI Document Assistance Schemas ---
 class DocumentAnalysisRequest(BaseModel):
@@ -92,6 +124,22 @@ class DocumentAnalysisResponse(BaseModel):
     status: str = Field(..., description="e.g., 'pending', 'processing', 'completed', 'failed'")
     result: Optional[Any] = Field(None, description="The result of the analysis, format depends on analysis_type")
     error_message: Optional[str] = None
+    cached: bool = Field(False, description="True when the result was served from the analysis cache")
+
+# Asynchronous analysis job (POST /ai/jobs, GET /ai/jobs/{id})
+class AnalysisJob(BaseModel):
+    id: int
+    document_id: int
+    analysis_type: str
+    query: Optional[str] = None
+    status: str = Field(..., description="'pending', 'processing', 'completed' or 'failed'")
+    attempts: int
+    result: Optional[Any] = None
+    cached: bool = False
+    error_message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
 # --- Email Schemas ---
 class EmailMessageBase(BaseModel):
@@ -120,6 +168,59 @@ class EmailMessage(EmailMessageBase):
     class Config:
         from_attributes = True
 
+# Conversation summary (GET /emails/threads)
+class EmailThread(BaseModel):
+    thread_key: str # EmailMessage.thread_id, or "email:<id>" for a message without one
+    message_count: int
+    unread_count: int
+    last_message_id: Optional[int] = None
+    last_message_at: Optional[datetime] = None
+    last_sender: Optional[str] = None
+    subject: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+# Per-folder badge counts (GET /emails/counts)
+class EmailFolderCount(BaseModel):
+    folder: str
+    total_count: int
+    unread_count: int
+
+    class Config:
+        from_attributes = True
+
+# Full-text search hit (GET /emails/search); bodies are left out to keep responses small
+class EmailSearchHit(BaseModel):
+    id: int
+    subject: Optional[str] = None
+    sender: str
+    folder: str
+    is_read: bool
+    thread_id: Optional[str] = None
+    received_at: datetime
+    subject_highlight: Optional[str] = None # Subject with matches wrapped in <mark>…</mark>
+    snippet: Optional[str] = None # Best-matching fragment, matches wrapped in <mark>…</mark>
+    rank: float # bm25 score, lower is better
+
+# Bulk ingest (POST /emails/bulk)
+class EmailBulkBatchSummary(BaseModel):
+    batch: int
+    received: int
+    inserted: int
+    updated: int
+    skipped: int
+    failed: int # Lines that were not valid EmailMessageCreate JSON
+    errors: List[str] = [] # First few parse errors, as "line N: message"
+
+class EmailBulkIngestResponse(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    skipped: int
+    failed: int
+    batches: List[EmailBulkBatchSummary]
+
 # Schema for sending an email
 class EmailSendRequest(BaseModel):
     recipient: EmailStr
@@ -1,9 +1,15 @@
 from passlib.context import CryptContext
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
+import asyncio
+import multiprocessing
 import os
+import time
 from dotenv import load_dotenv
 
+from .cache import TTLCache
+
 load_dotenv()
 
 # Password Hashing
@@ -13,12 +19,83 @@ SECRET_KEY = os.getenv("SECRET_KEY", "a_very_secret_key_for_development") # Repl
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Authenticated principal cache: token -> user snapshot.
+# Short TTL bounds how long a stale principal can survive if an invalidation hook is
+# missed, and on other workers: the cache (and invalidate_principals) is per process.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+principal_cache = TTLCache("principals", ttl=PRINCIPAL_CACHE_TTL, max_entries=PRINCIPAL_CACHE_MAX_ENTRIES)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# --- Async password hashing on a dedicated process pool ---
+# bcrypt is deliberately slow; running it in request handlers lets a login burst
+# exhaust the shared threadpool. Hashing gets its own bounded pool instead, and
+# callers are turned away (HasherBusyError -> 503) once HASH_QUEUE_LIMIT is reached.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64")) # Max hash jobs running + waiting per process
+
+class HasherBusyError(Exception):
+    """Raised when too many password hash jobs are already queued."""
+
+_hash_executor: ProcessPoolExecutor | None = None
+_hash_pending = 0 # Jobs submitted and not yet finished; only touched from the event loop
+_hash_metrics = {"count": 0, "seconds_total": 0.0, "seconds_max": 0.0, "rejected": 0, "errors": 0}
+
+def _get_hash_executor() -> ProcessPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        # Created lazily, when the app already runs threads: forking then is unsafe, so
+        # workers come from a clean forkserver process instead
+        _hash_executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    return _hash_executor
+
+def shutdown_hasher():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+async def _run_hash_job(fn, *args):
+    global _hash_pending
+    if _hash_pending >= HASH_QUEUE_LIMIT:
+        _hash_metrics["rejected"] += 1
+        raise HasherBusyError("Password hashing queue is full")
+    _hash_pending += 1
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), fn, *args)
+    except Exception:
+        _hash_metrics["errors"] += 1
+        raise
+    finally:
+        _hash_pending -= 1
+        elapsed = time.perf_counter() - start # Includes time spent queued
+        _hash_metrics["count"] += 1
+        _hash_metrics["seconds_total"] += elapsed
+        _hash_metrics["seconds_max"] = max(_hash_metrics["seconds_max"], elapsed)
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _run_hash_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    return await _run_hash_job(get_password_hash, password)
+
+def hasher_stats() -> dict:
+    count = _hash_metrics["count"]
+    return {
+        **_hash_metrics,
+        "seconds_avg": _hash_metrics["seconds_total"] / count if count else 0.0,
+        "workers": HASH_WORKERS,
+        "queue_limit": HASH_QUEUE_LIMIT,
+        "in_flight": _hash_pending,
+        "queue_depth": max(0, _hash_pending - HASH_WORKERS),
+    }
+
 # JWT Token Handling
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -26,7 +103,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": int(datetime.now(timezone.utc).timestamp())})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -37,3 +114,38 @@ def decode_access_token(token: str):
     except JWTError:
         return None
 
+
+# Principal cache helpers
+
+def token_revoked(principal, issued_at: int | float | None) -> bool:
+    """
+    True if the token (`iat` claim, epoch seconds) predates the user's last password change.
+    iat has whole-second precision, so tokens issued in the second of the change still pass.
+    """
+    changed_at = principal.password_changed_at
+    if changed_at is None:
+        return False
+    return issued_at is None or issued_at < int(changed_at.replace(tzinfo=timezone.utc).timestamp())
+
+def get_cached_principal(token: str):
+    """(principal, issued_at) cached for token, or None."""
+    return principal_cache.get(token)
+
+def cache_principal(token: str, principal, expires_at: int | float | None = None, issued_at: int | float | None = None):
+    """Caches principal for token, never past the token's own expiry (`exp` claim, epoch seconds)."""
+    ttl = PRINCIPAL_CACHE_TTL
+    if expires_at is not None:
+        ttl = min(ttl, expires_at - datetime.now(timezone.utc).timestamp())
+    principal_cache.set(token, (principal, issued_at), ttl=ttl)
+
+def invalidate_principals(email: str | None = None, user_id: int | None = None) -> int:
+    """
+    Drops every cached token for a user. Call when a user is deleted or changes password,
+    so this worker's next request re-reads the user (and rejects tokens issued before
+    the change). Only this process's cache is cleared: other workers keep accepting
+    their cached tokens for up to PRINCIPAL_CACHE_TTL seconds.
+    """
+    return principal_cache.delete_where(
+        lambda token, entry: (email is not None and entry[0].email == email)
+        or (user_id is not None and entry[0].id == user_id)
+    )
@@ -10,10 +10,12 @@ from typing import Any, Optional
 load_dotenv()
 # Example: Assuming an API key for an AI service
 AI_SERVICE_API_KEY = os.getenv("AI_SERVICE_API_KEY", "dummy_ai_key")
+# Part of the analysis cache key: bump it whenever the model or prompts change so old results are not reused
+MODEL_VERSION = os.getenv("AI_MODEL_VERSION", "dummy-1")
 
-async def analyze_document_content(document_content: bytes, analysis_type: str, query: Optional[str] = None) -> Any:
-    """Placeholder function to simulate AI document analysis."""
-    print(f"Simulating AI analysis: type=	{analysis_type}	, query=	{query}	 on document content (length: {len(document_content)} bytes)")
+async def analyze_document_content(document_text: str, analysis_type: str, query: Optional[str] = None) -> Any:
+    """Placeholder function to simulate AI document analysis on extracted document text."""
+    print(f"Simulating AI analysis: type=	{analysis_type}	, query=	{query}	 on document text (length: {len(document_text)} characters)")
 
     # Simulate different analysis types
     if analysis_type == "summary":
@@ -32,7 +34,7 @@ async def analyze_document_content(document_content: bytes, analysis_type: str,
         return f"Error: Unknown analysis type 	{analysis_type}	 requested."
 
     # In a real implementation, this would involve:
-    # 1. Sending the document_content (or its text representation) to an AI model API.
+    # 1. Sending the document_text to an AI model API.
     # 2. Constructing the appropriate prompt based on analysis_type and query.
     # 3. Handling the API response and potential errors.
     # 4. Returning the structured result.
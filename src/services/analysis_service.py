@@ -0,0 +1,140 @@
+# Document analysis pipeline: cached result lookup, extracted text, AI call.
+# Results are persisted in analysis_results keyed by (content hash, analysis type,
+# normalized query, model version), so repeat requests never reach the model.
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from .. import async_crud, database, models, schemas
+from . import ai_service, extraction_service, retrieval_service, upload_service
+
+load_dotenv()
+
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(30 * 24 * 3600))) # seconds
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "10000"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+QUERY_ANALYSIS_TYPES = {"qa"} # Types whose result depends on the query
+# QA over documents larger than this sends only retrieved passages, not the whole text
+QA_FULL_TEXT_MAX_BYTES = int(os.getenv("QA_FULL_TEXT_MAX_BYTES", "16000"))
+
+def normalize_query(analysis_type: str, query: Optional[str]) -> str:
+    """Cache key form of the query: case/whitespace-insensitive, and empty for types that ignore it."""
+    if analysis_type not in QUERY_ANALYSIS_TYPES or not query:
+        return ""
+    return " ".join(query.split()).casefold()
+
+def _response(document_id: int, analysis_type: str, status: str, **fields) -> schemas.DocumentAnalysisResponse:
+    return schemas.DocumentAnalysisResponse(document_id=document_id, analysis_type=analysis_type, status=status, **fields)
+
+async def _content_hash(db: AsyncSession, db_document: models.Document) -> Optional[str]:
+    if db_document.content_sha256:
+        return db_document.content_sha256
+    try:
+        content_sha256 = await run_in_threadpool(upload_service.file_sha256, db_document.file_path)
+    except OSError as e:
+        print(f"Could not hash document {db_document.id} for the analysis cache: {e}")
+        return None
+    await async_crud.set_document_content_hash(db, db_document.id, content_sha256)
+    return content_sha256
+
+def _qa_context(document_id: int, owner_id: int, db_text: models.DocumentText, query: str) -> str:
+    # Chunking and scoring are CPU work on mmap'd files, so this runs in the threadpool with its own session
+    db = database.SessionLocal()
+    try:
+        if db_text.chunk_count is None:
+            # Extracted before the chunk index existed (or indexing failed): build it now
+            retrieval_service.index_document(db, document_id, owner_id, db_text.text_path)
+        passages = retrieval_service.retrieve_passages(db, document_id, db_text.text_path, query)
+    finally:
+        db.close()
+    return retrieval_service.PASSAGE_SEPARATOR.join(passages)
+
+async def _store_result(db: AsyncSession, key: tuple, result: Any):
+    try:
+        result_json = json.dumps(result)
+    except (TypeError, ValueError):
+        return # Not representable in the cache; just don't cache it
+    expires_at = datetime.utcnow() + timedelta(seconds=ANALYSIS_CACHE_TTL)
+    await async_crud.store_cached_analysis(db, *key, result_json, expires_at)
+    removed = await async_crud.evict_cached_analyses(db, ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_BYTES)
+    if removed:
+        print(f"Evicted {removed} analysis cache entries")
+
+async def analyze_document(
+    db: AsyncSession, db_document: models.Document, analysis_type: str, query: Optional[str] = None,
+    raise_errors: bool = False
+) -> schemas.DocumentAnalysisResponse:
+    """
+    Runs (or serves from cache) one analysis of an owned document. Shared by the
+    inline endpoint and the job workers.
+
+    Exceptions from the AI call become a 'failed' response, unless raise_errors is
+    set (job workers retry them). "Error: ..." results are never retried.
+    """
+    document_id = db_document.id
+
+    # --- Cached result ---
+    content_sha256 = await _content_hash(db, db_document)
+    key = None
+    if content_sha256:
+        key = (content_sha256, analysis_type, normalize_query(analysis_type, query), ai_service.MODEL_VERSION)
+        entry = await async_crud.get_cached_analysis(db, *key)
+        if entry is not None:
+            return _response(document_id, analysis_type, "completed", result=json.loads(entry.result), cached=True)
+
+    # --- Retrieve extracted document text ---
+    # Text is extracted once after upload (extraction_service); analysis never re-reads the raw file
+    db_text = await async_crud.get_document_text(db, document_id)
+    if db_text is None:
+        # Uploaded before extraction existed: start it now
+        await run_in_threadpool(extraction_service.enqueue_extraction, document_id)
+        db_text = await async_crud.get_document_text(db, document_id)
+    if db_text.status in ("pending", "processing"):
+        return _response(
+            document_id, analysis_type, db_text.status,
+            error_message="Document text extraction is still in progress; retry shortly."
+        )
+    if db_text.status == "failed":
+        return _response(
+            document_id, analysis_type, "failed",
+            error_message=f"Document text could not be extracted: {db_text.error_message}"
+        )
+
+    try:
+        if analysis_type in QUERY_ANALYSIS_TYPES and query and (db_text.byte_count or 0) > QA_FULL_TEXT_MAX_BYTES:
+            document_text = await run_in_threadpool(_qa_context, document_id, db_document.owner_id, db_text, query)
+            print(f"Retrieved passages for document ID: {document_id}, Size: {len(document_text)} of {db_text.char_count} characters")
+        else:
+            document_text = await run_in_threadpool(extraction_service.read_text, db_text)
+            print(f"Loaded extracted text for document ID: {document_id}, Size: {len(document_text)} characters")
+    except OSError as e:
+        print(f"Error reading extracted text for document ID {document_id}: {e}")
+        return _response(document_id, analysis_type, "failed", error_message="Document text not found or inaccessible.")
+
+    # --- AI call ---
+    try:
+        analysis_result = await ai_service.analyze_document_content(
+            document_text=document_text,
+            analysis_type=analysis_type,
+            query=query
+        )
+    except Exception as e:
+        print(f"AI analysis failed for document {document_id}: {e}")
+        if raise_errors:
+            raise
+        return _response(document_id, analysis_type, "failed", error_message=str(e))
+
+    # Check if the service returned an error string (never cached)
+    if isinstance(analysis_result, str) and analysis_result.startswith("Error:"):
+        return _response(document_id, analysis_type, "failed", error_message=analysis_result)
+
+    if key is not None:
+        await _store_result(db, key, analysis_result)
+    return _response(document_id, analysis_type, "completed", result=analysis_result)
@@ -0,0 +1,152 @@
+# Program catalog: every result an upstream search API returns is normalized,
+# deduplicated per source and kept in catalog_programs, together with which results
+# each query got. Searches then look there first (behind the in-process result caches):
+# a query answered within the source's cache TTL, or one whose terms match enough
+# programs fetched within CATALOG_MAX_AGE, is served from the local index without
+# calling the upstream again.
+
+import asyncio
+import json
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from dotenv import load_dotenv
+
+from .. import async_crud, database, models
+from ..schemas import SearchQuery, SearchResultItem
+from .query_words import DEGREE_WORDS, STOP_WORDS, degree_level, words
+
+load_dotenv()
+
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "true").lower() == "true"
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", str(7 * 24 * 3600))) # Older programs no longer count as coverage for new queries
+CATALOG_MIN_RESULTS = int(os.getenv("CATALOG_MIN_RESULTS", "5")) # Matching programs needed to skip the upstream for a new query
+
+_pending: Set[asyncio.Task] = set() # Catalog writes still in flight (awaited at shutdown)
+_stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "recorded": 0, "record_errors": 0}
+
+def stats() -> dict:
+    return dict(_stats, pending_writes=len(_pending))
+
+def normalize_text(value: Optional[str]) -> str:
+    """Case-folded, unicode-normalized, punctuation-free form used to deduplicate programs."""
+    text = unicodedata.normalize("NFKC", value or "").casefold()
+    return " ".join(re.findall(r"\w+", text))
+
+def dedup_key(item: SearchResultItem, source: str) -> Optional[str]:
+    """
+    Per source: two sources returning the same program keep a row each, so neither
+    one's record overwrites the other's source or fetched_at (lookups filter on both).
+    """
+    program, university = normalize_text(item.program_name), normalize_text(item.university_name)
+    if not program or not university or university == "n a":
+        return None # Nothing to identify it by
+    return f"{source}|{program}|{university}|{normalize_text(item.country)}"
+
+def search_terms(query_text: str) -> List[str]:
+    """Query words worth matching against program text (generic and degree words dropped: results rarely repeat them)."""
+    return [word for word in words(query_text) if word not in STOP_WORDS and word not in DEGREE_WORDS]
+
+def _to_row(item: SearchResultItem, source: str, key: str, now: datetime) -> dict:
+    def clean(value: Optional[str]) -> Optional[str]:
+        value = " ".join(value.split()) if value else None
+        return value or None
+
+    return {
+        "dedup_key": key,
+        "program_name": clean(item.program_name),
+        "university_name": clean(item.university_name),
+        "country": clean(item.country),
+        "country_key": normalize_text(item.country) or None,
+        "degree_level": degree_level(item.program_name),
+        "url": clean(item.url),
+        "description": item.description.strip() if item.description else None,
+        "tuition_fees": clean(item.tuition_fees),
+        "ranking": clean(item.ranking),
+        "intake_dates": json.dumps(item.intake_dates) if item.intake_dates else None,
+        "visa_support": item.visa_support,
+        "source": source,
+        "first_seen_at": now,
+        "fetched_at": now,
+    }
+
+def to_item(db_program: models.CatalogProgram) -> SearchResultItem:
+    return SearchResultItem(
+        program_name=db_program.program_name,
+        university_name=db_program.university_name,
+        country=db_program.country,
+        url=db_program.url,
+        description=db_program.description,
+        tuition_fees=db_program.tuition_fees,
+        ranking=db_program.ranking,
+        intake_dates=json.loads(db_program.intake_dates) if db_program.intake_dates else None,
+        visa_support=db_program.visa_support,
+        source=db_program.source,
+    )
+
+async def lookup(source: str, query: SearchQuery, query_key: str, max_age: float) -> Optional[List[SearchResultItem]]:
+    """
+    Results of source for query from the catalog, or None if the upstream should be called:
+    the stored answer to this exact query if it was fetched within max_age (the source's
+    cache TTL, so the catalog never serves an answer its cache would have refetched), else
+    programs fetched within CATALOG_MAX_AGE matching the query terms if there are at least
+    CATALOG_MIN_RESULTS (capped at the page size) of them. When the query asks for a degree
+    level, only programs whose name states that level count as matches.
+    """
+    if not CATALOG_ENABLED:
+        return None
+    now = datetime.utcnow()
+    fetched_after = now - timedelta(seconds=CATALOG_MAX_AGE)
+    async with database.AsyncSessionLocal() as db:
+        known = await async_crud.get_catalog_query_results(
+            db, query_key, source, max(fetched_after, now - timedelta(seconds=max_age))
+        )
+        if known:
+            _stats["exact_hits"] += 1
+            return [to_item(db_program) for db_program in known]
+        matches = await async_crud.search_catalog_programs(
+            db, search_terms(query.query), source, fetched_after, country=normalize_text(query.country) or None,
+            degree_level=query.credential_level or degree_level(query.query),
+            limit=query.page_size, offset=(query.page - 1) * query.page_size,
+        )
+    if not matches or len(matches) < min(CATALOG_MIN_RESULTS, query.page_size):
+        _stats["misses"] += 1
+        return None
+    _stats["similar_hits"] += 1
+    return [to_item(db_program) for db_program in matches]
+
+async def _store(source: str, rows: List[dict], query_key: Optional[str]):
+    try:
+        async with database.AsyncSessionLocal() as db:
+            await async_crud.record_catalog_results(db, source, rows, query_key)
+        _stats["recorded"] += len(rows)
+    except Exception as e:
+        _stats["record_errors"] += 1
+        print(f"Failed to add {len(rows)} {source} results to the catalog: {e}")
+
+def record(source: str, query_key: str, items: List[SearchResultItem], complete: bool = True):
+    """
+    Adds upstream results to the catalog in the background (the response doesn't wait).
+    Only a complete answer is stored as the answer to query_key; partial results are
+    still added as programs.
+    """
+    if not CATALOG_ENABLED:
+        return
+    now = datetime.utcnow()
+    rows = {}
+    for item in items:
+        key = dedup_key(item, source)
+        if key is not None and key not in rows:
+            rows[key] = _to_row(item, source, key, now)
+    if not rows:
+        return
+    task = asyncio.create_task(_store(source, list(rows.values()), query_key if complete else None))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+async def shutdown():
+    if _pending:
+        await asyncio.gather(*list(_pending), return_exceptions=True)
@@ -0,0 +1,203 @@
+# Service for extracting document text once, right after upload.
+# Analysis and search read the stored text instead of re-reading raw files.
+
+import json
+import mimetypes
+import multiprocessing
+import os
+import re
+import unicodedata
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .. import crud, database, models
+from . import retrieval_service
+
+load_dotenv()
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+TEXT_SUFFIX = ".text" # Sidecar file next to the upload holding the normalized UTF-8 text
+PAGE_SEPARATOR = "\n\n"
+
+TEXT_EXTENSIONS = {".txt", ".md", ".csv", ".json", ".html", ".htm", ".rtf", ".xml"}
+
+class UnsupportedDocumentType(Exception):
+    """The document format has no text extractor."""
+
+# Parsing PDFs/DOCX is CPU-bound Python, so it runs in worker processes (no GIL
+# contention with request handling). A small thread pool coordinates jobs and
+# writes results to the DB.
+_process_pool: Optional[ProcessPoolExecutor] = None
+_coordinator: Optional[ThreadPoolExecutor] = None
+
+def _get_pools() -> Tuple[ProcessPoolExecutor, ThreadPoolExecutor]:
+    global _process_pool, _coordinator
+    if _process_pool is None:
+        # Not fork: by now the app runs threads (threadpool, job workers), and forking a threaded process is unsafe
+        _process_pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+        _coordinator = ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix="extraction")
+    return _process_pool, _coordinator
+
+# --- Extraction (runs in worker processes) ---
+
+def normalize_text(text: str) -> str:
+    """NFC-normalizes, unifies newlines, collapses runs of spaces and blank lines."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n").replace("\x00", "")
+    text = re.sub(r"[ \t\f\v\u00a0]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+def _extract_pages(file_path: str, filename: str, content_type: Optional[str]) -> List[str]:
+    suffix = Path(filename).suffix.lower()
+    content_type = content_type or mimetypes.guess_type(filename)[0] or ""
+
+    if suffix == ".pdf" or content_type == "application/pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise UnsupportedDocumentType("PDF text extraction requires the 'pypdf' package")
+        reader = PdfReader(file_path)
+        return [page.extract_text() or "" for page in reader.pages]
+
+    if suffix == ".docx" or content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        try:
+            import docx
+        except ImportError:
+            raise UnsupportedDocumentType("DOCX text extraction requires the 'python-docx' package")
+        paragraphs = [paragraph.text for paragraph in docx.Document(file_path).paragraphs]
+        return ["\n".join(paragraphs)] # DOCX has no fixed pages
+
+    if suffix in TEXT_EXTENSIONS or content_type.startswith("text/"):
+        with open(file_path, "rb") as f:
+            raw = f.read()
+        return [raw.decode("utf-8-sig", errors="replace")]
+
+    raise UnsupportedDocumentType(f"No text extractor for '{suffix or content_type or 'unknown'}' files")
+
+def extract_to_file(file_path: str, filename: str, content_type: Optional[str], text_path: str) -> dict:
+    """
+    Extracts and normalizes text, writes it to text_path, and returns its stats
+    and the byte offset at which each page starts.
+    """
+    pages = [normalize_text(page) for page in _extract_pages(file_path, filename, content_type)]
+    page_offsets = []
+    chunks = []
+    offset = 0
+    for page in pages:
+        page_offsets.append(offset)
+        encoded = page.encode("utf-8") + PAGE_SEPARATOR.encode("utf-8")
+        chunks.append(encoded)
+        offset += len(encoded)
+    data = b"".join(chunks)
+
+    temp_path = text_path + ".part"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, text_path)
+    return {
+        "char_count": sum(len(page) + len(PAGE_SEPARATOR) for page in pages),
+        "byte_count": len(data),
+        "page_offsets": page_offsets,
+    }
+
+# --- Job coordination (runs in the web process) ---
+
+def text_path_for(file_path: str) -> str:
+    return file_path + TEXT_SUFFIX
+
+def _build_chunk_index(process_pool: ProcessPoolExecutor, db, db_document: models.Document, text_path: str):
+    try:
+        # Chunking/tokenizing is CPU-bound too; the coordinator only writes the index
+        chunks = process_pool.submit(retrieval_service.chunk_file, text_path).result()
+        retrieval_service.index_document(db, db_document.id, db_document.owner_id, text_path, chunks=chunks)
+    except Exception as e:
+        db.rollback()
+        print(f"Chunk indexing failed for document {db_document.id}: {e}") # Retried lazily on first QA
+
+def _index_document(document_id: int):
+    """Builds the retrieval/search index of a document extracted before indexing existed."""
+    process_pool, _ = _get_pools()
+    db = database.SessionLocal()
+    try:
+        db_document = db.get(models.Document, document_id)
+        db_text = crud.get_document_text(db, document_id)
+        if db_document is None or db_text is None or db_text.status != "completed":
+            return
+        _build_chunk_index(process_pool, db, db_document, db_text.text_path)
+        retrieval_service.index_description(db, document_id, db_document.owner_id, db_document.description)
+    finally:
+        db.close()
+
+def _process_document(document_id: int):
+    process_pool, _ = _get_pools()
+    db = database.SessionLocal()
+    try:
+        db_document = db.get(models.Document, document_id)
+        if db_document is None:
+            return # Deleted while queued
+        crud.set_document_text(db, document_id, "processing")
+        text_path = text_path_for(db_document.file_path)
+        try:
+            stats = process_pool.submit(
+                extract_to_file, db_document.file_path, db_document.filename, db_document.content_type, text_path
+            ).result()
+        except Exception as e:
+            print(f"Text extraction failed for document {document_id}: {e}")
+            crud.set_document_text(db, document_id, "failed", error_message=str(e) or type(e).__name__)
+            return
+        _build_chunk_index(process_pool, db, db_document, text_path)
+        crud.set_document_text(
+            db, document_id, "completed",
+            text_path=text_path,
+            char_count=stats["char_count"],
+            byte_count=stats["byte_count"],
+            page_offsets=json.dumps(stats["page_offsets"]),
+            error_message=None,
+        )
+        print(f"Extracted {stats['char_count']} characters from document {document_id}")
+    finally:
+        db.close()
+
+def enqueue_extraction(document_id: int) -> Future:
+    """Marks the document's text as pending and schedules extraction in the background."""
+    db = database.SessionLocal()
+    try:
+        crud.set_document_text(db, document_id, "pending", error_message=None)
+    finally:
+        db.close()
+    _, coordinator = _get_pools()
+    future = coordinator.submit(_process_document, document_id)
+    future.add_done_callback(
+        lambda f: not f.cancelled() and f.exception() and print(f"Extraction job for document {document_id} crashed: {f.exception()}")
+    )
+    return future
+
+def read_text(db_text) -> str:
+    with open(db_text.text_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def startup():
+    """Re-queues extractions interrupted by a restart, and indexing of documents never indexed."""
+    db = database.SessionLocal()
+    try:
+        document_ids = crud.get_document_ids_by_text_status(db, ["pending", "processing"])
+        unindexed_ids = crud.get_unindexed_document_ids(db)
+    finally:
+        db.close()
+    for document_id in document_ids:
+        enqueue_extraction(document_id)
+    if unindexed_ids:
+        _, coordinator = _get_pools()
+        for document_id in unindexed_ids:
+            coordinator.submit(_index_document, document_id)
+
+def shutdown():
+    global _process_pool, _coordinator
+    if _coordinator is not None:
+        _coordinator.shutdown(wait=False, cancel_futures=True)
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = _coordinator = None
@@ -0,0 +1,230 @@
+# Asynchronous document analysis jobs.
+# Jobs are queued durably in the analysis_jobs table and run by a fixed number of
+# asyncio workers in each web process, so a slow model call holds neither an HTTP
+# connection nor a threadpool thread. Submitting is bounded (global queue depth and
+# per-user limits), failures are retried with exponential backoff, and callers
+# either poll or long-poll GET /ai/jobs/{id}.
+
+import asyncio
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import async_crud, database, models, schemas
+from . import analysis_service
+
+load_dotenv()
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4")) # Concurrent jobs per process
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "1000")) # Pending + running jobs, all users
+JOB_USER_QUEUE_LIMIT = int(os.getenv("JOB_USER_QUEUE_LIMIT", "20")) # Pending + running jobs per user
+JOB_USER_CONCURRENCY = int(os.getenv("JOB_USER_CONCURRENCY", "2")) # Running jobs per user
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "120")) # seconds per attempt
+JOB_LEASE_SECONDS = JOB_TIMEOUT + 30 # A claimed job is handed out again if its worker is gone this long
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "2"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "60"))
+JOB_POLL_INTERVAL = 1.0 # Idle workers / long-polls re-check the table this often (jobs from other processes)
+EXTRACTION_WAIT_DELAY = 2.0 # Re-check delay while the document text is still being extracted
+JOB_EXTRACTION_MAX_WAIT = float(os.getenv("JOB_EXTRACTION_MAX_WAIT", "900")) # Seconds after submission a job may wait for extraction
+MAX_WAIT_SECONDS = 30 # Upper bound for GET /ai/jobs/{id}?wait=
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+class QueueFull(Exception):
+    """The global job queue is at JOB_QUEUE_LIMIT."""
+
+class UserQueueFull(Exception):
+    """The user already has JOB_USER_QUEUE_LIMIT unfinished jobs."""
+
+_workers: List[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None # Set when a job is submitted in this process
+_finished: Dict[int, asyncio.Event] = {} # job id -> event for long-polls waiting in this process
+_running: Set[int] = set() # Jobs claimed by this process's workers
+
+def job_to_schema(db_job: models.AnalysisJob) -> schemas.AnalysisJob:
+    return schemas.AnalysisJob(
+        id=db_job.id,
+        document_id=db_job.document_id,
+        analysis_type=db_job.analysis_type,
+        query=db_job.query,
+        status=db_job.status,
+        attempts=db_job.attempts,
+        result=json.loads(db_job.result) if db_job.result is not None else None,
+        cached=db_job.cached,
+        error_message=db_job.error_message,
+        created_at=db_job.created_at,
+        started_at=db_job.started_at,
+        finished_at=db_job.finished_at,
+    )
+
+# --- Submitting and reading jobs ---
+
+async def submit_job(
+    db: AsyncSession, owner_id: int, document_id: int, analysis_type: str, query: Optional[str]
+) -> models.AnalysisJob:
+    """Queues a job. Raises QueueFull / UserQueueFull."""
+    db_job = await async_crud.create_analysis_job(
+        db, owner_id, document_id, analysis_type, query, JOB_QUEUE_LIMIT, JOB_USER_QUEUE_LIMIT
+    )
+    if db_job is None:
+        # Refused atomically; these counts only pick the error
+        if await async_crud.count_active_analysis_jobs(db) >= JOB_QUEUE_LIMIT:
+            raise QueueFull()
+        raise UserQueueFull()
+    return db_job
+
+def notify_workers():
+    if _wakeup is not None:
+        _wakeup.set()
+
+async def _load_job(job_id: int, owner_id: int) -> Optional[schemas.AnalysisJob]:
+    async with database.AsyncSessionLocal() as db: # Short-lived: long-polls must not pin a pooled connection
+        db_job = await async_crud.get_analysis_job(db, job_id, owner_id=owner_id)
+        return job_to_schema(db_job) if db_job is not None else None
+
+async def get_job(job_id: int, owner_id: int, wait: float = 0) -> Optional[schemas.AnalysisJob]:
+    """Returns the job, waiting up to `wait` seconds for it to finish first."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(wait, MAX_WAIT_SECONDS)
+    while True:
+        job = await _load_job(job_id, owner_id)
+        remaining = deadline - loop.time()
+        if job is None or job.status in TERMINAL_STATUSES:
+            _finished.pop(job_id, None)
+            return job
+        if remaining <= 0:
+            return job
+        event = _finished.setdefault(job_id, asyncio.Event())
+        try:
+            # Woken at once when a worker in this process finishes it; otherwise re-check periodically
+            await asyncio.wait_for(event.wait(), timeout=min(remaining, JOB_POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+
+def _signal_finished(job_id: int):
+    event = _finished.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+# --- Workers ---
+
+def _retry_delay(attempts: int) -> float:
+    # Exponential backoff with jitter so failed jobs don't retry in lockstep
+    delay = min(JOB_RETRY_MAX_DELAY, JOB_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0))
+    return random.uniform(delay / 2, delay)
+
+async def _record(fn, *args, **kwargs):
+    """Runs one async_crud function in its own short session."""
+    async with database.AsyncSessionLocal() as db:
+        return await fn(db, *args, **kwargs)
+
+async def _analyze(job_id: int) -> Optional[schemas.DocumentAnalysisResponse]:
+    """Runs one attempt in its own session. None if the job or its document is gone."""
+    async with database.AsyncSessionLocal() as db:
+        db_job = await async_crud.get_analysis_job(db, job_id)
+        if db_job is None:
+            return None
+        db_document = await async_crud.get_document(db, db_job.document_id, db_job.owner_id)
+        if db_document is None:
+            return None
+        return await analysis_service.analyze_document(
+            db, db_document, db_job.analysis_type, db_job.query, raise_errors=True
+        )
+
+async def _attempts_of(job_id: int) -> int:
+    db_job = await _record(async_crud.get_analysis_job, job_id)
+    return db_job.attempts if db_job is not None else JOB_MAX_ATTEMPTS
+
+async def _run_job(job_id: int):
+    _running.add(job_id)
+    try:
+        try:
+            response = await asyncio.wait_for(_analyze(job_id), timeout=JOB_TIMEOUT)
+        except Exception as e:
+            attempts = await _attempts_of(job_id)
+            error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            if attempts >= JOB_MAX_ATTEMPTS:
+                print(f"Analysis job {job_id} failed after {attempts} attempts: {error}")
+                await _record(async_crud.finish_analysis_job, job_id, "failed", error_message=error)
+            else:
+                delay = _retry_delay(attempts)
+                print(f"Analysis job {job_id} attempt {attempts} failed ({error}); retrying in {delay:.1f}s")
+                await _record(async_crud.requeue_analysis_jobs, [job_id], delay, error_message=error)
+            return
+
+        if response is None:
+            await _record(async_crud.finish_analysis_job, job_id, "failed", error_message="Document not found")
+        elif response.status in ("pending", "processing"):
+            db_job = await _record(async_crud.get_analysis_job, job_id)
+            if db_job is not None and datetime.utcnow() - db_job.created_at > timedelta(seconds=JOB_EXTRACTION_MAX_WAIT):
+                await _record(
+                    async_crud.finish_analysis_job, job_id, "failed",
+                    error_message=f"Document text was not extracted within {JOB_EXTRACTION_MAX_WAIT:.0f}s"
+                )
+            else:
+                # Text extraction not done yet: wait without spending an attempt
+                await _record(async_crud.requeue_analysis_jobs, [job_id], EXTRACTION_WAIT_DELAY, refund_attempt=True)
+        else:
+            result_json = json.dumps(response.result) if response.result is not None else None
+            await _record(
+                async_crud.finish_analysis_job, job_id, response.status,
+                result_json=result_json, error_message=response.error_message, cached=response.cached
+            )
+    finally:
+        _running.discard(job_id)
+        _signal_finished(job_id)
+
+async def _worker(number: int):
+    while True:
+        try:
+            _wakeup.clear() # Cleared before claiming so a submit in between is not missed
+            job_id = await _record(async_crud.claim_analysis_job, JOB_LEASE_SECONDS, JOB_USER_CONCURRENCY)
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await _run_job(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Analysis worker {number} error: {e}")
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+async def _reaper():
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 2)
+        try:
+            reclaimed = await _record(async_crud.reclaim_expired_analysis_jobs, JOB_MAX_ATTEMPTS)
+            if reclaimed:
+                print(f"Reclaimed {reclaimed} analysis jobs with expired leases")
+                notify_workers()
+        except Exception as e:
+            print(f"Analysis job reaper error: {e}")
+
+async def startup():
+    """Recovers jobs abandoned by a crashed worker and starts the worker tasks."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    reclaimed = await _record(async_crud.reclaim_expired_analysis_jobs, JOB_MAX_ATTEMPTS)
+    if reclaimed:
+        print(f"Recovered {reclaimed} interrupted analysis jobs")
+    _workers.extend(asyncio.create_task(_worker(n)) for n in range(ANALYSIS_WORKERS))
+    _workers.append(asyncio.create_task(_reaper()))
+
+async def shutdown():
+    """Stops the workers and hands this process's in-flight jobs back to the queue."""
+    interrupted = list(_running)
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    if interrupted:
+        await _record(async_crud.requeue_analysis_jobs, interrupted, refund_attempt=True)
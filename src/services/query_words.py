@@ -0,0 +1,26 @@
+# Word lists shared by the services that parse free-text program searches.
+
+import re
+import unicodedata
+from typing import Optional
+
+# Degree words and the Scorecard CREDLEV code they stand for
+DEGREE_WORDS = {
+    "associate": 2, "associates": 2, "associate's": 2,
+    "bachelor": 3, "bachelors": 3, "bachelor's": 3, "undergraduate": 3, "bsc": 3,
+    "master": 5, "masters": 5, "master's": 5, "msc": 5, "mba": 5, "meng": 5, "postgraduate": 5,
+    "phd": 6, "doctorate": 6, "doctoral": 6,
+}
+STOP_WORDS = {
+    "a", "an", "the", "in", "at", "of", "for", "and", "or", "to", "with", "on", "near", "best", "top", "good",
+    "cheap", "affordable", "program", "programs", "degree", "degrees", "course", "courses", "study", "studies",
+    "major", "majors", "us", "usa", "u.s", "united", "states",
+}
+
+def words(text: Optional[str]) -> list:
+    """Case-folded words of text, keeping apostrophes and dots inside them (master's, u.s)."""
+    return re.findall(r"\w+(?:['.]\w+)*", unicodedata.normalize("NFKC", text or "").casefold())
+
+def degree_level(text: Optional[str]) -> Optional[int]:
+    """CREDLEV of the first degree word in text, None if it names no degree."""
+    return next((DEGREE_WORDS[word] for word in words(text) if word in DEGREE_WORDS), None)
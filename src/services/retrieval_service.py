@@ -0,0 +1,331 @@
+# Passage retrieval over extracted document text.
+# Each document's text file is split into overlapping chunks (byte ranges, read via
+# mmap so large files are never loaded whole) and indexed as term postings in the
+# DB. QA sends the model only the best-matching passages: BM25 over the postings,
+# fused with embedding similarity when an embedder is configured.
+
+import importlib
+import math
+import mmap
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from .. import crud, models
+
+load_dotenv()
+
+CHUNK_BYTES = int(os.getenv("RETRIEVAL_CHUNK_BYTES", "2400")) # ~500 tokens of English
+CHUNK_OVERLAP_BYTES = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP_BYTES", "300"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+EMBEDDER = os.getenv("RETRIEVAL_EMBEDDER", "") # "package.module:factory" returning an Embedder; empty disables embeddings
+EMBED_BATCH_SIZE = 64
+DESCRIPTION_ORDINAL = models.DocumentChunk.DESCRIPTION_ORDINAL
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60 # Reciprocal rank fusion constant
+PASSAGE_SEPARATOR = "\n\n[...]\n\n"
+DESCRIPTION_BOOST = 2.0 # A match in the user's own description outweighs one in body text
+SEARCH_PASSAGES_PER_DOCUMENT = 3
+SEARCH_POSTINGS_PER_TERM = int(os.getenv("RETRIEVAL_SEARCH_POSTINGS_PER_TERM", "2000")) # Best-weighted chunks per query term in library search
+SNIPPET_CHARS = 240
+MAX_TERM_LENGTH = 64
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i if in is it its of on or that the
+their there these this to was were what when where which who why will with you your
+""".split())
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Casefolded word tokens without stopwords; used for both chunks and queries."""
+    return [
+        token for token in _TOKEN_RE.findall(text.casefold())
+        if len(token) > 1 and len(token) <= MAX_TERM_LENGTH and token not in STOPWORDS
+    ]
+
+# --- Embeddings (optional) ---
+
+class Embedder(Protocol):
+    """
+    What an embedding backend provides. Point RETRIEVAL_EMBEDDER at a factory
+    ("package.module:factory") returning an object with these members.
+    """
+    model_name: str
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """One vector per text, all of the same dimension."""
+        ...
+
+_embedder: Optional[Embedder] = None
+_embedder_loaded = False
+
+def get_embedder() -> Optional[Embedder]:
+    global _embedder, _embedder_loaded
+    if not _embedder_loaded:
+        _embedder_loaded = True
+        if EMBEDDER:
+            module_name, _, attribute = EMBEDDER.partition(":")
+            _embedder = getattr(importlib.import_module(module_name), attribute)()
+            print(f"Retrieval embeddings enabled: {_embedder.model_name}")
+    return _embedder
+
+def set_embedder(embedder: Optional[Embedder]):
+    """Installs an embedder programmatically (instead of RETRIEVAL_EMBEDDER)."""
+    global _embedder, _embedder_loaded
+    _embedder, _embedder_loaded = embedder, True
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+def _unpack(blob: bytes) -> array:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+# --- Chunking (runs in an extraction worker process) ---
+
+def _char_boundary(mm, position: int, lower: int) -> int:
+    # Never cut inside a UTF-8 sequence (continuation bytes are 0b10xxxxxx)
+    while position > lower and position < len(mm) and (mm[position] & 0xC0) == 0x80:
+        position -= 1
+    return position
+
+def chunk_spans(mm, chunk_bytes: int = CHUNK_BYTES, overlap_bytes: int = CHUNK_OVERLAP_BYTES):
+    """Yields (start, end) byte ranges of overlapping chunks, cut at line/word boundaries where possible."""
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = min(start + chunk_bytes, size)
+        if end < size:
+            floor = start + chunk_bytes // 2
+            cut = mm.rfind(b"\n", floor, end)
+            if cut == -1:
+                cut = mm.rfind(b" ", floor, end)
+            end = cut + 1 if cut != -1 else _char_boundary(mm, end, start + 1)
+        yield start, end
+        if end >= size:
+            return
+        next_start = max(end - overlap_bytes, start + 1)
+        space = mm.find(b" ", next_start, end)
+        start = space + 1 if space != -1 else _char_boundary(mm, next_start, start + 1)
+
+def chunk_file(text_path: str) -> List[dict]:
+    """Chunks and tokenizes a text file. Returns chunk dicts for crud.replace_document_chunks."""
+    chunks = []
+    with open(text_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return chunks # mmap cannot map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for ordinal, (start, end) in enumerate(chunk_spans(mm)):
+                tokens = tokenize(mm[start:end].decode("utf-8", errors="replace"))
+                chunks.append({
+                    "ordinal": ordinal,
+                    "start_byte": start,
+                    "end_byte": end,
+                    "token_count": len(tokens),
+                    "terms": dict(Counter(tokens)),
+                })
+    return chunks
+
+def read_spans(text_path: str, spans: List[Tuple[int, int]]) -> List[str]:
+    """Reads byte ranges of a text file via mmap."""
+    with open(text_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ["" for _ in spans]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [mm[start:end].decode("utf-8", errors="replace") for start, end in spans]
+
+# --- Indexing (web process / extraction coordinator) ---
+
+def index_document(db: Session, document_id: int, owner_id: int, text_path: str, chunks: Optional[List[dict]] = None) -> int:
+    """Stores the chunk index for a document, chunking here unless precomputed chunks are given."""
+    if chunks is None:
+        chunks = chunk_file(text_path)
+    embedder = get_embedder()
+    if embedder is not None and chunks:
+        texts = read_spans(text_path, [(chunk["start_byte"], chunk["end_byte"]) for chunk in chunks])
+        for batch_start in range(0, len(chunks), EMBED_BATCH_SIZE):
+            batch = chunks[batch_start:batch_start + EMBED_BATCH_SIZE]
+            vectors = embedder.embed(texts[batch_start:batch_start + EMBED_BATCH_SIZE])
+            for chunk, vector in zip(batch, vectors):
+                chunk["embedding"] = _pack(vector)
+                chunk["embedding_model"] = embedder.model_name
+    return crud.replace_document_chunks(db, document_id, owner_id, chunks)
+
+def index_description(db: Session, document_id: int, owner_id: int, description: Optional[str]):
+    """Indexes the document description as its own chunk (searchable before text extraction finishes)."""
+    tokens = tokenize(description or "")
+    chunk = None
+    if tokens:
+        chunk = {
+            "start_byte": 0,
+            "end_byte": len(description.encode("utf-8")),
+            "token_count": len(tokens),
+            "terms": dict(Counter(tokens)),
+        }
+    crud.replace_description_chunk(db, document_id, owner_id, chunk)
+
+# --- Retrieval ---
+
+def bm25_scores(
+    postings: list, lengths: Dict[int, int], chunk_total: int, average_length: float,
+    document_frequency: Optional[Dict[str, int]] = None
+) -> Dict[int, float]:
+    """
+    BM25 per chunk from (chunk_id, term, term_frequency) postings. Pass document_frequency
+    when postings are not every posting of their terms; it is counted from them otherwise.
+    """
+    if document_frequency is None:
+        document_frequency = Counter(term for _, term, _ in postings)
+    scores: Dict[int, float] = {}
+    for chunk_id, term, frequency in postings:
+        df = document_frequency[term]
+        idf = math.log(1 + (chunk_total - df + 0.5) / (df + 0.5))
+        length_norm = 1 - BM25_B + BM25_B * lengths.get(chunk_id, 0) / (average_length or 1)
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+    return scores
+
+def retrieve_passages(db: Session, document_id: int, text_path: str, query: str, top_k: int = TOP_K) -> List[str]:
+    """
+    Best-matching passages of the document for the query, in document order.
+    Overlapping or adjacent chunks are merged so no text is sent twice.
+    """
+    chunks = crud.get_document_chunks(db, document_id)
+    if not chunks:
+        return []
+    terms = sorted(set(tokenize(query)))
+    lengths = {chunk.id: chunk.token_count for chunk in chunks}
+    average_length = sum(lengths.values()) / len(chunks)
+    postings = [posting for posting in crud.get_document_chunk_postings(db, document_id, terms) if posting[0] in lengths]
+    scores = bm25_scores(postings, lengths, len(chunks), average_length)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+
+    embedder = get_embedder()
+    if embedder is not None and chunks[0].embedding_model == embedder.model_name:
+        query_vector = embedder.embed([query])[0]
+        similarity = {chunk.id: _cosine(query_vector, _unpack(chunk.embedding)) for chunk in chunks if chunk.embedding}
+        by_similarity = sorted(similarity, key=similarity.get, reverse=True)
+        # Reciprocal rank fusion: robust to BM25 and cosine being on different scales
+        fused: Dict[int, float] = {}
+        for ranking in (ranked, by_similarity):
+            for rank, chunk_id in enumerate(ranking):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1 / (RRF_K + rank + 1)
+        ranked = sorted(fused, key=fused.get, reverse=True)
+
+    if not ranked:
+        ranked = [chunk.id for chunk in chunks] # No keyword overlap: fall back to the start of the document
+    by_id = {chunk.id: chunk for chunk in chunks}
+    spans = sorted((by_id[chunk_id].start_byte, by_id[chunk_id].end_byte) for chunk_id in ranked[:top_k])
+    merged: List[List[int]] = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return read_spans(text_path, [(start, end) for start, end in merged])
+
+# --- Library-wide search ---
+
+def _snippet(text: str, pattern: re.Pattern, base_byte: int) -> dict:
+    """A window of text around the first query term, with its byte offsets (base_byte = offset of text)."""
+    match = pattern.search(text)
+    begin = max(0, (match.start() if match else 0) - SNIPPET_CHARS // 3)
+    if begin:
+        space = text.find(" ", begin, begin + 20)
+        begin = space + 1 if space != -1 else begin
+    end = min(len(text), begin + SNIPPET_CHARS)
+    if end < len(text):
+        space = text.rfind(" ", end - 20, end)
+        end = space if space > begin else end
+    start_byte = base_byte + len(text[:begin].encode("utf-8"))
+    return {
+        "start_byte": start_byte,
+        "end_byte": start_byte + len(text[begin:end].encode("utf-8")),
+        "snippet": text[begin:end].strip(),
+    }
+
+def search_documents(db: Session, owner_id: int, query: str, limit: int = 20, skip: int = 0) -> List[dict]:
+    """
+    Ranks the user's documents for the query by their best-matching chunk (BM25 over
+    the user's whole library, description matches boosted). Each hit carries up to
+    SEARCH_PASSAGES_PER_DOCUMENT passages with snippets and byte offsets into the
+    extracted text ("text") or the description ("description").
+
+    Only the SEARCH_POSTINGS_PER_TERM best-weighted chunks of each term are scored, so a
+    chunk outside every term's top list is not ranked (idf still counts all chunks).
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+    chunk_total, average_length = crud.get_owner_chunk_stats(db, owner_id)
+    average_length = float(average_length or 0)
+    rows = crud.get_owner_chunk_postings(db, owner_id, terms, SEARCH_POSTINGS_PER_TERM, average_length, BM25_K1, BM25_B)
+    if not rows:
+        return []
+    lengths = {row.chunk_id: row.token_count for row in rows}
+    scores = bm25_scores(
+        [(row.chunk_id, row.term, row.term_frequency) for row in rows], lengths, chunk_total, average_length,
+        document_frequency=crud.get_owner_term_chunk_counts(db, owner_id, terms),
+    )
+
+    chunk_documents = {row.chunk_id: row.document_id for row in rows}
+    description_chunks = {row.chunk_id for row in rows if row.ordinal == DESCRIPTION_ORDINAL}
+    by_document: Dict[int, List[Tuple[float, int]]] = {}
+    for chunk_id, score in scores.items():
+        if chunk_id in description_chunks:
+            score *= DESCRIPTION_BOOST
+        by_document.setdefault(chunk_documents[chunk_id], []).append((score, chunk_id))
+    ranked = sorted(by_document.items(), key=lambda item: (-max(item[1])[0], item[0]))[skip:skip + limit]
+    if not ranked:
+        return []
+
+    document_ids = [document_id for document_id, _ in ranked]
+    documents = {document.id: document for document in crud.get_documents_by_ids(db, document_ids, owner_id)}
+    text_paths = {text.document_id: text.text_path for text in crud.get_document_texts(db, document_ids) if text.status == "completed"}
+    best_chunks = {
+        document_id: [chunk_id for _, chunk_id in sorted(chunk_scores, reverse=True)[:SEARCH_PASSAGES_PER_DOCUMENT]]
+        for document_id, chunk_scores in ranked
+    }
+    chunks = {chunk.id: chunk for chunk in crud.get_chunks_by_ids(db, [c for ids in best_chunks.values() for c in ids])}
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")\b", re.IGNORECASE)
+
+    hits = []
+    for document_id, chunk_scores in ranked:
+        document = documents.get(document_id)
+        if document is None:
+            continue
+        score_of = {chunk_id: score for score, chunk_id in chunk_scores}
+        text_chunks = [chunks[c] for c in best_chunks[document_id] if c in chunks and c not in description_chunks]
+        texts = {}
+        if text_chunks and document_id in text_paths:
+            try:
+                texts = dict(zip(
+                    (chunk.id for chunk in text_chunks),
+                    read_spans(text_paths[document_id], [(chunk.start_byte, chunk.end_byte) for chunk in text_chunks])
+                ))
+            except OSError as e:
+                print(f"Could not read text of document {document_id} for snippets: {e}")
+        passages = []
+        for chunk_id in best_chunks[document_id]:
+            if chunk_id in description_chunks:
+                passage = dict(_snippet(document.description or "", pattern, 0), field="description")
+            elif chunk_id in texts:
+                passage = dict(_snippet(texts[chunk_id], pattern, chunks[chunk_id].start_byte), field="text")
+            else:
+                continue
+            passage["score"] = round(score_of[chunk_id], 4)
+            passages.append(passage)
+        hits.append({"document": document, "score": round(max(chunk_scores)[0], 4), "passages": passages})
+    return hits
@@ -0,0 +1,395 @@
+# Local mirror of the College Scorecard bulk data (institutions and fields of study).
+#
+# The Scorecard search source reads indexed local tables instead of calling the
+# Scorecard API, so it answers in milliseconds with real filters and paging (the API
+# is only a fallback while no data has been imported). Each import loads a new
+# generation next to the active one and switches over in one transaction, so
+# searches keep using the old data for the whole load. A refresh task in each web
+# process re-imports once the active data is older than SCORECARD_REFRESH_INTERVAL;
+# the import runs in a child process, the same as running it by hand:
+#
+#     python -m src.services.scorecard_service import [--institutions PATH_OR_URL] [--programs PATH_OR_URL]
+#
+# Data: https://collegescorecard.ed.gov/data/ ("Most Recent Institution-Level Data"
+# and "Most Recent Field of Study Data", CSV or the zip they are published in).
+
+import argparse
+import asyncio
+import csv
+import fnmatch
+import io
+import os
+import re
+import signal
+import sys
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from dotenv import load_dotenv
+
+from .. import async_crud, crud, database, migrations, models, schemas
+from .query_words import DEGREE_WORDS, STOP_WORDS
+
+load_dotenv()
+
+SCORECARD_INSTITUTIONS_CSV = os.getenv("SCORECARD_INSTITUTIONS_CSV", "") # Path or URL (CSV or zip); unset disables the mirror
+SCORECARD_PROGRAMS_CSV = os.getenv("SCORECARD_PROGRAMS_CSV", "") # Field-of-study file; defaults to the institutions zip
+SCORECARD_REFRESH_INTERVAL = float(os.getenv("SCORECARD_REFRESH_INTERVAL", str(7 * 24 * 3600))) # 0 disables the refresh task
+SCORECARD_REFRESH_CHECK_INTERVAL = float(os.getenv("SCORECARD_REFRESH_CHECK_INTERVAL", "3600"))
+SCORECARD_IMPORT_STALE_SECONDS = float(os.getenv("SCORECARD_IMPORT_STALE_SECONDS", str(6 * 3600))) # A 'loading' import this old is abandoned
+SCORECARD_PURGE_DELAY = float(os.getenv("SCORECARD_PURGE_DELAY", "300")) # Superseded rows outlive the switch-over by this long
+SCORECARD_IMPORT_BATCH_SIZE = int(os.getenv("SCORECARD_IMPORT_BATCH_SIZE", "5000"))
+SCORECARD_DOWNLOAD_TIMEOUT = float(os.getenv("SCORECARD_DOWNLOAD_TIMEOUT", "600"))
+ACTIVE_GENERATION_TTL = 30.0 # Seconds a process keeps using the generation it last looked up (< SCORECARD_PURGE_DELAY)
+
+INSTITUTIONS_MEMBER = "Most-Recent-Cohorts-Institution*.csv" # File names inside the published zips
+PROGRAMS_MEMBER = "Most-Recent-Cohorts-Field-of-Study*.csv"
+MISSING_VALUES = {"", "NULL", "NA", "PrivacySuppressed"}
+PROJECT_ROOT = Path(__file__).resolve().parents[2] # Working directory for the import child process
+
+# Scorecard CREDLEV codes
+CREDENTIAL_LEVELS = {
+    1: "Undergraduate Certificate or Diploma",
+    2: "Associate's Degree",
+    3: "Bachelor's Degree",
+    4: "Post-baccalaureate Certificate",
+    5: "Master's Degree",
+    6: "Doctoral Degree",
+    7: "First Professional Degree",
+    8: "Graduate/Professional Certificate",
+}
+
+# --- Import (runs in the child process or the CLI) ---
+
+def _download(url: str, directory: str) -> Path:
+    target = Path(directory) / (Path(urlparse(url).path).name or "scorecard.csv")
+    print(f"Downloading {url}")
+    with httpx.stream("GET", url, timeout=SCORECARD_DOWNLOAD_TIMEOUT, follow_redirects=True) as response:
+        response.raise_for_status()
+        with open(target, "wb") as f:
+            for chunk in response.iter_bytes(1024 * 1024):
+                f.write(chunk)
+    return target
+
+@contextmanager
+def _open_csv(path: Path, member_pattern: str) -> Iterator[csv.DictReader]:
+    """Reads a CSV file, or the newest member matching member_pattern of a zip archive, without unpacking it."""
+    if not zipfile.is_zipfile(path):
+        with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+            yield csv.DictReader(f)
+        return
+    with zipfile.ZipFile(path) as archive:
+        members = sorted(name for name in archive.namelist() if fnmatch.fnmatch(Path(name).name, member_pattern))
+        if not members:
+            raise ValueError(f"No file matching {member_pattern} in {path}")
+        with archive.open(members[-1]) as raw:
+            yield csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline=""))
+
+def _value(row: dict, key: str) -> Optional[str]:
+    value = (row.get(key) or "").strip()
+    return None if value in MISSING_VALUES else value
+
+def _int(row: dict, key: str) -> Optional[int]:
+    value = _value(row, key)
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+def _institution_rows(reader: csv.DictReader, generation: int, unit_ids: Set[int]) -> Iterator[dict]:
+    for row in reader:
+        unit_id, name = _int(row, "UNITID"), _value(row, "INSTNM")
+        if unit_id is None or name is None or unit_id in unit_ids:
+            continue
+        if _value(row, "CURROPER") == "0":
+            continue # Closed
+        unit_ids.add(unit_id)
+        yield {
+            "generation": generation,
+            "unit_id": unit_id,
+            "name": name,
+            "city": _value(row, "CITY"),
+            "state": _value(row, "STABBR"),
+            "url": _value(row, "INSTURL"),
+            "student_size": _int(row, "UGDS"),
+            "tuition_in_state": _int(row, "TUITIONFEE_IN"),
+            "tuition_out_of_state": _int(row, "TUITIONFEE_OUT"),
+        }
+
+def _program_rows(reader: csv.DictReader, generation: int, unit_ids: Set[int]) -> Iterator[dict]:
+    seen = set() # The file has one row per branch campus (OPEID6); keep one per school, CIP code and level
+    for row in reader:
+        unit_id, cip_code, cip_title = _int(row, "UNITID"), _value(row, "CIPCODE"), _value(row, "CIPDESC")
+        if unit_id not in unit_ids or cip_code is None or cip_title is None:
+            continue
+        cip_code = cip_code.replace(".", "").zfill(4)
+        credential_level = _int(row, "CREDLEV")
+        if (unit_id, cip_code, credential_level) in seen:
+            continue
+        seen.add((unit_id, cip_code, credential_level))
+        yield {
+            "generation": generation,
+            "unit_id": unit_id,
+            "cip_code": cip_code,
+            "cip_title": cip_title.rstrip(". "),
+            "credential_level": credential_level,
+            "credential_title": _value(row, "CREDDESC") or CREDENTIAL_LEVELS.get(credential_level),
+        }
+
+def _load(db, model, rows: Iterator[dict]) -> int:
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= SCORECARD_IMPORT_BATCH_SIZE:
+            crud.insert_scorecard_rows(db, model, batch)
+            count += len(batch)
+            batch = []
+    crud.insert_scorecard_rows(db, model, batch)
+    return count + len(batch)
+
+def purge_superseded() -> List[int]:
+    """Deletes the rows of generations superseded (or failed) more than SCORECARD_PURGE_DELAY ago."""
+    with database.SessionLocal() as db:
+        return crud.purge_scorecard_generations(db, datetime.utcnow() - timedelta(seconds=SCORECARD_PURGE_DELAY))
+
+def import_scorecard(institutions_source: Optional[str] = None, programs_source: Optional[str] = None) -> Optional[dict]:
+    """
+    Loads the bulk files as a new generation and makes it active. Returns
+    {"generation", "institutions", "programs", "seconds"}, or None if another import
+    is already running. Sources are paths or URLs to CSV files or zips containing them.
+    """
+    institutions_source = institutions_source or SCORECARD_INSTITUTIONS_CSV
+    programs_source = programs_source or SCORECARD_PROGRAMS_CSV
+    if not institutions_source:
+        raise ValueError("No Scorecard institution file configured (SCORECARD_INSTITUTIONS_CSV)")
+    started = time.perf_counter()
+    purge_superseded()
+    with database.SessionLocal() as db:
+        generation = crud.begin_scorecard_import(db, institutions_source, SCORECARD_IMPORT_STALE_SECONDS)
+        if generation is None:
+            print("Scorecard import skipped: another import is in progress")
+            return None
+        try:
+            with tempfile.TemporaryDirectory(prefix="scorecard-") as workdir:
+                def local(source: str) -> Path:
+                    return _download(source, workdir) if source.startswith(("http://", "https://")) else Path(source)
+
+                institutions_path = local(institutions_source)
+                unit_ids: Set[int] = set()
+                with _open_csv(institutions_path, INSTITUTIONS_MEMBER) as reader:
+                    institution_count = _load(db, models.ScorecardInstitution, _institution_rows(reader, generation, unit_ids))
+                if not institution_count:
+                    raise ValueError(f"No institutions found in {institutions_source}")
+
+                if programs_source and programs_source != institutions_source:
+                    programs_path = local(programs_source)
+                else:
+                    programs_path = institutions_path if zipfile.is_zipfile(institutions_path) else None
+                program_count = 0
+                if programs_path is not None:
+                    with _open_csv(programs_path, PROGRAMS_MEMBER) as reader:
+                        program_count = _load(db, models.ScorecardProgram, _program_rows(reader, generation, unit_ids))
+                else:
+                    print("No Scorecard field-of-study file configured (SCORECARD_PROGRAMS_CSV); importing schools only")
+
+            crud.activate_scorecard_import(db, generation, institution_count, program_count)
+        except BaseException as e: # Including SystemExit from SIGTERM: leave a failed import, not a 'loading' one
+            db.rollback()
+            crud.fail_scorecard_import(db, generation, f"{type(e).__name__}: {e}")
+            raise
+    seconds = time.perf_counter() - started
+    print(f"Imported Scorecard generation {generation}: {institution_count} schools, {program_count} programs in {seconds:.1f}s")
+    return {"generation": generation, "institutions": institution_count, "programs": program_count, "seconds": round(seconds, 1)}
+
+# --- Query interpretation ---
+
+US_STATES = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA", "colorado": "CO",
+    "connecticut": "CT", "delaware": "DE", "district of columbia": "DC", "florida": "FL", "georgia": "GA",
+    "hawaii": "HI", "idaho": "ID", "illinois": "IL", "indiana": "IN", "iowa": "IA", "kansas": "KS",
+    "kentucky": "KY", "louisiana": "LA", "maine": "ME", "maryland": "MD", "massachusetts": "MA",
+    "michigan": "MI", "minnesota": "MN", "mississippi": "MS", "missouri": "MO", "montana": "MT",
+    "nebraska": "NE", "nevada": "NV", "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM",
+    "new york": "NY", "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK",
+    "oregon": "OR", "pennsylvania": "PA", "puerto rico": "PR", "rhode island": "RI", "south carolina": "SC",
+    "south dakota": "SD", "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA",
+    "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+STATE_CODES = set(US_STATES.values())
+INSTITUTION_WORDS = {"university", "universities", "college", "colleges", "school", "schools", "institute", "campus"}
+
+@dataclass
+class ScorecardQuery:
+    program_terms: List[str] = field(default_factory=list) # Matched against program (CIP) titles
+    name_terms: List[str] = field(default_factory=list) # Matched against school names
+    state: Optional[str] = None
+    credential_level: Optional[int] = None
+
+def parse_query(query_text: str) -> ScorecardQuery:
+    """
+    Splits free text into search terms and filters: "in <state>" (name or code) and
+    uppercase state codes become a state filter, degree words a credential level.
+    Generic words are dropped; words like "university" only count towards school names.
+    """
+    parsed = ScorecardQuery()
+    tokens = re.findall(r"\w+(?:['.]\w+)*", query_text)
+    words = [token.casefold() for token in tokens]
+    index = 0
+    while index < len(tokens):
+        after_in = index > 0 and words[index - 1] == "in"
+        state_words = next((n for n in (3, 2, 1) if " ".join(words[index:index + n]) in US_STATES), 0)
+        if after_in and state_words and parsed.state is None:
+            parsed.state = US_STATES[" ".join(words[index:index + state_words])]
+            index += state_words
+            continue
+        token, word = tokens[index], words[index]
+        index += 1
+        if len(token) == 2 and token.upper() in STATE_CODES and (token.isupper() or after_in) and parsed.state is None:
+            parsed.state = token.upper()
+        elif word in DEGREE_WORDS:
+            parsed.credential_level = parsed.credential_level or DEGREE_WORDS[word]
+        elif word in STOP_WORDS:
+            continue
+        else:
+            parsed.name_terms.append(word)
+            if word not in INSTITUTION_WORDS:
+                parsed.program_terms.append(word)
+    return parsed
+
+# --- Search ---
+
+_active_generation: Tuple[Optional[int], float] = (None, float("-inf")) # (generation, monotonic time looked up)
+
+async def active_generation() -> Optional[int]:
+    """Generation searches should read, None until the first import. Looked up at most every ACTIVE_GENERATION_TTL seconds."""
+    global _active_generation
+    generation, checked_at = _active_generation
+    if time.monotonic() - checked_at < ACTIVE_GENERATION_TTL:
+        return generation
+    async with database.AsyncSessionLocal() as db:
+        active = await async_crud.get_active_scorecard_import(db)
+    generation = active.generation if active is not None else None
+    _active_generation = (generation, time.monotonic())
+    return generation
+
+async def search(query: schemas.SearchQuery, generation: int) -> List[Tuple[models.ScorecardInstitution, List[models.ScorecardProgram]]]:
+    """
+    One page of matching schools from an imported generation (see active_generation), each
+    with its matching programs (listed only when the query names a field or a degree level).
+    """
+    parsed = parse_query(query.query)
+    credential_level = query.credential_level or parsed.credential_level
+    async with database.AsyncSessionLocal() as db:
+        cip_codes = await async_crud.find_scorecard_cip_codes(db, generation, parsed.program_terms)
+        matches = await async_crud.search_scorecard_institutions(
+            db, generation, parsed.name_terms, cip_codes,
+            match_required=bool(parsed.program_terms),
+            credential_level=credential_level,
+            state=(query.state or parsed.state or "").upper() or None,
+            city=query.city,
+            max_tuition=query.max_tuition,
+            min_student_size=query.min_student_size,
+            max_student_size=query.max_student_size,
+            limit=query.page_size,
+            offset=(query.page - 1) * query.page_size,
+        )
+        programs = {}
+        if cip_codes or credential_level is not None:
+            programs = await async_crud.get_scorecard_programs(
+                db, generation, [institution.unit_id for institution, _ in matches], cip_codes, credential_level
+            )
+    return [(institution, programs.get(institution.unit_id, [])) for institution, _ in matches]
+
+# --- Refresh task (web processes) ---
+
+_refresh_task: Optional[asyncio.Task] = None
+_import_process: Optional[asyncio.subprocess.Process] = None
+
+def _reset_active_generation():
+    global _active_generation
+    _active_generation = (None, float("-inf"))
+
+async def _refresh_due() -> bool:
+    now = datetime.utcnow()
+    async with database.AsyncSessionLocal() as db:
+        if await async_crud.get_loading_scorecard_import(db, now - timedelta(seconds=SCORECARD_IMPORT_STALE_SECONDS)) is not None:
+            return False
+        active = await async_crud.get_active_scorecard_import(db)
+    return active is None or active.finished_at < now - timedelta(seconds=SCORECARD_REFRESH_INTERVAL)
+
+async def _run_import_process() -> int:
+    # A separate process: parsing the CSVs would otherwise hold this worker's GIL for minutes
+    global _import_process
+    _import_process = await asyncio.create_subprocess_exec(sys.executable, "-m", __name__, "import", cwd=PROJECT_ROOT)
+    try:
+        return await _import_process.wait()
+    finally:
+        _import_process = None
+
+async def _refresh_loop():
+    while True:
+        try:
+            if await _refresh_due():
+                print("Scorecard data is missing or out of date; starting an import")
+                returncode = await _run_import_process()
+                if returncode:
+                    print(f"Scorecard import exited with status {returncode}")
+                _reset_active_generation() # Switch this process over now rather than within ACTIVE_GENERATION_TTL
+            purged = await asyncio.to_thread(purge_superseded)
+            if purged:
+                print(f"Purged Scorecard generations {purged}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Scorecard refresh error: {e}")
+        await asyncio.sleep(SCORECARD_REFRESH_CHECK_INTERVAL)
+
+async def startup():
+    """Starts the refresh task if a data source is configured (the first check runs in the background)."""
+    global _refresh_task
+    if SCORECARD_INSTITUTIONS_CSV and SCORECARD_REFRESH_INTERVAL > 0:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+async def shutdown():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
+    process = _import_process
+    if process is not None and process.returncode is None:
+        process.terminate() # The import marks itself failed; its rows are purged later
+        try:
+            await asyncio.wait_for(process.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            process.kill()
+
+# --- Command line ---
+
+def main():
+    parser = argparse.ArgumentParser(description="College Scorecard mirror maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_command = commands.add_parser("import", help="Load the bulk files as a new generation and switch to it")
+    import_command.add_argument("--institutions", help="Institution-level CSV or zip (path or URL); default SCORECARD_INSTITUTIONS_CSV")
+    import_command.add_argument("--programs", help="Field-of-study CSV or zip (path or URL); default SCORECARD_PROGRAMS_CSV")
+    commands.add_parser("purge", help="Delete rows of superseded and failed imports")
+    args = parser.parse_args()
+
+    migrations.run_migrations(database.engine)
+    if args.command == "import":
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum)) # Unwind so the import is marked failed
+        import_scorecard(args.institutions, args.programs)
+    else:
+        print(f"Purged Scorecard generations {purge_superseded()}")
+
+if __name__ == "__main__":
+    main()
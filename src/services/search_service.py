@@ -2,14 +2,22 @@
 # It will interact with external APIs (Perplexity, US Scorecard, etc.)
 # and potentially trigger web scraping tasks.
 
+import asyncio
 import httpx
 import os
 import json # Added for parsing JSON responses
+import threading
+import time
+import unicodedata
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from typing import List, Optional # Added List, Optional
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple # Added List, Optional
 from urllib.parse import urlencode # Added for query string encoding
 
+from .. import metrics
+from ..cache import TTLCache
 from ..schemas import SearchQuery, SearchResultItem, SearchResponse
+from . import catalog_service, scorecard_service
 
 load_dotenv()
 
@@ -17,8 +25,77 @@ load_dotenv()
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY", "dummy_perplexity_key")
 SCOREBOARD_API_KEY = os.getenv("SCOREBOARD_API_KEY", "dummy_scoreboard_key") # Get a real key from https://collegescorecard.ed.gov/data/api-documentation/
 
-SCOREBOARD_API_BASE_URL = "https://api.data.gov/ed/collegescorecard/v1/schools.json"
-PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions" # Check actual endpoint
+# Overridable to point at a proxy or at local stand-ins (see benchmarks/stubs.py)
+SCOREBOARD_API_BASE_URL = os.getenv("SCOREBOARD_API_BASE_URL", "https://api.data.gov/ed/collegescorecard/v1/schools.json")
+PERPLEXITY_API_URL = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions") # Check actual endpoint
+
+# Timeouts (seconds). Each source gets its own budget, and the whole search is
+# bounded by SEARCH_DEADLINE so one slow upstream cannot hold the response hostage.
+SCOREBOARD_TIMEOUT = float(os.getenv("SCOREBOARD_TIMEOUT", "10"))
+SCOREBOARD_REMOTE_FALLBACK = os.getenv("SCOREBOARD_REMOTE_FALLBACK", "true").lower() == "true" # Use the API until the local mirror has data
+PERPLEXITY_TIMEOUT = float(os.getenv("PERPLEXITY_TIMEOUT", "40"))
+# httpx timeouts bound each read, so a trickling stream could run forever. This bounds
+# the whole streamed response; it outlives PERPLEXITY_TIMEOUT because callers that
+# join a shared (single-flight) call late are still waiting on it.
+PERPLEXITY_STREAM_DEADLINE = float(os.getenv("PERPLEXITY_STREAM_DEADLINE", str(2 * PERPLEXITY_TIMEOUT)))
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "45"))
+
+# Connection pool settings for the shared outbound HTTP client
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# Result caches, one per source so each gets its own TTL.
+# Scorecard data changes yearly; Perplexity answers drift faster.
+SCOREBOARD_CACHE_TTL = float(os.getenv("SCOREBOARD_CACHE_TTL", str(24 * 3600)))
+PERPLEXITY_CACHE_TTL = float(os.getenv("PERPLEXITY_CACHE_TTL", str(6 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2048"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+US_COUNTRY_NAMES = {"us", "usa", "u s", "u s a", "united states", "united states of america", "america"}
+SCOREBOARD_SOURCE = "US College Scorecard"
+PERPLEXITY_SOURCE = "Perplexity AI"
+PERPLEXITY_PARSE_ERROR_NAME = "Error Parsing Perplexity Response"
+PERPLEXITY_RAW_CONTENT_CHARS = 500 # Unparseable content echoed back in the parse-error result
+
+def _results_size(items: List[SearchResultItem]) -> int:
+    """Approximate memory footprint of a cached result list."""
+    return sum(len(item.model_dump_json()) for item in items) + 64
+
+scoreboard_cache = TTLCache("scoreboard", ttl=SCOREBOARD_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES, max_bytes=SEARCH_CACHE_MAX_BYTES, sizeof=_results_size)
+perplexity_cache = TTLCache("perplexity", ttl=PERPLEXITY_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES, max_bytes=SEARCH_CACHE_MAX_BYTES, sizeof=_results_size)
+
+def normalize_query(query_text: str) -> str:
+    """Cache key for a query: case-folded, unicode-normalized, whitespace-collapsed, trailing punctuation dropped."""
+    text = unicodedata.normalize("NFKC", query_text).casefold()
+    return " ".join(text.split()).strip(" .?!,;:")
+
+def _cache_key(query: SearchQuery) -> str:
+    """normalize_query of the text, plus any paging/filter fields that differ from their defaults."""
+    options = query.model_dump(exclude={"query"}, exclude_defaults=True)
+    if not options:
+        return normalize_query(query.query)
+    return normalize_query(query.query) + " " + json.dumps(options, sort_keys=True)
+
+def _perplexity_query(query: SearchQuery) -> SearchQuery:
+    """
+    The part of query Perplexity answers: its text, country and page (it only answers
+    page 1). Page size and the Scorecard filters never reach the prompt, so they are
+    dropped rather than splitting its cache and catalog entries.
+    """
+    return SearchQuery(query=query.query, country=query.country, page=query.page)
+
+class PartialResults(list):
+    """Results of a response that broke off or ended in unparseable text: returned to the caller, never cached."""
+
+def _is_cacheable(items: List[SearchResultItem]) -> bool:
+    # Sources swallow upstream errors and return [] (or a parse-error stub); don't pin those
+    if isinstance(items, PartialResults):
+        return False
+    return bool(items) and not any(item.program_name == PERPLEXITY_PARSE_ERROR_NAME for item in items)
+
+def cache_stats() -> dict:
+    return {cache.name: cache.stats() for cache in (scoreboard_cache, perplexity_cache)}
 
 # Define fields to request from College Scorecard API
 # See: https://collegescorecard.ed.gov/data/documentation/
@@ -35,50 +112,273 @@ SCOREBOARD_FIELDS = [
     # e.g., fields related to specific CIP codes if user query allows mapping
 ]
 
-async def _call_scoreboard_api(query_text: str) -> List[SearchResultItem]:
-    """Queries the US College Scorecard API."""
+# --- Shared HTTP client ---
+# One long-lived AsyncClient per process, so searches reuse pooled TCP/TLS
+# connections instead of paying a fresh handshake per upstream call.
+# Opened/closed by the app lifespan in main.py (see startup()/shutdown()).
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_lock = threading.Lock() # Built from a thread at startup, and lazily on the loop
+_http_client_warmup: Optional[asyncio.Task] = None
+
+def _build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(max(SCOREBOARD_TIMEOUT, PERPLEXITY_TIMEOUT), connect=10.0),
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it lazily if the lifespan hook has not run (e.g. scripts)."""
+    global _http_client
+    client = _http_client
+    if client is None or client.is_closed:
+        with _http_client_lock:
+            if _http_client is None or _http_client.is_closed:
+                _http_client = _build_http_client()
+            client = _http_client
+    return client
+
+async def startup() -> None:
+    # Building the client loads the CA bundle (~100 ms); do it in a thread so the
+    # worker starts serving without waiting for it
+    global _http_client_warmup
+    _http_client_warmup = asyncio.create_task(asyncio.to_thread(get_http_client))
+
+async def shutdown() -> None:
+    global _http_client, _http_client_warmup
+    if _http_client_warmup is not None:
+        await asyncio.gather(_http_client_warmup, return_exceptions=True) # Threads can't be cancelled
+        _http_client_warmup = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def _send(source: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """Sends a request on the shared client, recording its latency and outcome under source."""
+    outcome = "error"
+    started = time.perf_counter()
+    try:
+        response = await get_http_client().request(method, url, **kwargs)
+        outcome = "success" if response.is_success else f"http_{response.status_code // 100}xx"
+        return response
+    except httpx.TimeoutException:
+        outcome = "timeout"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled" # Search deadline expired or the client went away
+        raise
+    finally:
+        metrics.observe_upstream(source, outcome, time.perf_counter() - started)
+
+@asynccontextmanager
+async def _open_stream(source: str, method: str, url: str, deadline: Optional[float] = None, **kwargs) -> AsyncIterator[httpx.Response]:
+    """
+    Streaming counterpart of _send: read the body inside the block; the metrics cover the whole stream.
+    If the block is still running after deadline seconds, the response is closed and TimeoutError raised.
+    """
+    outcome = "error"
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(deadline):
+            async with get_http_client().stream(method, url, **kwargs) as response:
+                outcome = "success" if response.is_success else f"http_{response.status_code // 100}xx"
+                yield response
+    except (httpx.TimeoutException, TimeoutError):
+        outcome = "timeout"
+        raise
+    except httpx.TransportError:
+        outcome = "error" # Includes a connection lost mid-body
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        metrics.observe_upstream(source, outcome, time.perf_counter() - started)
+
+class IncrementalJsonArrayParser:
+    """
+    Pulls the objects out of a JSON array while its text is still arriving.
+
+    feed() takes the next chunk of text and returns the objects it completed.
+    Anything before the opening '[' (prose, a ```json fence) is skipped, and an
+    object that does not parse is dropped (counted in `skipped`) without
+    affecting the ones around it.
+    """
+
+    def __init__(self):
+        self.skipped = 0
+        self.complete = False # Seen the array's closing ']'
+        self._started = False # Seen the opening '['
+        self._depth = 0 # Nesting below the array; 0 = between items
+        self._in_string = False
+        self._escaped = False
+        self._capturing = False # Inside an object item
+        self._item: List[str] = [] # Its text so far, from earlier chunks
+
+    @property
+    def tail(self) -> str:
+        """Text of the unfinished object, if any (for diagnostics)."""
+        return "".join(self._item)
+
+    def feed(self, chunk: str) -> List[Any]:
+        objects = []
+        start = 0 # Where the object being captured begins in this chunk
+        for index, char in enumerate(chunk):
+            if self.complete:
+                break
+            if not self._started:
+                self._started = char == "["
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._capturing = True
+                    start = index
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    self.complete = char == "]"
+                    continue
+                self._depth -= 1
+                if self._depth == 0 and self._capturing:
+                    self._item.append(chunk[start:index + 1])
+                    text = "".join(self._item)
+                    self._item, self._capturing = [], False
+                    try:
+                        objects.append(json.loads(text))
+                    except json.JSONDecodeError:
+                        self.skipped += 1
+        if self._capturing:
+            self._item.append(chunk[start:]) # Continues in the next chunk
+        return objects
+
+def _scorecard_result(institution, programs) -> SearchResultItem:
+    """Maps a school from the local Scorecard mirror (with its matching programs) to a result."""
+    def dollars(amount):
+        return f"${amount:,}" if amount is not None else "N/A"
+
+    location = ", ".join(part for part in (institution.city, institution.state) if part) or "N/A"
+    size = f"{institution.student_size:,}" if institution.student_size is not None else "N/A"
+    description = f"Located in {location}. Student size: {size}."
+    titles = [f"{program.cip_title} ({program.credential_title})" if program.credential_title else program.cip_title for program in programs]
+    if titles:
+        description += " Matching programs: " + "; ".join(titles[:5]) + (f" and {len(titles) - 5} more." if len(titles) > 5 else ".")
+    url = institution.url
+    if url and not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    return SearchResultItem(
+        program_name=titles[0] if titles else f"Programs at {institution.name}",
+        university_name=institution.name,
+        country="USA",
+        url=url,
+        description=description,
+        tuition_fees=f"In-state: {dollars(institution.tuition_in_state)}, Out-of-state: {dollars(institution.tuition_out_of_state)}",
+        source=SCOREBOARD_SOURCE,
+    )
+
+async def _search_scorecard_mirror(query: SearchQuery, generation: int) -> List[SearchResultItem]:
+    matches = await scorecard_service.search(query, generation)
+    return [_scorecard_result(institution, programs) for institution, programs in matches]
+
+async def _search_scorecard(query: SearchQuery, on_item: Optional[Callable[[SearchResultItem], None]] = None) -> List[SearchResultItem]:
+    """
+    Answers from the local College Scorecard mirror (scorecard_service). The API is
+    only called while the mirror has no data yet. Both go through scoreboard_cache;
+    mirror results are keyed by generation, so a refresh never serves stale entries.
+    Neither arrives incrementally, so on_item is never called: the final list is the only report.
+    """
+    if query.country and catalog_service.normalize_text(query.country) not in US_COUNTRY_NAMES:
+        return [] # Scorecard only covers US schools
+    try:
+        generation = await scorecard_service.active_generation()
+        if generation is not None:
+            return await scoreboard_cache.get_or_load(
+                f"mirror:{generation}:{_cache_key(query)}", lambda: _search_scorecard_mirror(query, generation), should_cache=_is_cacheable
+            )
+    except Exception as e:
+        print(f"Local Scorecard search failed: {e}")
+    if not SCOREBOARD_REMOTE_FALLBACK:
+        return []
+    return await scoreboard_cache.get_or_load(
+        _cache_key(query), lambda: _load_source(SCOREBOARD_SOURCE, _call_scoreboard_api, query, scoreboard_cache.ttl), should_cache=_is_cacheable
+    )
+
+async def _call_scoreboard_api(query: SearchQuery, on_item: Optional[Callable[[SearchResultItem], None]] = None) -> List[SearchResultItem]:
+    """Queries the US College Scorecard API (fallback for the local mirror; degree level is not filtered)."""
     results = []
-    # Basic keyword extraction (can be improved with NLU)
-    keywords = query_text.split()
-    search_term = " ".join(k for k in keywords if k.lower() not in ["us", "usa", "in", "the", "a", "for"])
+    # Same keyword/state extraction as the local mirror
+    parsed = scorecard_service.parse_query(query.query)
+    search_term = " ".join(parsed.name_terms)
 
     params = {
         "api_key": SCOREBOARD_API_KEY,
         "school.name": search_term, # Simple name search for now
         "fields": ",".join(SCOREBOARD_FIELDS),
-        "per_page": 5 # Limit results for now
+        "page": query.page - 1, # The API counts pages from 0
+        "per_page": query.page_size,
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Querying Scoreboard: {SCOREBOARD_API_BASE_URL}?{urlencode(params)}")
-            response = await client.get(SCOREBOARD_API_BASE_URL, params=params, timeout=20.0)
-            response.raise_for_status() # Raise exception for bad status codes
-            data = response.json()
-
-            for school in data.get("results", []):
-                results.append(
-                    SearchResultItem(
-                        program_name=f"Programs at {school.get('school.name', 'N/A')}", # Scorecard is school-level
-                        university_name=school.get("school.name", "N/A"),
-                        country="USA",
-                        url=school.get("school.school_url", None),
-                        description=f"Located in {school.get(	'school.city', 'N/A')}, {school.get(	'school.state', 'N/A')}. Student size: {school.get(	'latest.student.size', 'N/A')}",
-                        tuition_fees=f"In-state: ${school.get(	'latest.cost.tuition.in_state', 'N/A')}, Out-of-state: ${school.get(	'latest.cost.tuition.out_of_state', 'N/A')}",
-                        source="US College Scorecard"
-                    )
+    state = query.state or parsed.state
+    if state:
+        params["school.state"] = state.upper()
+    if query.city:
+        params["school.city"] = query.city
+    if query.max_tuition is not None:
+        params["latest.cost.tuition.out_of_state__range"] = f"..{query.max_tuition}"
+    if query.min_student_size is not None or query.max_student_size is not None:
+        low, high = (str(size) if size is not None else "" for size in (query.min_student_size, query.max_student_size))
+        params["latest.student.size__range"] = f"{low}..{high}" # Open-ended ranges leave a side empty
+    try:
+        print(f"Querying Scoreboard: {SCOREBOARD_API_BASE_URL}?{urlencode(params)}")
+        response = await _send(SCOREBOARD_SOURCE, "GET", SCOREBOARD_API_BASE_URL, params=params, timeout=SCOREBOARD_TIMEOUT)
+        response.raise_for_status() # Raise exception for bad status codes
+        data = response.json()
+
+        for school in data.get("results", []):
+            results.append(
+                SearchResultItem(
+                    program_name=f"Programs at {school.get('school.name', 'N/A')}", # Scorecard is school-level
+                    university_name=school.get("school.name", "N/A"),
+                    country="USA",
+                    url=school.get("school.school_url", None),
+                    description=f"Located in {school.get('school.city', 'N/A')}, {school.get('school.state', 'N/A')}. Student size: {school.get('latest.student.size', 'N/A')}",
+                    tuition_fees=f"In-state: ${school.get('latest.cost.tuition.in_state', 'N/A')}, Out-of-state: ${school.get('latest.cost.tuition.out_of_state', 'N/A')}",
+                    source=SCOREBOARD_SOURCE
                 )
-        except httpx.HTTPStatusError as e:
-            print(f"Scoreboard API request failed: {e.response.status_code} - {e.response.text}")
-        except httpx.RequestError as e:
-            print(f"Scoreboard API request failed: {e}")
-        except json.JSONDecodeError as e:
-            print(f"Failed to decode Scoreboard API response: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred querying Scoreboard: {e}")
+            )
+    except httpx.TimeoutException:
+        raise # Let the source runner report this source as timed out
+    except httpx.HTTPStatusError as e:
+        print(f"Scoreboard API request failed: {e.response.status_code} - {e.response.text}")
+    except httpx.RequestError as e:
+        print(f"Scoreboard API request failed: {e}")
+    except json.JSONDecodeError as e:
+        print(f"Failed to decode Scoreboard API response: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred querying Scoreboard: {e}")
     return results
 
-async def _call_perplexity_api(query_text: str) -> List[SearchResultItem]:
-    """Queries the Perplexity API for broader search, especially non-US."""
+async def _call_perplexity_api(query: SearchQuery, on_item: Optional[Callable[[SearchResultItem], None]] = None) -> List[SearchResultItem]:
+    """
+    Queries the Perplexity API for broader search, especially non-US.
+
+    The completion is streamed and parsed as it arrives: each result is passed to
+    on_item as soon as its JSON object closes. If the stream breaks off or its tail
+    is malformed, the results parsed so far are still returned (as PartialResults).
+    Its answer is not paged, so it only contributes to the first page.
+    """
+    if query.page > 1:
+        return []
+    query_text = f"{query.query} (in {query.country})" if query.country else query.query
     results = []
     headers = {
         "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
@@ -118,75 +418,290 @@ async def _call_perplexity_api(query_text: str) -> List[SearchResultItem]:
         "messages": [
             {"role": "system", "content": "You are an AI assistant helping find university programs. Respond ONLY with the requested JSON list."}, # System prompt to guide output format
             {"role": "user", "content": prompt}
-        ]
+        ],
+        "stream": True, # Server-sent events with content deltas
         # Add parameters for temperature, max_tokens etc. if needed
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Querying Perplexity API...")
-            response = await client.post(PERPLEXITY_API_URL, headers=headers, json=payload, timeout=60.0)
-            response.raise_for_status()
-            api_response = response.json()
-
-            # Extract the content from the response
-            content = api_response.get("choices", [{}])[0].get("message", {}).get("content", "")
-            print(f"Perplexity Raw Response Content: {content}")
-
-            # Attempt to parse the JSON content
-            try:
-                # Clean potential markdown/fencing
-                if content.startswith("```json"): content = content[7:]
-                if content.endswith("```"): content = content[:-3]
-                content = content.strip()
-
-                parsed_json = json.loads(content)
-                if isinstance(parsed_json, list):
-                    for item in parsed_json:
-                        # Validate and map to SearchResultItem
-                        if isinstance(item, dict) and "program_name" in item and "university_name" in item:
-                            results.append(
-                                SearchResultItem(
-                                    program_name=item.get("program_name"),
-                                    university_name=item.get("university_name"),
-                                    country=item.get("country"),
-                                    url=item.get("url"),
-                                    description=item.get("description"),
-                                    tuition_fees=item.get("tuition_fees"),
-                                    intake_dates=item.get("intake_dates"),
-                                    visa_support=item.get("visa_support"),
-                                    source="Perplexity AI"
-                                )
-                            )
-            except json.JSONDecodeError as json_err:
-                print(f"Failed to parse JSON from Perplexity response: {json_err}. Content was: {content}")
-                # Optionally, add a generic result indicating failure to parse
-                results.append(SearchResultItem(program_name="Error Parsing Perplexity Response", university_name="N/A", source="Perplexity AI", description=content[:500])) # Include partial raw content
-
-        except httpx.HTTPStatusError as e:
-            print(f"Perplexity API request failed: {e.response.status_code} - {e.response.text}")
-        except httpx.RequestError as e:
-            print(f"Perplexity API request failed: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred querying Perplexity: {e}")
+    parser = IncrementalJsonArrayParser()
+    raw_content = [] # Start of the content, echoed back if nothing in it parses
+    raw_length = 0
+
+    def consume(text: str):
+        nonlocal raw_length
+        if raw_length < PERPLEXITY_RAW_CONTENT_CHARS:
+            raw_content.append(text[:PERPLEXITY_RAW_CONTENT_CHARS - raw_length])
+        raw_length += len(text)
+        for item in parser.feed(text):
+            # Validate and map to SearchResultItem
+            if isinstance(item, dict) and "program_name" in item and "university_name" in item:
+                try:
+                    result = SearchResultItem(
+                        program_name=item.get("program_name"),
+                        university_name=item.get("university_name"),
+                        country=item.get("country"),
+                        url=item.get("url"),
+                        description=item.get("description"),
+                        tuition_fees=item.get("tuition_fees"),
+                        intake_dates=item.get("intake_dates"),
+                        visa_support=item.get("visa_support"),
+                        source="Perplexity AI"
+                    )
+                except ValueError as e:
+                    parser.skipped += 1
+                    print(f"Skipping invalid Perplexity result: {e}")
+                    continue
+                results.append(result)
+                if on_item is not None:
+                    on_item(result)
+
+    try:
+        print(f"Querying Perplexity API...")
+        async with _open_stream(
+            PERPLEXITY_SOURCE, "POST", PERPLEXITY_API_URL, deadline=PERPLEXITY_STREAM_DEADLINE,
+            headers=headers, json=payload, timeout=PERPLEXITY_TIMEOUT,
+        ) as response:
+            if not response.is_success:
+                await response.aread()
+                response.raise_for_status()
+            if response.headers.get("content-type", "").startswith("text/event-stream"):
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue # Blank separators, comments, event names
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        choice = json.loads(data)["choices"][0]
+                        text = (choice.get("delta") or choice.get("message") or {}).get("content") or ""
+                    except (json.JSONDecodeError, LookupError, TypeError, AttributeError):
+                        print(f"Skipping malformed Perplexity stream event: {data[:200]}")
+                        continue
+                    consume(text)
+            else:
+                # Upstream (or a proxy) ignored "stream": parse the whole completion the same way
+                api_response = json.loads(await response.aread())
+                consume(api_response.get("choices", [{}])[0].get("message", {}).get("content", ""))
+    except (httpx.TimeoutException, TimeoutError):
+        raise # Let the source runner report this source as timed out (results already passed to on_item are kept)
+    except httpx.HTTPStatusError as e:
+        print(f"Perplexity API request failed: {e.response.status_code} - {e.response.text}")
+    except httpx.RequestError as e:
+        print(f"Perplexity API request failed after {len(results)} results: {e}") # e.g. connection dropped mid-stream
+        return PartialResults(results)
+    except Exception as e:
+        print(f"An unexpected error occurred querying Perplexity: {e}")
+        return PartialResults(results)
+
+    print(f"Perplexity streamed {raw_length} characters: {len(results)} results, {parser.skipped} skipped")
+    if not parser.complete or parser.skipped:
+        if not results and raw_length:
+            content = "".join(raw_content)
+            print(f"Failed to parse JSON from Perplexity response. Content was: {content}")
+            # Optionally, add a generic result indicating failure to parse
+            results.append(SearchResultItem(program_name=PERPLEXITY_PARSE_ERROR_NAME, university_name="N/A", source="Perplexity AI", description=content[:500])) # Include partial raw content
+            return results
+        return PartialResults(results) # Keep what parsed, but don't cache a truncated list
 
     return results
 
+# Sources fanned out by perform_advanced_search:
+#   (name, coroutine function, per-source timeout, result cache, query scope)
+# Each fetch(query, on_item) returns its full result list; streaming sources
+# (Perplexity) also hand every result to on_item as soon as it arrives, while the
+# others (Scorecard: one mirror query or API response) ignore on_item and only
+# report their final list, in a single frame on /search/stream. Sources listed without
+# a cache manage their own (and their own use of the program catalog). A scope
+# reduces the query to the fields the source uses; its cache and catalog entries
+# are keyed on that (no scope: every field).
+SEARCH_SOURCES = [
+    (SCOREBOARD_SOURCE, _search_scorecard, SCOREBOARD_TIMEOUT, None, None), # Caches internally (mirror and API fallback)
+    (PERPLEXITY_SOURCE, _call_perplexity_api, PERPLEXITY_TIMEOUT, perplexity_cache, _perplexity_query),
+]
+
+async def _load_source(name: str, fetch, query: SearchQuery, max_age: float, on_item=None) -> List[SearchResultItem]:
+    """
+    Answers from the program catalog when it covers the query, otherwise calls the
+    upstream and adds what it returns to the catalog. max_age (the source's cache TTL)
+    bounds how old a stored answer to this exact query may be.
+    """
+    query_key = _cache_key(query)
+    try:
+        items = await catalog_service.lookup(name, query, query_key, max_age)
+    except Exception as e:
+        print(f"Catalog lookup for '{name}' failed: {e}")
+        items = None
+    if items is not None:
+        return items
+    items = await fetch(query, on_item)
+    catalog_service.record(
+        name, query_key, [item for item in items if item.program_name != PERPLEXITY_PARSE_ERROR_NAME], complete=_is_cacheable(items)
+    )
+    return items
+
+async def _run_source(
+    name: str, fetch, query: SearchQuery, timeout: float, cache: Optional[TTLCache],
+    scope: Optional[Callable[[SearchQuery], SearchQuery]] = None, on_item=None,
+) -> List[SearchResultItem]:
+    """
+    Runs one source under its own timeout, answering from its cache, then the program
+    catalog, when possible. Identical concurrent queries share one upstream call (only
+    the caller that started it receives on_item calls). Raises asyncio.TimeoutError if
+    it runs out of time.
+    """
+    if scope is not None:
+        query = scope(query)
+    try:
+        if cache is None:
+            load = fetch(query, on_item)
+        else:
+            load = cache.get_or_load(_cache_key(query), lambda: _load_source(name, fetch, query, cache.ttl, on_item), should_cache=_is_cacheable)
+        return list(await asyncio.wait_for(load, timeout=timeout))
+    except httpx.TimeoutException as e:
+        raise asyncio.TimeoutError(str(e)) from e
+
+async def _iter_sources(
+    query: SearchQuery, deadline: float = SEARCH_DEADLINE, on_item: Optional[Callable[[str, SearchResultItem], None]] = None
+) -> AsyncIterator[Tuple[str, List[SearchResultItem], bool]]:
+    """
+    Runs every source concurrently and yields (source, results, timed_out) as each one finishes.
+    Sources still running when the overall deadline expires are cancelled and yielded as timed out,
+    with whatever results they had already streamed. on_item(source, item) sees each streamed result.
+    """
+    received = {name: [] for name, *_ in SEARCH_SOURCES} # Streamed so far, kept if the source times out
+    # Sources already reported. A shared (cached) load outlives a caller that timed out,
+    # so its later on_item calls are dropped here rather than fed to an abandoned consumer.
+    reported = set()
+
+    def collector(name: str):
+        def collect(item: SearchResultItem):
+            if name in reported:
+                return
+            received[name].append(item)
+            if on_item is not None:
+                on_item(name, item)
+        return collect
+
+    tasks = {
+        asyncio.create_task(_run_source(name, fetch, query, timeout, cache, scope, collector(name))): name
+        for name, fetch, timeout, cache, scope in SEARCH_SOURCES
+    }
+    loop_deadline = time.monotonic() + deadline
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = loop_deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                reported.add(name)
+                try:
+                    yield name, task.result(), False
+                except asyncio.TimeoutError:
+                    print(f"Search source '{name}' timed out after {len(received[name])} results")
+                    yield name, list(received[name]), True
+                except Exception as e:
+                    print(f"Search source '{name}' failed: {e}")
+                    yield name, list(received[name]), False
+        for task in pending:
+            name = tasks[task]
+            reported.add(name)
+            print(f"Search source '{name}' missed the {deadline}s search deadline after {len(received[name])} results")
+            yield name, list(received[name]), True
+    finally:
+        reported.update(tasks.values())
+        for task in pending:
+            task.cancel()
+
+def _build_summary(query_text: str, counts: dict, timed_out_sources: List[str]) -> str:
+    total = sum(counts.values())
+    summary = f"Found {total} potential results for '{query_text}'. {counts.get(SCOREBOARD_SOURCE, 0)} from US Scorecard, {counts.get(PERPLEXITY_SOURCE, 0)} from Perplexity AI. (Summary needs improvement)"
+    if timed_out_sources:
+        summary += f" Partial results: {', '.join(timed_out_sources)} timed out."
+    return summary
+
 async def perform_advanced_search(query: SearchQuery) -> SearchResponse:
     """Processes the natural language query and returns structured search results."""
     print(f"Received search query: {query.query}")
 
-    # Query Data Sources concurrently (using asyncio.gather could be an option)
-    us_results = await _call_scoreboard_api(query.query)
-    perplexity_results = await _call_perplexity_api(query.query)
+    # Query Data Sources concurrently; slow sources are reported instead of awaited
+    results_by_source = {}
+    timed_out_sources = []
+    async for source, items, timed_out in _iter_sources(query):
+        results_by_source[source] = items
+        if timed_out:
+            timed_out_sources.append(source)
 
-    # Combine and Format Results (simple concatenation for now)
-    combined_results = us_results + perplexity_results
+    # Combine and Format Results (simple concatenation for now, in source order)
+    combined_results = [item for name, *_ in SEARCH_SOURCES for item in results_by_source.get(name, [])]
 
     # Generate Summary (Optional: Use LLM)
-    summary = f"Found {len(combined_results)} potential results for '{query.query}'. {len(us_results)} from US Scorecard, {len(perplexity_results)} from Perplexity AI. (Summary needs improvement)"
+    counts = {name: len(items) for name, items in results_by_source.items()}
+    summary = _build_summary(query.query, counts, timed_out_sources)
+
+    return SearchResponse(results=combined_results, summary=summary, timed_out_sources=timed_out_sources)
+
+async def stream_advanced_search(query: SearchQuery) -> AsyncIterator[dict]:
+    """
+    Same search as perform_advanced_search, but yields frames as results arrive:
+      {"type": "results", "source": ..., "partial": bool, "timed_out": bool, "results": [SearchResultItem, ...]}
+    Streaming sources send a `partial` frame per result as it is parsed; every source
+    ends with one frame with partial=false holding its remaining results, so a source's
+    results are the concatenation of its frames. Then one final
+      {"type": "summary", "summary": ..., "total": int, "timed_out_sources": [...]}
+    """
+    print(f"Received streaming search query: {query.query}")
+    counts = {}
+    timed_out_sources = []
+    events: asyncio.Queue = asyncio.Queue() # ("item", source, item) / ("done", source, (items, timed_out)) / ("end", None, error)
 
-    return SearchResponse(results=combined_results, summary=summary)
+    async def run_sources():
+        error = None
+        try:
+            async for source, items, timed_out in _iter_sources(
+                query, on_item=lambda source, item: events.put_nowait(("item", source, item))
+            ):
+                events.put_nowait(("done", source, (items, timed_out)))
+        except Exception as e:
+            error = e
+        events.put_nowait(("end", None, error))
+
+    runner = asyncio.create_task(run_sources())
+    streamed = {}
+    try:
+        while True:
+            kind, source, payload = await events.get()
+            if kind == "end":
+                if payload is not None:
+                    raise payload
+                break
+            if source in counts:
+                continue # Late result from a source already reported (timed out, load still running)
+            if kind == "item":
+                streamed[source] = streamed.get(source, 0) + 1
+                yield {"type": "results", "source": source, "partial": True, "timed_out": False, "results": [payload.model_dump(mode="json")]}
+                continue
+            items, timed_out = payload
+            counts[source] = len(items)
+            if timed_out:
+                timed_out_sources.append(source)
+            yield {
+                "type": "results",
+                "source": source,
+                "partial": False,
+                "timed_out": timed_out,
+                "results": [item.model_dump(mode="json") for item in items[streamed.get(source, 0):]], # Streamed items are a prefix
+            }
+    finally:
+        runner.cancel()
+    yield {
+        "type": "summary",
+        "summary": _build_summary(query.query, counts, timed_out_sources),
+        "total": sum(counts.values()),
+        "timed_out_sources": timed_out_sources,
+    }
 
 # Placeholder for scraping logic - to be implemented if needed
 # async def scrape_university_site(url: str) -> Optional[SearchResultItem]:
@@ -0,0 +1,208 @@
+# Streaming multipart upload handling for documents.
+# Parses the request body as it arrives and writes the file part straight to a
+# temp file in its final directory (no spooling to an intermediate file), hashing
+# and counting bytes on the way, then renames it into place atomically.
+
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+from anyio import to_thread
+from fastapi import Request
+
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError: # Older python-multipart releases
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+WRITE_CHUNK_SIZE = 1024 * 1024 # Coalesce parser output into ~1 MB writes (fewer thread hops)
+MAX_FIELD_BYTES = 64 * 1024 # Non-file form fields (e.g. description)
+MULTIPART_OVERHEAD_BYTES = 64 * 1024 # Slack for boundaries/headers when checking Content-Length
+
+class UploadError(Exception):
+    """The request body is not a usable multipart upload."""
+
+class UploadTooLarge(UploadError):
+    """The uploaded file exceeds the configured maximum size."""
+
+@dataclass
+class StoredUpload:
+    path: Path
+    filename: str # Client-supplied name, sanitized
+    size_bytes: int
+    sha256: str
+    content_type: Optional[str]
+    fields: Dict[str, str] = field(default_factory=dict) # Other (small) form fields
+
+def sanitize_filename(filename: str) -> str:
+    # Basic sanitization - replace spaces, avoid path traversal
+    safe = filename.replace(" ", "_").replace("/", "_").replace("\\", "_")
+    return safe.lstrip(".") or "upload"
+
+def file_sha256(path) -> str:
+    """Hashes a stored file (for documents uploaded before hashes were recorded)."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(WRITE_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class _MultipartFileReceiver:
+    """python-multipart callbacks: buffers file bytes for the async writer, keeps small fields in memory."""
+
+    def __init__(self, file_field: str, max_bytes: int):
+        self.file_field = file_field
+        self.max_bytes = max_bytes
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.file_bytes = 0
+        self.file_done = False
+        self.pending: list = [] # File data not yet written
+        self.pending_bytes = 0
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._part_name: Optional[str] = None
+        self._part_is_file = False
+        self._field_data = bytearray()
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._part_name = None
+        self._part_is_file = False
+        self._field_data = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadError('Multipart part without a "name" in Content-Disposition')
+        self._part_name = options[b"name"].decode("utf-8", "replace")
+        if self._part_name == self.file_field and b"filename" in options:
+            if self.filename is not None:
+                raise UploadError(f"Only one '{self.file_field}' part is allowed")
+            self._part_is_file = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            content_type = self._headers.get(b"content-type")
+            self.content_type = content_type.decode("latin-1") if content_type else None
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        if self._part_is_file:
+            self.file_bytes += len(chunk)
+            if self.file_bytes > self.max_bytes:
+                raise UploadTooLarge(f"File exceeds the maximum upload size of {self.max_bytes} bytes")
+            self.pending.append(chunk)
+            self.pending_bytes += len(chunk)
+        else:
+            if len(self._field_data) + len(chunk) > MAX_FIELD_BYTES:
+                raise UploadError(f"Form field '{self._part_name}' is too large")
+            self._field_data.extend(chunk)
+
+    def on_part_end(self):
+        if self._part_is_file:
+            self.file_done = True
+        elif self._part_name is not None:
+            self.fields[self._part_name] = self._field_data.decode("utf-8", "replace")
+
+    def take_pending(self) -> bytes:
+        data = b"".join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        return data
+
+async def receive_upload(
+    request: Request,
+    dest_dir: Path,
+    file_field: str = "file",
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> StoredUpload:
+    """
+    Streams a multipart/form-data request into dest_dir.
+
+    The file part is written in WRITE_CHUNK_SIZE pieces on a worker thread while the
+    body is still arriving; SHA-256 and size are computed on the same pass. Oversized
+    uploads are refused from Content-Length before reading, or as soon as the limit is
+    crossed. On any failure the partial file is removed.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data body")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLarge(f"File exceeds the maximum upload size of {max_bytes} bytes")
+
+    await to_thread.run_sync(lambda: dest_dir.mkdir(parents=True, exist_ok=True))
+    temp_path = dest_dir / f".upload-{uuid.uuid4().hex}.part" # Same directory, so the final rename is atomic
+    hasher = hashlib.sha256()
+    receiver = _MultipartFileReceiver(file_field, max_bytes)
+    parser = MultipartParser(params[b"boundary"], receiver.callbacks())
+    file_object = await to_thread.run_sync(open, temp_path, "xb")
+
+    def write(data: bytes):
+        file_object.write(data)
+        hasher.update(data)
+
+    try:
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if receiver.pending_bytes >= WRITE_CHUNK_SIZE:
+                    await to_thread.run_sync(write, receiver.take_pending())
+            parser.finalize()
+        except FormParserError as e:
+            raise UploadError(f"Malformed multipart body: {e}") from e
+        if receiver.pending_bytes:
+            await to_thread.run_sync(write, receiver.take_pending())
+        await to_thread.run_sync(file_object.close)
+
+        if receiver.filename is None or not receiver.file_done:
+            raise UploadError(f"Missing '{file_field}' file part")
+        filename = sanitize_filename(receiver.filename)
+        # Unique prefix instead of probing for a free name
+        final_path = dest_dir / f"{uuid.uuid4().hex[:12]}_{filename}"
+        await to_thread.run_sync(os.replace, temp_path, final_path)
+    except BaseException:
+        file_object.close()
+        try:
+            temp_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+    return StoredUpload(
+        path=final_path,
+        filename=filename,
+        size_bytes=receiver.file_bytes,
+        sha256=hasher.hexdigest(),
+        content_type=receiver.content_type,
+        fields=receiver.fields,
+    )
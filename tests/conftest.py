@@ -0,0 +1,55 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+# The app reads its configuration at import: point it at a throwaway database and
+# upload directory, and keep background workers off so tests drive the job queue.
+_WORK_DIR = Path(tempfile.mkdtemp(prefix="program_pal_tests_"))
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_WORK_DIR / 'app.db'}",
+    UPLOAD_DIRECTORY=str(_WORK_DIR / "uploads"),
+    ANALYSIS_WORKERS="0",
+    OPS_TOKEN="test-ops-token",
+)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import database, migrations
+from src.main import app
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+def register(client: TestClient, password: str = "secret") -> dict:
+    """Registers a fresh user and returns its email, password and auth headers."""
+    email = f"{uuid.uuid4().hex[:12]}@example.com"
+    assert client.post("/auth/register", json={"email": email, "password": password}).status_code == 200
+    token = client.post("/auth/token", data={"username": email, "password": password}).json()["access_token"]
+    return {"email": email, "password": password, "headers": {"Authorization": f"Bearer {token}"}}
+
+@pytest.fixture
+def user(client):
+    return register(client)
+
+@pytest.fixture
+def other_user(client):
+    return register(client)
+
+@pytest.fixture
+def migrated_db_url(tmp_path):
+    """URL of a new SQLite database migrated to the latest version (separate from the app's)."""
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    engine = database.create_db_engine(url)
+    migrations.run_migrations(engine)
+    engine.dispose()
+    return url
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+from jose import jwt
+
+from src import models, security
+
+def _token_issued_at(email: str, issued_at: datetime) -> str:
+    payload = {"sub": email, "iat": int(issued_at.timestamp()), "exp": issued_at + timedelta(minutes=30)}
+    return jwt.encode(payload, security.SECRET_KEY, algorithm=security.ALGORITHM)
+
+def test_password_change_rejects_older_tokens(client, user):
+    old_token = _token_issued_at(user["email"], datetime.now(timezone.utc) - timedelta(minutes=5))
+    old_headers = {"Authorization": f"Bearer {old_token}"}
+    assert client.get("/auth/users/me", headers=old_headers).status_code == 200 # Now cached
+
+    response = client.put(
+        "/auth/users/me/password", headers=old_headers,
+        json={"current_password": user["password"], "new_password": "changed"},
+    )
+    assert response.status_code == 204
+
+    assert client.get("/auth/users/me", headers=old_headers).status_code == 401
+    assert client.post("/auth/token", data={"username": user["email"], "password": user["password"]}).status_code == 401
+    new_token = client.post("/auth/token", data={"username": user["email"], "password": "changed"}).json()["access_token"]
+    assert client.get("/auth/users/me", headers={"Authorization": f"Bearer {new_token}"}).status_code == 200
+
+def test_wrong_current_password_is_rejected(client, user):
+    response = client.put(
+        "/auth/users/me/password", headers=user["headers"],
+        json={"current_password": "not it", "new_password": "changed"},
+    )
+    assert response.status_code == 400
+    assert client.get("/auth/users/me", headers=user["headers"]).status_code == 200
+
+def test_cached_principal_is_checked_against_the_password_change(client, user):
+    # Another worker's cache entry, made before it saw the change: still refused
+    issued_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+    token = _token_issued_at(user["email"], issued_at)
+    principal = models.User(id=1, email=user["email"], password_changed_at=datetime.utcnow())
+    security.cache_principal(token, principal, issued_at=int(issued_at.timestamp()))
+    try:
+        assert client.get("/auth/users/me", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+    finally:
+        security.invalidate_principals(email=user["email"])
+
+def test_token_revoked_uses_whole_seconds():
+    changed_at = datetime(2026, 1, 1, 12, 0, 0, 700000)
+    principal = models.User(email="a@example.com", password_changed_at=changed_at)
+    changed = int(changed_at.replace(tzinfo=timezone.utc).timestamp())
+    assert security.token_revoked(principal, changed - 1)
+    assert not security.token_revoked(principal, changed) # Same second as the change
+    assert security.token_revoked(principal, None)
+    assert not security.token_revoked(models.User(email="b@example.com"), None)
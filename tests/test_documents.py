@@ -0,0 +1,49 @@
+import pytest
+
+CONTENT = b"".join(f"line {n}\n".encode() for n in range(1000))
+
+@pytest.fixture
+def document(client, user):
+    response = client.post(
+        "/documents/", headers=user["headers"], files={"file": ("notes.txt", CONTENT, "text/plain")}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+def _download(client, user, document, **headers):
+    return client.get(f"/documents/{document['id']}/download", headers={**user["headers"], **headers})
+
+def test_download_sends_validators(client, user, document):
+    response = _download(client, user, document)
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"].startswith('"') # Strong: content hash
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "last-modified" in response.headers
+
+def test_conditional_download_is_not_modified(client, user, document):
+    first = _download(client, user, document)
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    not_modified = _download(client, user, document, **{"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    assert _download(client, user, document, **{"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert _download(client, user, document, **{"If-Modified-Since": last_modified}).status_code == 304
+    # If-None-Match wins over If-Modified-Since
+    assert _download(client, user, document, **{"If-None-Match": '"other"', "If-Modified-Since": last_modified}).status_code == 200
+
+def test_range_download(client, user, document):
+    partial = _download(client, user, document, Range="bytes=10-19")
+    assert partial.status_code == 206
+    assert partial.content == CONTENT[10:20]
+    assert partial.headers["content-range"] == f"bytes 10-19/{len(CONTENT)}"
+
+    etag = partial.headers["etag"]
+    assert _download(client, user, document, Range="bytes=-5", **{"If-Range": etag}).content == CONTENT[-5:]
+    assert _download(client, user, document, Range="bytes=0-4", **{"If-Range": '"stale"'}).status_code == 200
+    assert _download(client, user, document, Range=f"bytes={len(CONTENT)}-").status_code == 416
+
+def test_download_is_private(client, document, other_user):
+    assert client.get(f"/documents/{document['id']}/download", headers=other_user["headers"]).status_code == 404
@@ -0,0 +1,58 @@
+import json
+
+from src.routers import emails
+
+def _message(n: int, **fields) -> dict:
+    return {"sender": "admissions@example.edu", "recipient": "me@example.com", "subject": f"Message {n}", **fields}
+
+def _ndjson(messages) -> bytes:
+    return "\n".join(json.dumps(message) for message in messages).encode()
+
+def test_cursor_pages_are_stable_under_inserts(client, user):
+    headers = user["headers"]
+    for n in range(10):
+        assert client.post("/emails/", json=_message(n), headers=headers).status_code == 201
+    everything = [email["id"] for email in client.get("/emails/", params={"limit": 100}, headers=headers).json()]
+
+    first = client.get("/emails/", params={"limit": 4}, headers=headers)
+    cursor = first.headers["X-Next-Cursor"]
+    for n in range(10, 13): # Newer mail arrives between page requests
+        client.post("/emails/", json=_message(n), headers=headers)
+    second = client.get("/emails/", params={"limit": 4, "cursor": cursor}, headers=headers)
+    third = client.get("/emails/", params={"limit": 4, "cursor": second.headers["X-Next-Cursor"]}, headers=headers)
+
+    pages = [email["id"] for page in (first, second, third) for email in page.json()]
+    assert pages == everything
+    assert "X-Next-Cursor" not in third.headers
+
+def test_invalid_cursor_is_a_client_error(client, user):
+    assert client.get("/emails/", params={"cursor": "not-a-cursor"}, headers=user["headers"]).status_code == 400
+
+def test_bulk_ingest_reports_errors_and_duplicates(client, user):
+    body = _ndjson(_message(n, message_id=f"{user['email']}-{n % 3}") for n in range(5)) + b"\n{broken\n\n"
+    response = client.post("/emails/bulk", params={"batch_size": 2}, content=body, headers=user["headers"])
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["received"], result["inserted"], result["skipped"], result["failed"]) == (5, 3, 2, 1)
+    assert [batch["batch"] for batch in result["batches"]] == [1, 2, 3]
+    assert result["batches"][-1]["errors"][0].startswith("line 6:")
+
+def test_bulk_ingest_joins_lines_split_across_chunks(client, user):
+    body = _ndjson(_message(n) for n in range(3))
+    chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+    response = client.post("/emails/bulk", content=iter(chunks), headers=user["headers"])
+    assert response.json()["inserted"] == 3
+
+def test_bulk_ingest_limits(client, user, monkeypatch):
+    headers = user["headers"]
+    monkeypatch.setattr(emails, "BULK_MAX_LINE_BYTES", 200)
+    long_line = json.dumps(_message(0, body_text="x" * 300)).encode()
+    assert client.post("/emails/bulk", content=long_line, headers=headers).status_code == 413
+    # Also without a newline in sight: the unterminated tail is bounded too
+    assert client.post("/emails/bulk", content=iter([long_line[:150], long_line[150:]]), headers=headers).status_code == 413
+
+    monkeypatch.setattr(emails, "BULK_MAX_LINE_BYTES", 10_000)
+    monkeypatch.setattr(emails, "BULK_MAX_BODY_BYTES", 1_000)
+    body = _ndjson(_message(n) for n in range(20))
+    assert client.post("/emails/bulk", content=body, headers=headers).status_code == 413 # Content-Length
+    assert client.post("/emails/bulk", content=iter([body[:600], body[600:]]), headers=headers).status_code == 413 # Streamed
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src import async_crud, database, models
+from src.services import job_service
+
+async def _open(url: str):
+    engine = database.create_async_db_engine(database.async_url_for(url))
+    return engine, async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def _add_owner(sessions, email: str):
+    """A user with one document. Returns (user id, document id)."""
+    async with sessions() as db:
+        db_user = models.User(email=email, hashed_password="x")
+        db.add(db_user)
+        await db.flush()
+        db_document = models.Document(filename="a.txt", file_path="/nonexistent/a.txt", owner_id=db_user.id)
+        db.add(db_document)
+        await db.commit()
+        return db_user.id, db_document.id
+
+async def _count_jobs(sessions, **filters) -> int:
+    async with sessions() as db:
+        query = select(func.count(models.AnalysisJob.id)).filter_by(**filters)
+        return await db.scalar(query)
+
+def test_concurrent_enqueues_respect_the_owner_limit(migrated_db_url):
+    async def scenario():
+        engine, sessions = await _open(migrated_db_url)
+        try:
+            owner_id, document_id = await _add_owner(sessions, "a@example.com")
+
+            async def enqueue(n: int):
+                async with sessions() as db:
+                    return await async_crud.create_analysis_job(db, owner_id, document_id, "qa", f"q{n}", queue_limit=100, owner_limit=3)
+
+            accepted = await asyncio.gather(*[enqueue(n) for n in range(12)])
+            assert sum(job is not None for job in accepted) == 3
+            assert await _count_jobs(sessions, owner_id=owner_id) == 3
+        finally:
+            await engine.dispose()
+    asyncio.run(scenario())
+
+def test_enqueue_respects_the_global_limit(migrated_db_url):
+    async def scenario():
+        engine, sessions = await _open(migrated_db_url)
+        try:
+            owners = [await _add_owner(sessions, f"{n}@example.com") for n in range(3)]
+            async with sessions() as db:
+                results = [
+                    await async_crud.create_analysis_job(db, owner_id, document_id, "summary", None, queue_limit=2, owner_limit=10)
+                    for owner_id, document_id in owners
+                ]
+            assert [job is not None for job in results] == [True, True, False]
+            # Finished jobs no longer count
+            async with sessions() as db:
+                await async_crud.finish_analysis_job(db, results[0].id, "completed")
+                owner_id, document_id = owners[2]
+                assert await async_crud.create_analysis_job(db, owner_id, document_id, "summary", None, queue_limit=2, owner_limit=10)
+        finally:
+            await engine.dispose()
+    asyncio.run(scenario())
+
+def test_claim_respects_the_per_owner_running_cap(migrated_db_url):
+    async def scenario():
+        engine, sessions = await _open(migrated_db_url)
+        try:
+            busy_owner, busy_document = await _add_owner(sessions, "busy@example.com")
+            other_owner, other_document = await _add_owner(sessions, "other@example.com")
+            async with sessions() as db:
+                for n in range(3):
+                    await async_crud.create_analysis_job(db, busy_owner, busy_document, "qa", f"q{n}", queue_limit=100, owner_limit=100)
+                await async_crud.create_analysis_job(db, other_owner, other_document, "qa", "q", queue_limit=100, owner_limit=100)
+
+            async def claim():
+                async with sessions() as db:
+                    return await async_crud.claim_analysis_job(db, lease_seconds=60, per_owner_limit=1)
+
+            claimed = await asyncio.gather(*[claim() for _ in range(4)])
+            assert sum(job_id is not None for job_id in claimed) == 2
+            assert await _count_jobs(sessions, owner_id=busy_owner, status="processing") == 1
+            assert await _count_jobs(sessions, owner_id=other_owner, status="processing") == 1
+        finally:
+            await engine.dispose()
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("waited, expected_status", [(timedelta(seconds=5), "pending"), (timedelta(hours=2), "failed")])
+def test_jobs_stop_waiting_for_extraction(migrated_db_url, monkeypatch, waited, expected_status):
+    async def scenario():
+        engine, sessions = await _open(migrated_db_url)
+        monkeypatch.setattr(database, "AsyncSessionLocal", sessions)
+        monkeypatch.setattr(job_service, "JOB_EXTRACTION_MAX_WAIT", 3600)
+
+        async def still_extracting(job_id):
+            return SimpleNamespace(status="processing")
+        monkeypatch.setattr(job_service, "_analyze", still_extracting)
+        try:
+            owner_id, document_id = await _add_owner(sessions, "wait@example.com")
+            async with sessions() as db:
+                job = await async_crud.create_analysis_job(db, owner_id, document_id, "summary", None, queue_limit=10, owner_limit=10)
+                await db.execute(update(models.AnalysisJob).values(created_at=datetime.utcnow() - waited))
+                await db.commit()
+                assert await async_crud.claim_analysis_job(db, lease_seconds=60, per_owner_limit=10) == job.id
+
+            await job_service._run_job(job.id)
+
+            async with sessions() as db:
+                db_job = await async_crud.get_analysis_job(db, job.id)
+            assert db_job.status == expected_status
+            assert db_job.attempts == (0 if expected_status == "pending" else 1) # Waiting refunds the attempt
+        finally:
+            await engine.dispose()
+    asyncio.run(scenario())
+
+def test_submit_maps_limits_to_http_errors(client, user, monkeypatch):
+    monkeypatch.setattr(job_service, "JOB_USER_QUEUE_LIMIT", 2)
+    headers = user["headers"]
+    document_id = client.post("/documents/", headers=headers, files={"file": ("a.txt", b"hello", "text/plain")}).json()["id"]
+    body = {"document_id": document_id, "analysis_type": "summary"}
+    statuses = [client.post("/ai/jobs", json=body, headers=headers).status_code for _ in range(3)]
+    assert statuses == [202, 202, 429]
+
+    monkeypatch.setattr(job_service, "JOB_QUEUE_LIMIT", 0)
+    response = client.post("/ai/jobs", json=body, headers=headers)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
@@ -0,0 +1,68 @@
+from sqlalchemy import create_engine, inspect, text
+
+from src import migrations, models
+
+FTS_SHADOW_SUFFIXES = ("_fts", "_data", "_idx", "_docsize", "_config", "_content")
+
+def _describe(engine) -> dict:
+    """Tables with their columns, indexes, unique constraints and primary keys (FTS tables aside)."""
+    inspector = inspect(engine)
+    schema = {}
+    for table in inspector.get_table_names():
+        if table.endswith(FTS_SHADOW_SUFFIXES) or table == "schema_version":
+            continue
+        schema[table] = (
+            sorted((column["name"], str(column["type"]), column["nullable"]) for column in inspector.get_columns(table)),
+            sorted((index["name"], tuple(index["column_names"]), bool(index["unique"])) for index in inspector.get_indexes(table)),
+            sorted(tuple(constraint["column_names"]) for constraint in inspector.get_unique_constraints(table)),
+            tuple(inspector.get_pk_constraint(table)["constrained_columns"]),
+        )
+    return schema
+
+def test_migrations_build_the_model_schema(tmp_path):
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    result = migrations.run_migrations(migrated)
+    assert result["to_version"] == migrations.LATEST_VERSION
+    assert [step["version"] for step in result["applied"]] == [version for version, *_ in migrations.MIGRATIONS]
+
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    models.Base.metadata.create_all(reference)
+    assert _describe(migrated) == _describe(reference)
+
+    assert migrations.run_migrations(migrated)["applied"] == [] # Up to date: nothing to do
+
+def test_pre_series_database_is_upgraded_with_its_data(tmp_path):
+    # What create_all made before versioning: the baseline tables, no schema_version
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    migrations.frozen_metadata.create_all(
+        engine, tables=[migrations.users_v1, migrations.programs_v1, migrations.documents_v1, migrations.email_messages_v1]
+    )
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email, hashed_password) VALUES (1, 'a@example.com', 'x')"))
+        conn.execute(text(
+            "INSERT INTO email_messages (owner_id, sender, recipient, subject, body_text, folder, is_read, thread_id) VALUES "
+            "(1, 's@example.edu', 'a@example.com', 'Offer letter', 'Welcome', 'inbox', 0, 't1'), "
+            "(1, 's@example.edu', 'a@example.com', 'Re: Offer letter', 'Thanks', 'inbox', 1, 't1')"
+        ))
+    assert migrations.current_version(engine) == 0
+
+    assert migrations.run_migrations(engine)["to_version"] == migrations.LATEST_VERSION
+
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    models.Base.metadata.create_all(reference)
+    assert _describe(engine) == _describe(reference)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT thread_key, message_count, unread_count FROM email_threads")).all() == [("t1", 2, 1)]
+        assert conn.execute(text("SELECT folder, total_count, unread_count FROM email_folder_counts")).all() == [("inbox", 2, 1)]
+        matches = conn.execute(text("SELECT rowid FROM email_messages_fts WHERE email_messages_fts MATCH 'offer'")).all()
+        assert len(matches) == 2
+        assert conn.execute(text("SELECT password_changed_at FROM users")).scalar() is None
+
+def test_interrupted_series_resumes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'partial.db'}")
+    migrations.run_migrations(engine)
+    with engine.begin() as conn: # As if the process died after migration 3 was recorded
+        conn.execute(text("DELETE FROM schema_version WHERE version > 3"))
+    result = migrations.run_migrations(engine)
+    assert result["from_version"] == 3
+    assert result["to_version"] == migrations.LATEST_VERSION